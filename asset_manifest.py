@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+asset_manifest.py - Content-hashed, precompressed copies of the data files and their manifest
+
+Every data file the browser loads is copied to data/dist/ under a name that
+contains a hash of its contents (data/viz3_data.json becomes
+data/dist/viz3_data.1a2b3c4d5e.json). Gzip and, when the brotli package is
+installed, brotli variants are written next to it (.gz, .br).
+
+data/manifest.json maps each logical path to its hashed copy:
+
+    {"version": 1,
+     "assets": {"data/viz3_data.json": {"path": "data/dist/viz3_data.1a2b3c4d5e.json",
+                                         "hash": "1a2b3c4d5e", "size": 12345,
+                                         "preload": true,
+                                         "encodings": {"gzip": {"path": ..., "size": ...},
+                                                       "br": {"path": ..., "size": ...}}}}}
+
+js/main.js reads the manifest at page start, fetches every preload asset in
+parallel and resolves the other paths (fallbacks) through it when they are
+requested. build.py refreshes the manifest after a build.
+
+Hosting: GitHub Pages deploys the site from the tracked files, so
+data/manifest.json and data/dist/ are committed along with the data files
+(build.py refreshes them; --check tells whether they are current). Pages
+serves every file with "Cache-Control: max-age=600", which cannot be changed,
+and compresses responses itself. There the manifest gives the parallel
+preload, and a deploy never mixes old and new data files, since the manifest
+is fetched with no-cache and a hashed path never changes content. The .gz and
+.br variants and long-lived caching only pay off on a host that sets headers
+per path and serves precompressed files, e.g. nginx with
+gzip_static/brotli_static and "Cache-Control: max-age=31536000, immutable"
+on data/dist/.
+
+Usage:
+    python asset_manifest.py              # write data/dist/ and data/manifest.json
+    python asset_manifest.py --check      # exit 1 if the manifest is out of date
+
+    from asset_manifest import write_manifest
+    write_manifest()
+"""
+
+import argparse
+import glob
+import gzip
+import importlib.util
+import json
+import os
+import sys
+
+from excel_cache import file_digest
+from fiscal_data import write_json
+from lazy_imports import lazy_import
+
+brotli = lazy_import('brotli')
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = 'data'
+DIST_DIR = 'data/dist'
+MANIFEST_FILE = 'data/manifest.json'
+MANIFEST_VERSION = 1
+
+# Checked without importing brotli; gzip variants are always written
+HAVE_BROTLI = importlib.util.find_spec('brotli') is not None
+
+HASH_LENGTH = 10
+
+# Data files the front end loads (glob patterns relative to ROOT), and
+# whether it needs them at page start
+ASSETS = {
+    'data/viz1_data.json': True,
+    'data/viz2/index.json': True,
+    'data/viz2/charts.json': True,
+    'data/viz2_data.bin': False,
+    'data/viz2_data.json': False,
+    'data/viz3_data.json': True,
+    'data/redistribution_data.json': True
+}
+
+
+def hashed_name(path, digest):
+    """
+    Return the dist path of a data file: its path below data/ with the hash before the extension.
+    """
+    stem, extension = os.path.splitext(os.path.relpath(path, DATA_DIR))
+    return f"{DIST_DIR}/{stem}.{digest[:HASH_LENGTH]}{extension}".replace(os.sep, '/')
+
+
+def compress(data, encoding):
+    """
+    Compress data for an encoding; gzip output does not depend on the time it was written.
+    """
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    return brotli.compress(data, quality=11)
+
+
+def _write_once(path, data):
+    # A file with a content hash in its name never needs rewriting
+    if os.path.exists(path):
+        return False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return True
+
+
+def collect_assets(root=ROOT):
+    """
+    Return the existing data files to publish as a dictionary of path -> preload flag.
+    """
+    found = {}
+    for pattern, preload in ASSETS.items():
+        for path in sorted(glob.glob(os.path.join(root, pattern))):
+            found.setdefault(os.path.relpath(path, root).replace(os.sep, '/'), preload)
+    return found
+
+
+def build_manifest(root=ROOT, write=True):
+    """
+    Hash every data file and, with write=True, write its hashed and compressed copies.
+
+    Returns:
+    - (manifest dictionary, number of files written)
+    """
+    encodings = ['gzip'] + (['br'] if HAVE_BROTLI else [])
+    assets = {}
+    written = 0
+    for path, preload in collect_assets(root).items():
+        digest = file_digest(os.path.join(root, path))
+        target = hashed_name(path, digest)
+        entry = {'path': target, 'hash': digest[:HASH_LENGTH], 'size': os.path.getsize(os.path.join(root, path)),
+                 'preload': preload, 'encodings': {}}
+        if write:
+            with open(os.path.join(root, path), 'rb') as f:
+                data = f.read()
+            written += _write_once(os.path.join(root, target), data)
+        for encoding in encodings:
+            variant = f"{target}.{'gz' if encoding == 'gzip' else encoding}"
+            if write:
+                variant_path = os.path.join(root, variant)
+                written += _write_once(variant_path, compress(data, encoding))
+            size = os.path.getsize(os.path.join(root, variant)) if os.path.exists(os.path.join(root, variant)) else None
+            entry['encodings'][encoding] = {'path': variant, 'size': size}
+        assets[path] = entry
+    return {'version': MANIFEST_VERSION, 'assets': assets}, written
+
+
+def remove_stale(manifest, root=ROOT):
+    """
+    Delete the files in data/dist/ that the manifest no longer refers to.
+
+    Returns:
+    - Number of files removed
+    """
+    keep = set()
+    for entry in manifest['assets'].values():
+        keep.add(entry['path'])
+        keep.update(variant['path'] for variant in entry['encodings'].values())
+    removed = 0
+    for path in glob.glob(os.path.join(root, DIST_DIR, '**', '*'), recursive=True):
+        if os.path.isfile(path) and os.path.relpath(path, root).replace(os.sep, '/') not in keep:
+            os.remove(path)
+            removed += 1
+    return removed
+
+
+def load_manifest(root=ROOT):
+    try:
+        with open(os.path.join(root, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def manifest_current(root=ROOT):
+    """
+    Whether the manifest exists and matches the data files and their hashed copies.
+    """
+    manifest, _ = build_manifest(root, write=False)
+    if load_manifest(root) != manifest:
+        return False
+    return all(os.path.exists(os.path.join(root, entry['path'])) for entry in manifest['assets'].values())
+
+
+def write_manifest(root=ROOT):
+    """
+    Write the hashed and compressed copies of every data file, the manifest,
+    and remove copies no longer referenced.
+
+    Returns:
+    - The manifest dictionary
+    """
+    manifest, written = build_manifest(root)
+    write_json(manifest, os.path.join(root, MANIFEST_FILE))
+    removed = remove_stale(manifest, root)
+    print(f"Manifest of {len(manifest['assets'])} data files written to {MANIFEST_FILE} "
+          f"({written} files written, {removed} removed from {DIST_DIR})")
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write content-hashed, precompressed copies of the data files")
+    parser.add_argument('--check', action='store_true', help="Only check whether the manifest is up to date")
+    args = parser.parse_args()
+
+    if args.check:
+        current = manifest_current()
+        print(f"{MANIFEST_FILE}: {'up to date' if current else 'stale'}")
+        sys.exit(0 if current else 1)
+    if not HAVE_BROTLI:
+        print("brotli is not installed; writing gzip variants only")
+    write_manifest()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+benchmark.py - Benchmarks of the data processors on synthetic inputs
+
+Times the processing steps of viz2, viz3 and viz4 on inputs from
+synthetic_data.py at configurable multiples of the real row counts. Each
+processor and scale runs in a fresh worker process. The inputs are generated
+there once, then every step runs --repeat times. The minimum wall time and
+the peak resident set size during the step are recorded. Results
+are appended to a JSON history together with the git commit, so runs of
+different commits can be compared. Each run is also printed next to the
+previous recorded run of the same benchmark and scale.
+
+Peak RSS is the process high-water mark, reset before the step on Linux
+(/proc/self/clear_refs); elsewhere it is the peak since the worker started,
+inputs included.
+
+Usage:
+    python benchmark.py                            # every benchmark at scales 1 and 10
+    python benchmark.py --scales 10 100 1000 --filter viz3
+    python benchmark.py --list
+"""
+
+import argparse
+import gc
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent import futures
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+
+import viz2_data_processor as viz2
+import viz3_data_processing as viz3
+import viz4_data_processing as viz4
+from fiscal_data import write_json
+from synthetic_data import synthetic_scf, synthetic_shares, synthetic_swiid, synthetic_table1data
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+HISTORY_FILE = os.path.join(ROOT, 'benchmarks', 'history.json')
+
+DEFAULT_SCALES = [1, 10]
+DEFAULT_REPEAT = 3
+
+
+def _viz2(scale, seed, workdir):
+    df_shares = synthetic_shares(scale, seed)
+    pce_data = synthetic_table1data(scale, seed)
+    outputs = {name: os.path.join(workdir, name)
+               for name in ('output_file', 'packed_output_file', 'hash_file', 'chart_dir', 'groupings_output_file')}
+    steps = {'process_excel_to_json': lambda: viz2.process_sheets(df_shares, pce_data, **outputs)}
+    return len(df_shares) + len(pce_data), steps
+
+
+def _viz3(scale, seed, workdir):
+    df = synthetic_scf(scale, seed)
+    viz3.assign_quintiles(df)
+    stats = viz3.compute_quintile_statistics(df)
+    steps = {
+        'assign_quintiles': lambda: viz3.assign_quintiles(df),
+        'compute_quintile_statistics': lambda: viz3.compute_quintile_statistics(df),
+        'calculate_wealth_mobility': lambda: viz3.calculate_wealth_mobility(stats['transitions']),
+        'calculate_empirical_mobility': lambda: viz3.calculate_empirical_mobility(stats['mobility'], [2, 5]),
+        'calculate_stock_ownership': lambda: viz3.calculate_stock_ownership(stats['wealth'], stats['income']),
+        'calculate_investment_returns': lambda: viz3.calculate_investment_returns(df),
+        'calculate_wealth_barriers': lambda: viz3.calculate_wealth_barriers(stats['wealth']),
+        'calculate_inequality': lambda: viz3.calculate_inequality(df)
+    }
+    return len(df), steps
+
+
+def _viz4(scale, seed, workdir):
+    df = synthetic_swiid(scale, seed)
+    steps = {
+        'compute_redistribution_stats': lambda: viz4.compute_redistribution_stats(df),
+        'fit_gini_models': lambda: viz4.fit_gini_models(df)
+    }
+    return len(df), steps
+
+
+# Processor -> setup(scale, seed, workdir) returning (input rows, {step: callable})
+SUITES = {'viz2': _viz2, 'viz3': _viz3, 'viz4': _viz4}
+
+# Every benchmark name, as processor.step
+BENCHMARKS = [
+    'viz2.process_excel_to_json',
+    'viz3.assign_quintiles',
+    'viz3.compute_quintile_statistics',
+    'viz3.calculate_wealth_mobility',
+    'viz3.calculate_empirical_mobility',
+    'viz3.calculate_stock_ownership',
+    'viz3.calculate_investment_returns',
+    'viz3.calculate_wealth_barriers',
+    'viz3.calculate_inequality',
+    'viz4.compute_redistribution_stats',
+    'viz4.fit_gini_models'
+]
+
+
+def reset_peak_rss():
+    """
+    Reset the peak RSS of this process; returns False where that is not supported.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    """
+    Return the peak resident set size of this process in MiB.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def run_suite(suite, steps, scale, seed=0, repeat=DEFAULT_REPEAT):
+    """
+    Generate a processor's inputs once and time the requested steps on them.
+
+    Runs in a worker process, so the RSS of one suite does not leak into the next.
+
+    Returns:
+    - List of result dictionaries, one per step
+    """
+    with tempfile.TemporaryDirectory() as workdir:
+        rows, available = SUITES[suite](scale, seed, workdir)
+        results = []
+        for step in steps:
+            function = available[step]
+            times = []
+            gc.collect()
+            reset_peak_rss()
+            for _ in range(repeat):
+                start = time.perf_counter()
+                # Processors report progress; keep it out of the benchmark output
+                with redirect_stdout(io.StringIO()):
+                    function()
+                times.append(time.perf_counter() - start)
+            results.append({
+                'benchmark': f"{suite}.{step}",
+                'scale': scale,
+                'rows': rows,
+                'wall_time': min(times),
+                'wall_times': times,
+                'peak_rss_mb': round(peak_rss_mb(), 1)
+            })
+        return results
+
+
+def git_revision(root=ROOT):
+    """
+    Return (commit, dirty) of the working tree, or (None, None) outside git.
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=root, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=root,
+                                capture_output=True, text=True, check=True).stdout
+        return commit, bool(status.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def load_history(history_file=HISTORY_FILE):
+    try:
+        with open(history_file) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+
+def previous_result(history, benchmark, scale, commit=None):
+    """
+    Return the latest recorded result of a benchmark at a scale, optionally
+    restricted to one commit, or None.
+    """
+    for run in reversed(history):
+        if commit is not None and run.get('commit') != commit:
+            continue
+        for result in run['results']:
+            if result['benchmark'] == benchmark and result['scale'] == scale:
+                return dict(result, commit=run.get('commit'))
+    return None
+
+
+def run_benchmarks(benchmarks, scales, repeat=DEFAULT_REPEAT, seed=0):
+    """
+    Run the benchmarks at every scale, each processor and scale in a fresh process.
+
+    Returns:
+    - List of result dictionaries
+    """
+    by_suite = {}
+    for name in benchmarks:
+        suite, step = name.split('.', 1)
+        by_suite.setdefault(suite, []).append(step)
+
+    results = []
+    for scale in scales:
+        for suite, steps in by_suite.items():
+            print(f"Running {suite} at scale {scale}x...", flush=True)
+            with futures.ProcessPoolExecutor(max_workers=1) as pool:
+                results.extend(pool.submit(run_suite, suite, steps, scale, seed, repeat).result())
+    return results
+
+
+def print_results(results, history, baseline=None):
+    """
+    Print each result next to the previous recorded run (or the baseline commit).
+    """
+    print(f"{'benchmark':<38} {'scale':>6} {'rows':>11} {'time (s)':>10} {'RSS (MiB)':>10}  change")
+    for result in results:
+        previous = previous_result(history, result['benchmark'], result['scale'], baseline)
+        change = ''
+        if previous is not None and previous['wall_time'] > 0:
+            ratio = result['wall_time'] / previous['wall_time'] - 1
+            change = f"{ratio:+.1%} vs {previous.get('commit') or 'previous run'}"
+        print(f"{result['benchmark']:<38} {result['scale']:>6} {result['rows']:>11,} "
+              f"{result['wall_time']:>10.4f} {result['peak_rss_mb']:>10.1f}  {change}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the data processors on synthetic inputs")
+    parser.add_argument('--scales', type=int, nargs='+', default=DEFAULT_SCALES,
+                        help="Multiples of the real row counts, e.g. 10 100 1000")
+    parser.add_argument('--filter', nargs='+', default=[],
+                        help="Only run benchmarks whose name contains one of these strings")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help="Runs per benchmark (minimum is kept)")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the synthetic inputs")
+    parser.add_argument('--history', default=HISTORY_FILE, help="JSON history the results are appended to")
+    parser.add_argument('--baseline', help="Compare with the results of this commit instead of the previous run")
+    parser.add_argument('--no-record', action='store_true', help="Do not append the results to the history")
+    parser.add_argument('--list', action='store_true', help="List the benchmarks and exit")
+    args = parser.parse_args()
+
+    benchmarks = [name for name in BENCHMARKS if not args.filter or any(f in name for f in args.filter)]
+    if args.list:
+        print("\n".join(benchmarks))
+        return
+    if not benchmarks:
+        parser.error(f"no benchmark matches {' '.join(args.filter)}")
+
+    results = run_benchmarks(benchmarks, args.scales, args.repeat, args.seed)
+    history = load_history(args.history)
+    print_results(results, history, args.baseline)
+
+    if not args.no_record:
+        commit, dirty = git_revision()
+        history.append({
+            'commit': commit,
+            'dirty': dirty,
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'repeat': args.repeat,
+            'seed': args.seed,
+            'results': results
+        })
+        write_json(history, args.history)
+        print(f"Results appended to {args.history}")
+
+
+if __name__ == "__main__":
+    main()
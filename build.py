@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+build.py - Incremental build of the visualization data products
+
+Every product is produced by one processor script from a fixed set of source
+files. A product is rebuilt only when it is stale: when the fingerprint of
+its source files and code (the script plus every local module it imports)
+differs from the one recorded at its last successful build, or when one of
+its outputs is missing or was changed since. Stale products are rebuilt in
+parallel, each in its own Python process. Afterwards the hashed copies of
+the data files and data/manifest.json are refreshed (see asset_manifest.py)
+if any output changed.
+
+The script is called from cron jobs and pre-commit hooks, where nearly every
+run finds nothing to do, so the status check stays cheap: nothing heavy is
+imported, and each module's import list is cached by its digest so that
+unchanged code is not parsed again.
+
+Usage:
+    python build.py                 # rebuild every stale product
+    python build.py viz2 --force    # rebuild viz2 even if it is up to date
+    python build.py --status        # show what would be rebuilt
+"""
+
+import argparse
+import ast
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent import futures
+
+from asset_manifest import MANIFEST_FILE, manifest_current, write_manifest
+from excel_cache import CACHE_DIR, file_digest
+from fiscal_data import write_json
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STATE_FILE = os.path.join(CACHE_DIR, 'build-state.json')
+# Imports of each local module, keyed by the module's digest
+IMPORTS_FILE = os.path.join(CACHE_DIR, 'build-imports.json')
+
+# Product name -> processor script (and its arguments), source files and
+# outputs (relative to ROOT)
+PRODUCTS = {
+    'viz2': {
+        'script': 'viz2_data_processor.py',
+        'args': ['--incremental'],
+        'inputs': ['data/full_dataset.xlsx', 'data/distributional-pce-2000-2022.xlsx'],
+        'outputs': ['data/viz2_data.json', 'data/viz2_data.bin', 'data/viz2_groupings.json',
+                    'data/viz2/index.json', 'data/viz2/charts.json']
+    },
+    'viz3': {
+        'script': 'viz3_data_processing.py',
+        'inputs': ['data/SCFP2022.csv'],
+        'outputs': ['data/viz3_data.json']
+    },
+    'viz4': {
+        'script': 'viz4_data_processing.py',
+        'inputs': ['swiid9_8_summary.csv'],
+        'outputs': ['data/redistribution_data.json', 'data/viz4_data.json']
+    }
+}
+
+
+def module_imports(path, digest, cache, root=ROOT):
+    """
+    Return the top-level names of the modules a file imports.
+
+    The file is parsed only when its digest differs from the one in cache;
+    cache (path -> {'digest', 'imports'}) is updated in place.
+    """
+    entry = cache.get(path)
+    if entry is not None and entry['digest'] == digest:
+        return entry['imports']
+
+    with open(os.path.join(root, path)) as f:
+        tree = ast.parse(f.read(), filename=path)
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split('.')[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            names.add(node.module.split('.')[0])
+    cache[path] = {'digest': digest, 'imports': sorted(names)}
+    return cache[path]['imports']
+
+
+def local_modules(script, root=ROOT, cache=None):
+    """
+    Return the script and every module of this repository it imports, recursively.
+
+    Returns:
+    - Dictionary of file -> digest
+    """
+    cache = {} if cache is None else cache
+    found = {}
+    pending = [script]
+    while pending:
+        path = pending.pop()
+        if path in found:
+            continue
+        found[path] = file_digest(os.path.join(root, path))
+        for name in module_imports(path, found[path], cache, root):
+            module = name + '.py'
+            if os.path.exists(os.path.join(root, module)):
+                pending.append(module)
+    return dict(sorted(found.items()))
+
+
+def fingerprint(product, root=ROOT, cache=None):
+    """
+    Hash the contents of a product's source files and code.
+
+    Returns:
+    - (fingerprint, dictionary of file -> digest)
+    """
+    spec = PRODUCTS[product]
+    digests = {path: file_digest(os.path.join(root, path)) for path in spec['inputs']}
+    digests.update(local_modules(spec['script'], root, cache))
+    combined = hashlib.sha256(json.dumps(digests, sort_keys=True).encode('utf-8')).hexdigest()
+    return combined, digests
+
+
+def output_digests(product, root=ROOT):
+    """
+    Return the digest of every output of a product, None for missing outputs.
+    """
+    return {
+        path: file_digest(os.path.join(root, path)) if os.path.exists(os.path.join(root, path)) else None
+        for path in PRODUCTS[product]['outputs']
+    }
+
+
+def load_state(state_file=STATE_FILE):
+    try:
+        with open(state_file) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state, state_file=STATE_FILE):
+    write_json(state, state_file)
+
+
+def save_imports(imports, loaded):
+    """
+    Save the import cache if any module was parsed since it was loaded.
+    """
+    if imports != loaded:
+        save_state(imports, IMPORTS_FILE)
+
+
+def product_status(product, state, root=ROOT, cache=None):
+    """
+    Decide whether a product needs a rebuild.
+
+    Returns:
+    - (status, reason, fingerprint) where status is 'up to date', 'stale' or
+      'unavailable' (script or source files missing)
+    """
+    spec = PRODUCTS[product]
+    missing = [path for path in [spec['script']] + spec['inputs'] if not os.path.exists(os.path.join(root, path))]
+    if missing:
+        return 'unavailable', f"missing {', '.join(missing)}", None
+
+    current, digests = fingerprint(product, root, cache)
+    recorded = state.get(product)
+    if recorded is None:
+        return 'stale', 'never built', current
+    if recorded['fingerprint'] != current:
+        changed = [path for path, digest in digests.items() if recorded['sources'].get(path) != digest]
+        return 'stale', f"changed {', '.join(changed)}", current
+    if output_digests(product, root) != recorded['outputs']:
+        return 'stale', 'outputs missing or modified', current
+    return 'up to date', '', current
+
+
+def run_product(product, root=ROOT):
+    """
+    Run a product's processor script in its own Python process.
+
+    Returns:
+    - (return code, elapsed seconds, combined output)
+    """
+    start = time.perf_counter()
+    spec = PRODUCTS[product]
+    result = subprocess.run([sys.executable, spec['script']] + spec.get('args', []), cwd=root,
+                            capture_output=True, text=True)
+    return result.returncode, time.perf_counter() - start, result.stdout + result.stderr
+
+
+def build(products=None, force=False, jobs=None, root=ROOT, state_file=STATE_FILE):
+    """
+    Rebuild the stale products, independent products in parallel.
+
+    Returns:
+    - Dictionary of product -> 'up to date', 'built', 'failed' or 'unavailable'
+    """
+    products = products or list(PRODUCTS)
+    state = load_state(state_file)
+    imports = load_state(IMPORTS_FILE)
+    loaded = dict(imports)
+    results = {}
+    to_build = []
+
+    for product in products:
+        status, reason, _ = product_status(product, state, root, imports)
+        if status == 'unavailable' or (status == 'up to date' and not force):
+            print(f"{product}: {status}" + (f" ({reason})" if reason else ""))
+            results[product] = status
+        else:
+            print(f"{product}: rebuilding ({reason or 'forced'})")
+            to_build.append(product)
+
+    if not to_build:
+        save_imports(imports, loaded)
+        refresh_manifest(root)
+        return results
+
+    # Fingerprint before running, so sources edited during the run stay stale
+    fingerprints = {product: fingerprint(product, root, imports) for product in to_build}
+    save_imports(imports, loaded)
+    with futures.ThreadPoolExecutor(max_workers=jobs or len(to_build)) as pool:
+        runs = dict(zip(to_build, pool.map(lambda product: run_product(product, root), to_build)))
+
+    for product, (returncode, elapsed, output) in runs.items():
+        outputs = output_digests(product, root)
+        if returncode != 0 or None in outputs.values():
+            print(f"{product}: failed after {elapsed:.1f}s\n{output}")
+            results[product] = 'failed'
+            continue
+        current, digests = fingerprints[product]
+        state[product] = {'fingerprint': current, 'sources': digests, 'outputs': outputs}
+        print(f"{product}: built in {elapsed:.1f}s")
+        results[product] = 'built'
+
+    save_state(state, state_file)
+    refresh_manifest(root)
+    return results
+
+
+def refresh_manifest(root=ROOT):
+    """
+    Rewrite the asset manifest and hashed data files unless they match the current outputs.
+    """
+    if not manifest_current(root):
+        write_manifest(root)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the stale visualization data products")
+    parser.add_argument('products', nargs='*', metavar='product',
+                        help=f"Products to build (default: all of {', '.join(PRODUCTS)})")
+    parser.add_argument('--force', action='store_true', help="Rebuild even if up to date")
+    parser.add_argument('--status', action='store_true', help="Only report which products are stale")
+    parser.add_argument('--jobs', type=int, help="Maximum number of products built at once")
+    args = parser.parse_args()
+    unknown = [product for product in args.products if product not in PRODUCTS]
+    if unknown:
+        parser.error(f"unknown product(s): {', '.join(unknown)}")
+
+    if args.status:
+        state = load_state()
+        imports = load_state(IMPORTS_FILE)
+        loaded = dict(imports)
+        for product in args.products or PRODUCTS:
+            status, reason, _ = product_status(product, state, cache=imports)
+            print(f"{product}: {status}" + (f" ({reason})" if reason else ""))
+        print(f"{MANIFEST_FILE}: {'up to date' if manifest_current() else 'stale'}")
+        save_imports(imports, loaded)
+        return
+
+    results = build(args.products, args.force, args.jobs)
+    if 'failed' in results.values():
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+"""
+charles_189.py - Income, expenditure and consumption ratio charts by DPI quantile
+
+Builds two tables from the BEA distributional workbooks:
+
+- df_final_combined: absolute Disposable Personal Income, Personal Consumption
+  Expenditures and Personal Saving per year and quintile (plus Top 1%, Top 5%
+  and the total), from the "shares of NIPA totals" sheet
+- df_final_result: expenditure-to-disposable-income ratios per year and
+  quintile, from the "table1data" sheet of the distributional PCE workbook
+
+Shares are scaled to dollar amounts for every series at once by joining each
+row to its (year, series) total. build_cubes arranges both tables as dense
+year x group x series cubes, which the chart renderer reads each year from.
+
+Usage:
+    python charles_189.py                                  # one year, interactive
+    python charles_189.py --all --formats png svg          # every year, to files
+
+    from charles_189 import build_cubes, load_tables
+    df_final_combined, df_final_result = load_tables()
+    income, ratios = build_cubes(df_final_combined, df_final_result)
+    income.value(year=2019, group="Top 1%", series="Personal Saving")
+"""
+
+import argparse
+import os
+from concurrent import futures
+from pathlib import Path
+
+from data_cube import DataCube
+from fiscal_data import (CATEGORIES, DECILE_COLUMNS, INPUT_FILE, PCE_FILE, QUANTILE_MAPPING, RANKING, SERIES_TYPES,
+                         TOTAL_METRIC, load_pce_table, load_shares)
+from lazy_imports import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+plt = lazy_import('matplotlib.pyplot')
+
+# Configure paths
+OUTPUT_DIR = 'images/charts'
+
+CHART_FORMATS = ['png']
+
+FIRST_YEAR = 2004
+LAST_YEAR = 2022
+
+TOP_METRICS = ["Top 1%", "Top 5%", TOTAL_METRIC]
+METRICS = list(QUANTILE_MAPPING) + TOP_METRICS
+
+METRIC_COLUMN = "Quantile or Summary Metric"
+
+# Expenditure rows of table1data and the ratio built from each
+EXPENDITURE_RATIOS = {
+    'Personal Consumption Expenditures': 'Consumption to Disposable Income Ratio',
+    'Durable goods': 'Durable Goods Ratio',
+    'Nondurable goods': 'Nondurable Goods Ratio',
+    'Household consumption expenditures (for services)': 'Household Consumption Ratio',
+    'Final consumption expenditures of nonprofit institutions serving households (NPISHs) (132)': 'Nonprofit Consumption Ratio'
+}
+
+SERIES_COLORS = {
+    "Disposable Personal Income": "blue",
+    "Personal Consumption Expenditures": "orange",
+    "Personal Saving": "green"
+}
+
+RATIO_COLORS = {
+    "Household Consumption Ratio": "#1f77b4",
+    "Nondurable Goods Ratio": "#FFD700",
+    "Durable Goods Ratio": "#ff7f0e",
+    "Nonprofit Consumption Ratio": "#2ca02c"
+}
+
+# Footnotes listing the components of each stacked ratio: (x, y, text)
+RATIO_NOTES = [
+    (0.2, 0.05,
+     "**Durable Goods Ratio**\n"
+     "• Motor vehicles and parts\n"
+     "• Furnishings & durable household equipment\n"
+     "• Recreational goods & vehicles\n"
+     "• Other durable goods"),
+    (0.45, 0.05,
+     "**Nondurable Goods Ratio**\n"
+     "• Food & beverages (off-premises)\n"
+     "• Clothing and footwear\n"
+     "• Gasoline & other energy goods\n"
+     "• Other nondurable goods"),
+    (0.65, 0.01,
+     "**Household Consumption Ratio**\n"
+     "• Housing and utilities\n"
+     "• Health care\n"
+     "• Transportation services\n"
+     "• Recreation services\n"
+     "• Food services & accommodations\n"
+     "• Financial services & insurance\n"
+     "• Other services")
+]
+
+
+def scale_shares(df_shares):
+    """
+    Convert the income, consumption and saving shares to dollar amounts.
+
+    Every share row is multiplied by the total of its (year, series) through a
+    single index lookup; total rows are kept as they are.
+
+    Returns:
+    - DataFrame with Year, Quantile or Summary Metric, Series and Value columns
+    """
+    df = df_shares.loc[
+        (df_shares["Ranking"] == RANKING) &
+        (df_shares["Series"].isin(SERIES_TYPES)) &
+        (df_shares[METRIC_COLUMN].isin(METRICS)),
+        ["Year", METRIC_COLUMN, "Series", "Value"]
+    ]
+
+    is_total = df[METRIC_COLUMN] == TOTAL_METRIC
+    totals = df[is_total].set_index(["Year", "Series"])["Value"]
+    keys = pd.MultiIndex.from_frame(df[["Year", "Series"]])
+    row_totals = totals.reindex(keys).to_numpy()
+
+    df = df.assign(Value=np.where(is_total, df["Value"], df["Value"].to_numpy() * row_totals))
+    return df.sort_values(by=["Year", METRIC_COLUMN, "Series"]).reset_index(drop=True)
+
+
+def combine_quintiles(df_combined):
+    """
+    Sum decile amounts into quintiles and keep the Top 1%, Top 5% and total rows.
+    """
+    deciles = df_combined[df_combined[METRIC_COLUMN].isin(QUANTILE_MAPPING.keys())]
+    quintiles = (
+        deciles.assign(**{METRIC_COLUMN: deciles[METRIC_COLUMN].map(QUANTILE_MAPPING)})
+        .groupby(["Year", METRIC_COLUMN, "Series"], as_index=False)["Value"].sum()
+    )
+    top = df_combined[df_combined[METRIC_COLUMN].isin(TOP_METRICS)]
+
+    df_final_combined = pd.concat([quintiles, top], ignore_index=True)
+    return df_final_combined.sort_values(by=["Year", METRIC_COLUMN, "Series"]).reset_index(drop=True)
+
+
+def pce_distribution(df_table1data, first_year=FIRST_YEAR, last_year=LAST_YEAR):
+    """
+    Compute the dollar amount of every expenditure row per quintile.
+
+    Returns:
+    - DataFrame with Year, Expenditure and one column per quintile
+    """
+    df = df_table1data[(df_table1data["year"] >= first_year) & (df_table1data["year"] <= last_year)]
+    totals = df["Total"].to_numpy(dtype=float)
+
+    result = pd.DataFrame({"Year": df["year"].to_numpy(), "Expenditure": df["pce_title"].to_numpy()})
+    for category, columns in DECILE_COLUMNS.items():
+        result[category] = df[columns].sum(axis=1, min_count=len(columns)).to_numpy() * totals
+    return result
+
+
+def consumption_ratios(df_final_combined, df_final_distribution):
+    """
+    Divide each expenditure by disposable income per year and quintile.
+
+    Returns:
+    - DataFrame with Year, Quantile or Summary Metric and one column per ratio
+    """
+    income = df_final_combined.loc[
+        df_final_combined["Series"] == "Disposable Personal Income",
+        ["Year", METRIC_COLUMN, "Value"]
+    ].rename(columns={"Value": "Disposable_Income"})
+
+    melted = df_final_distribution.melt(id_vars=["Year", "Expenditure"],
+                                        var_name=METRIC_COLUMN, value_name="Value")
+    melted["Expenditure"] = melted["Expenditure"].str.strip()
+    expenditures = melted.pivot_table(index=["Year", METRIC_COLUMN], columns="Expenditure",
+                                      values="Value").reset_index()
+
+    merged = pd.merge(income, expenditures, on=["Year", METRIC_COLUMN])
+    disposable_income = pd.to_numeric(merged["Disposable_Income"], errors="coerce")
+    for expenditure, ratio in EXPENDITURE_RATIOS.items():
+        merged[ratio] = pd.to_numeric(merged[expenditure], errors="coerce") / disposable_income * 100
+
+    return merged[["Year", METRIC_COLUMN] + list(EXPENDITURE_RATIOS.values())]
+
+
+def build_tables(df_shares, df_table1data):
+    """
+    Build df_final_combined and df_final_result from the two parsed sheets.
+    """
+    df_final_combined = combine_quintiles(scale_shares(df_shares))
+    df_final_result = consumption_ratios(df_final_combined, pce_distribution(df_table1data))
+    return df_final_combined, df_final_result
+
+
+def build_cubes(df_final_combined, df_final_result, groups=None):
+    """
+    Arrange both tables as dense cubes for lookups by year, group and series.
+
+    Parameters:
+    - df_final_combined, df_final_result: Tables from build_tables
+    - groups: Quantile groups to keep, in order (default: quintiles, Top 1%, Top 5% and the total)
+
+    Returns:
+    - DataCube (year x group x series) of dollar amounts
+    - DataCube (year x group x ratio) of consumption ratios, NaN where missing
+    """
+    groups = groups or CATEGORIES + TOP_METRICS
+    income = DataCube.from_frame(df_final_combined, {"year": "Year", "group": METRIC_COLUMN, "series": "Series"},
+                                 "Value", labels={"group": groups, "series": SERIES_TYPES})
+
+    ratio_types = list(EXPENDITURE_RATIOS.values())
+    ratios = df_final_result.melt(id_vars=["Year", METRIC_COLUMN], value_vars=ratio_types,
+                                  var_name="Ratio", value_name="Value")
+    ratios = DataCube.from_frame(ratios, {"year": "Year", "group": METRIC_COLUMN, "ratio": "Ratio"}, "Value",
+                                 labels={"year": income.labels("year"), "group": groups, "ratio": ratio_types},
+                                 fill=np.nan)
+    return income, ratios
+
+
+def load_tables(input_file=INPUT_FILE, pce_file=PCE_FILE):
+    """
+    Load both workbooks (through the Excel cache) and build the chart tables.
+    """
+    df_shares = load_shares(input_file)
+    df_table1data = load_pce_table(pce_file)
+    return build_tables(df_shares, df_table1data)
+
+
+def prompt_year():
+    """
+    Ask for a year until a valid one is entered.
+    """
+    while True:
+        try:
+            year = int(input(f"Please enter a year ({FIRST_YEAR}-{LAST_YEAR}): "))
+            if FIRST_YEAR <= year <= LAST_YEAR:
+                return year
+            print(f"Invalid input! Please enter a year between {FIRST_YEAR} and {LAST_YEAR}.")
+        except ValueError:
+            print("Invalid input! Please enter an integer value.")
+
+
+class ChartRenderer:
+    """
+    Draw the income and consumption ratio charts of any year.
+
+    Each chart is a single figure whose bar artists are created once; drawing
+    another year only updates bar heights, offsets, titles and axis limits.
+    """
+
+    def __init__(self, df_final_combined, df_final_result):
+        self.income, self.ratios = build_cubes(df_final_combined, df_final_result, CATEGORIES)
+        self.years = set(self.income.labels("year"))
+        self._create_income_figure()
+        self._create_ratio_figure()
+
+    def _create_income_figure(self):
+        bar_width = 0.3
+        x_indexes = np.arange(len(CATEGORIES))
+
+        self.income_fig, self.income_ax = plt.subplots(figsize=(12, 6))
+        self.income_bars = [
+            self.income_ax.bar(x_indexes + i * bar_width, np.zeros(len(CATEGORIES)), width=bar_width,
+                               label=series, color=SERIES_COLORS[series])
+            for i, series in enumerate(SERIES_TYPES)
+        ]
+
+        self.income_ax.set_xticks(x_indexes + bar_width, CATEGORIES, rotation=45)
+        self.income_ax.set_ylabel("Total Amount ($ Billions)")
+        self.income_ax.set_xlabel("Percentile of Total Disposable Personal Income")
+        self.income_ax.legend()
+        self.income_ax.grid(axis="y", linestyle="--", alpha=0.7)
+
+    def _create_ratio_figure(self):
+        bar_width = 0.6
+
+        self.ratio_fig, self.ratio_ax = plt.subplots(figsize=(10, 6))
+        self.ratio_bars = [
+            self.ratio_ax.bar(CATEGORIES, np.zeros(len(CATEGORIES)), bar_width, label=ratio, color=color)
+            for ratio, color in RATIO_COLORS.items()
+        ]
+
+        self.ratio_ax.set_ylabel("Consumption to Disposable Income Ratio")
+        self.ratio_ax.legend()
+        self.ratio_ax.tick_params(axis="x", labelrotation=45)
+        self.ratio_ax.grid(axis='y', linestyle='--', alpha=0.7)
+        self.ratio_fig.subplots_adjust(bottom=0.25)
+
+        for x, y, text in RATIO_NOTES:
+            self.ratio_fig.text(x, y, text, wrap=True, horizontalalignment='left', fontsize=7, linespacing=1)
+
+    def draw(self, year):
+        """
+        Update both figures to show one year.
+
+        Returns:
+        - False when there is no income data for the year
+        """
+        if year not in self.years:
+            print(f"No data available for the year {year}!")
+            return False
+
+        values = self.income.sel(year=year).filled()
+        for bars, column in zip(self.income_bars, values.T):
+            for bar, value in zip(bars, column):
+                bar.set_height(value)
+        self.income_ax.set_title(f"Income, Expenditures, and Savings by DPI Level ({year})")
+        self.income_ax.relim()
+        self.income_ax.autoscale_view()
+        self.income_fig.tight_layout()
+
+        ratios = self.ratios.sel(year=year, ratio=list(RATIO_COLORS)).values
+        bottom = np.zeros(len(CATEGORIES))
+        for bars, column in zip(self.ratio_bars, ratios.T):
+            for bar, value, offset in zip(bars, column, bottom):
+                bar.set_y(offset)
+                bar.set_height(value)
+            bottom = bottom + column
+        self.ratio_ax.set_title(f"Consumption to Disposable Income Ratio by Quantile ({year})")
+        self.ratio_ax.relim()
+        self.ratio_ax.autoscale_view()
+        return True
+
+    def save(self, year, output_dir=OUTPUT_DIR, formats=CHART_FORMATS):
+        """
+        Draw one year and write both charts in every format.
+
+        Returns:
+        - List of the files written
+        """
+        if not self.draw(year):
+            return []
+        paths = []
+        for name, fig in (('income', self.income_fig), ('consumption_ratios', self.ratio_fig)):
+            for fmt in formats:
+                path = Path(output_dir) / f"{name}_{year}.{fmt}"
+                fig.savefig(path)
+                paths.append(str(path))
+        return paths
+
+
+# Renderer owned by each batch worker process
+_RENDERER = None
+
+
+def _init_renderer(df_final_combined, df_final_result):
+    global _RENDERER
+    plt.switch_backend('Agg')
+    _RENDERER = ChartRenderer(df_final_combined, df_final_result)
+
+
+def _render_years(years, output_dir, formats):
+    return [path for year in years for path in _RENDERER.save(year, output_dir, formats)]
+
+
+def render_all(df_final_combined, df_final_result, years=None, output_dir=OUTPUT_DIR,
+               formats=CHART_FORMATS, workers=None):
+    """
+    Render the charts of many years without any interaction.
+
+    Years are split into one contiguous block per worker process; each worker
+    builds its figures once and redraws them for every year of its block.
+
+    Parameters:
+    - df_final_combined, df_final_result: Tables from build_tables
+    - years: Years to render (default: every year in the data)
+    - output_dir: Directory the charts are written to
+    - formats: File formats, e.g. ['png', 'svg']
+    - workers: Number of worker processes (default: CPU count)
+
+    Returns:
+    - List of the files written
+    """
+    if years is None:
+        years = sorted(df_final_combined["Year"].unique().tolist())
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(years)))
+    blocks = [block.tolist() for block in np.array_split(years, workers) if len(block)]
+    if workers == 1:
+        _init_renderer(df_final_combined, df_final_result)
+        return _render_years(years, output_dir, formats)
+
+    with futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_renderer,
+                                     initargs=(df_final_combined, df_final_result)) as pool:
+        results = pool.map(_render_years, blocks, [output_dir] * len(blocks), [formats] * len(blocks))
+        return [path for paths in results for path in paths]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Income, expenditure and consumption ratio charts")
+    parser.add_argument('--all', action='store_true', help="Render every year to files instead of asking for one")
+    parser.add_argument('--years', type=int, nargs='+', help="Render these years to files")
+    parser.add_argument('--output-dir', default=OUTPUT_DIR, help="Directory for rendered charts")
+    parser.add_argument('--formats', nargs='+', default=CHART_FORMATS, help="File formats, e.g. png svg")
+    parser.add_argument('--workers', type=int, help="Worker processes (default: CPU count)")
+    args = parser.parse_args()
+
+    if args.all or args.years:
+        plt.switch_backend('Agg')
+
+    df_final_combined, df_final_result = load_tables()
+
+    if args.all or args.years:
+        paths = render_all(df_final_combined, df_final_result, args.years, args.output_dir,
+                           args.formats, args.workers)
+        print(f"Wrote {len(paths)} charts to {args.output_dir}")
+        return
+
+    year = prompt_year()
+    if ChartRenderer(df_final_combined, df_final_result).draw(year):
+        plt.show()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+data_cube.py - Dense labelled cubes of the distributional data
+
+The processors answer questions like "value for year Y, group G, series S".
+A DataCube holds such values as one contiguous NumPy array with a label ->
+index map per axis, built from a long-format frame in a single pass. Lookups,
+slices, roll-ups (deciles -> quintiles) and ratios are then array operations
+instead of repeated boolean filters over the frame.
+
+Each cube also counts the source rows behind every cell, so callers can tell
+an empty cell from a zero value.
+
+Usage:
+    from data_cube import DataCube
+    cube = DataCube.from_frame(df, {'year': 'Year', 'group': 'Quantile or Summary Metric',
+                                    'series': 'Series'}, 'Value')
+    cube.value(year=2019, group='0-10%', series='Personal Saving')
+    quintiles = cube.roll_up('group', {'0-20%': ['0-10%', '10-20%'], ...})
+    consumption = quintiles.ratio('series', 'Personal Consumption Expenditures',
+                                  'Disposable Personal Income', scale=100)
+"""
+
+from lazy_imports import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+
+class DataCube:
+    """
+    Dense array of values with labelled axes.
+
+    Attributes:
+    - values: Contiguous float array, one dimension per axis
+    - counts: Integer array of the same shape counting the source rows of each cell
+    - axes: Dictionary of axis name -> list of labels, in dimension order
+    - index: Dictionary of axis name -> {label: position}
+    """
+
+    def __init__(self, values, axes, counts=None):
+        self.values = np.ascontiguousarray(values, dtype=float)
+        self.axes = {axis: list(labels) for axis, labels in axes.items()}
+        shape = tuple(len(labels) for labels in self.axes.values())
+        if self.values.shape != shape:
+            raise ValueError(f"Values of shape {self.values.shape} do not match axes of shape {shape}")
+        self.counts = np.ones(shape, dtype=int) if counts is None else np.asarray(counts, dtype=int)
+        self.index = {axis: {label: i for i, label in enumerate(labels)} for axis, labels in self.axes.items()}
+
+    @classmethod
+    def from_frame(cls, df, axes, value_column, labels=None, fill=0.0):
+        """
+        Build a cube from a long-format frame in one pass.
+
+        Parameters:
+        - df: DataFrame with one row per observation
+        - axes: Dictionary of axis name -> column holding its labels
+        - value_column: Column of the values; rows of the same cell are summed
+          and rows without a value are skipped
+        - labels: Optional dictionary of axis name -> labels to keep, in order;
+          rows with other labels are dropped (default: sorted unique values)
+        - fill: Value of the cells without any row
+
+        Returns:
+        - DataCube
+        """
+        labels = labels or {}
+        axis_labels = {}
+        positions = []
+        for axis, column in axes.items():
+            if axis in labels:
+                axis_labels[axis] = list(labels[axis])
+            else:
+                axis_labels[axis] = sorted(df[column].dropna().unique().tolist())
+            positions.append(pd.Index(axis_labels[axis]).get_indexer(df[column]))
+
+        observed = df[value_column].to_numpy(dtype=float)
+        keep = np.logical_and.reduce([position >= 0 for position in positions] + [~np.isnan(observed)])
+        cell = tuple(position[keep] for position in positions)
+        shape = tuple(len(axis) for axis in axis_labels.values())
+
+        values = np.zeros(shape)
+        counts = np.zeros(shape, dtype=int)
+        np.add.at(values, cell, observed[keep])
+        np.add.at(counts, cell, 1)
+        if fill != 0:
+            values[counts == 0] = fill
+        return cls(values, axis_labels, counts)
+
+    @property
+    def dims(self):
+        return list(self.axes)
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def labels(self, axis):
+        return self.axes[axis]
+
+    def __contains__(self, item):
+        """
+        Whether (axis, label) is on the cube.
+        """
+        axis, label = item
+        return label in self.index.get(axis, {})
+
+    def position(self, axis, label):
+        """
+        Return the index of a label, or of every label of a list, along an axis.
+        """
+        try:
+            if isinstance(label, (list, tuple)):
+                return [self.index[axis][item] for item in label]
+            return self.index[axis][label]
+        except KeyError as e:
+            raise KeyError(f"{e.args[0]!r} is not a label of axis {axis}") from None
+
+    def sel(self, **selection):
+        """
+        Select labels along any axes.
+
+        A single label drops its axis; a list keeps the axis with those labels
+        in the given order.
+
+        Returns:
+        - DataCube of the remaining axes, or a float when every axis is dropped
+        """
+        unknown = set(selection) - set(self.axes)
+        if unknown:
+            raise KeyError(f"Unknown axes {sorted(unknown)}, expected {self.dims}")
+
+        values, counts = self.values, self.counts
+        axes = {}
+        dim = 0
+        for axis, labels in self.axes.items():
+            if axis not in selection:
+                axes[axis] = labels
+                dim += 1
+                continue
+            chosen = selection[axis]
+            if isinstance(chosen, (list, tuple)):
+                axes[axis] = list(chosen)
+                chosen = list(chosen)
+            positions = self.position(axis, chosen)
+            values = np.take(values, positions, axis=dim)
+            counts = np.take(counts, positions, axis=dim)
+            if axis in axes:
+                dim += 1
+
+        if not axes:
+            return float(values)
+        return DataCube(values, axes, counts)
+
+    def value(self, **selection):
+        """
+        Return the value of one cell, given a label for every axis.
+        """
+        missing = set(self.axes) - set(selection)
+        if missing:
+            raise KeyError(f"No label given for axes {sorted(missing)}")
+        return self.sel(**selection)
+
+    def roll_up(self, axis, groups):
+        """
+        Sum members of an axis into groups, e.g. deciles into quintiles.
+
+        Parameters:
+        - axis: Axis to aggregate
+        - groups: Dictionary of group label -> member labels; groups may overlap
+
+        Returns:
+        - DataCube with the groups as the labels of the axis
+        """
+        dim = self.dims.index(axis)
+        values = np.moveaxis(self.values, dim, -1)
+        counts = np.moveaxis(self.counts, dim, -1)
+        members = [self.position(axis, list(labels)) for labels in groups.values()]
+        rolled = np.stack([values[..., idx].sum(axis=-1) for idx in members], axis=-1)
+        rolled_counts = np.stack([counts[..., idx].sum(axis=-1) for idx in members], axis=-1)
+        axes = dict(self.axes)
+        axes[axis] = list(groups)
+        return DataCube(np.moveaxis(rolled, -1, dim), axes, np.moveaxis(rolled_counts, -1, dim))
+
+    def ratio(self, axis, numerator, denominator, scale=1.0):
+        """
+        Divide one label of an axis by another, e.g. consumption by income.
+
+        Cells whose denominator is 0 or empty are NaN.
+
+        Returns:
+        - DataCube without the axis
+        """
+        top = self.sel(**{axis: numerator})
+        bottom = self.sel(**{axis: denominator})
+        valid = (bottom.counts > 0) & (bottom.values != 0)
+        safe = np.where(valid, bottom.values, 1)
+        values = np.where(valid, (top.values / safe) * scale, np.nan)
+        return DataCube(values, top.axes, np.minimum(top.counts, bottom.counts))
+
+    def transpose(self, *dims):
+        """
+        Reorder the axes.
+        """
+        order = [self.dims.index(axis) for axis in dims]
+        return DataCube(self.values.transpose(order), {axis: self.axes[axis] for axis in dims},
+                        self.counts.transpose(order))
+
+    def filled(self, fill=0.0):
+        """
+        Return the values with empty cells set to fill.
+        """
+        return np.where(self.counts > 0, self.values, fill)
+
+    def to_frame(self, value_column='Value', dropna=True):
+        """
+        Return the cube in long format, one row per non-empty cell.
+        """
+        index = pd.MultiIndex.from_product(list(self.axes.values()), names=self.dims)
+        df = pd.DataFrame({value_column: self.values.ravel()}, index=index).reset_index()
+        if dropna:
+            df = df[self.counts.ravel() > 0].reset_index(drop=True)
+        return df
+
+    def __repr__(self):
+        axes = ', '.join(f"{axis}={len(labels)}" for axis, labels in self.axes.items())
+        return f"<DataCube {axes}>"
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+excel_cache.py - Columnar on-disk cache for parsed Excel sheets
+
+Parsing the BEA workbooks with openpyxl is most of the run time of the data
+processors. This module converts each requested sheet once to a Feather file
+(or a pickle when pyarrow is not installed) and serves later loads from it.
+Cache entries are keyed by a hash of the workbook contents, so editing or
+replacing a workbook invalidates its cached sheets automatically.
+
+Usage:
+    from excel_cache import read_excel_cached
+    df = read_excel_cached('data/full_dataset.xlsx', 'shares of NIPA totals')
+
+    python excel_cache.py --clear
+"""
+
+import hashlib
+import importlib.util
+import os
+import re
+import sys
+from pathlib import Path
+
+from lazy_imports import lazy_import
+
+pd = lazy_import('pandas')
+
+# Configure paths
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', '.cache')
+
+# Bump when the on-disk layout changes so old entries are ignored
+CACHE_VERSION = 1
+
+# Name of a cache entry: <prefix>-v<version>-<content hash>.<format>. The
+# cache directory also holds build and incremental state, which is not ours.
+CACHE_ENTRY = re.compile(r'-v\d+-[0-9a-f]{16}\.(feather|pkl)$')
+
+# Checked without importing pyarrow, which is slow to import
+CACHE_FORMAT = 'feather' if importlib.util.find_spec('pyarrow') is not None else 'pkl'
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """
+    Return the SHA-256 hex digest of a file's contents.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_prefix(path, sheet_name):
+    """
+    Return the file name prefix shared by every cache entry of a sheet.
+
+    A hash of the resolved workbook path keeps workbooks with the same file
+    name in different directories apart.
+    """
+    sheet_slug = re.sub(r'[^A-Za-z0-9]+', '_', str(sheet_name)).strip('_')
+    path_hash = hashlib.sha256(str(Path(path).resolve()).encode()).hexdigest()[:8]
+    return f"{Path(path).stem}-{path_hash}-{sheet_slug}-v{CACHE_VERSION}-"
+
+
+def read_excel_cached(path, sheet_name, cache_dir=CACHE_DIR):
+    """
+    Read one sheet of an Excel workbook, using the columnar cache when possible.
+
+    Parameters:
+    - path: Path to the workbook
+    - sheet_name: Name of the sheet to read
+    - cache_dir: Directory holding the cached sheets
+
+    Returns:
+    - DataFrame with the sheet contents
+    """
+    prefix = cache_prefix(path, sheet_name)
+    cache_file = Path(cache_dir) / f"{prefix}{file_digest(path)[:16]}.{CACHE_FORMAT}"
+
+    for candidate in (cache_file, cache_file.with_suffix('.pkl')):
+        if candidate.exists():
+            try:
+                return _read_cache_file(candidate)
+            except Exception as e:
+                print(f"Ignoring unreadable cache file {candidate}: {e}")
+
+    df = pd.read_excel(path, sheet_name=sheet_name)
+
+    try:
+        Path(cache_dir).mkdir(parents=True, exist_ok=True)
+        # Drop entries for older versions of the same workbook
+        for stale in Path(cache_dir).glob(f"{prefix}*"):
+            stale.unlink()
+        _write_cache_file(df, cache_file)
+    except Exception as e:
+        print(f"Could not cache {path} [{sheet_name}]: {e}")
+
+    return df
+
+
+def clear_cache(cache_dir=CACHE_DIR):
+    """
+    Remove every cached sheet and return how many files were deleted.
+
+    Other files in the directory (build state, viz2 year hashes) are kept.
+    """
+    removed = 0
+    for cache_file in Path(cache_dir).glob('*'):
+        if cache_file.is_file() and CACHE_ENTRY.search(cache_file.name):
+            cache_file.unlink()
+            removed += 1
+    return removed
+
+
+def _read_cache_file(cache_file):
+    if cache_file.suffix == '.feather':
+        return pd.read_feather(cache_file)
+    return pd.read_pickle(cache_file)
+
+
+def _write_cache_file(df, cache_file):
+    # Write to a temporary name first so readers never see a partial file
+    tmp_file = cache_file.with_name(cache_file.name + '.tmp')
+    if cache_file.suffix == '.feather':
+        try:
+            df.to_feather(tmp_file)
+        except Exception:
+            # Columns arrow cannot represent (mixed object types) fall back to pickle
+            cache_file = cache_file.with_suffix('.pkl')
+            df.to_pickle(tmp_file)
+    else:
+        df.to_pickle(tmp_file)
+    os.replace(tmp_file, cache_file)
+
+
+if __name__ == "__main__":
+    if '--clear' in sys.argv[1:]:
+        print(f"Removed {clear_cache()} cached sheets from {CACHE_DIR}")
+    else:
+        print(__doc__)
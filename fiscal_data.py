@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+fiscal_data.py - Shared loaders, quantile mappings and JSON output for the data processors
+
+viz2_data_processor.py and charles_189.py both read the BEA "shares of NIPA
+totals" and distributional PCE "table1data" sheets and group their deciles
+(into quintiles by default, see GROUPINGS); every processor writes JSON for
+the browser. This module holds the pieces they share. It imports nothing
+heavy itself (the Excel cache binds pandas lazily), so importing it costs a
+few milliseconds.
+
+Usage:
+    from fiscal_data import CATEGORIES, QUANTILE_MAPPING, load_shares, write_json
+    df_shares = load_shares()
+    write_json(result, 'data/viz2_data.json')
+"""
+
+import json
+import os
+
+from excel_cache import read_excel_cached
+
+# Configure paths
+INPUT_FILE = 'data/full_dataset.xlsx'
+PCE_FILE = 'data/distributional-pce-2000-2022.xlsx'
+
+SHARES_SHEET = "shares of NIPA totals"
+PCE_SHEET = "table1data"
+
+SERIES_TYPES = ["Disposable Personal Income", "Personal Consumption Expenditures", "Personal Saving"]
+
+RANKING = "Equivalized Disposable Personal Income"
+TOTAL_METRIC = "Total ($ Billions)"
+
+# Quantile metrics of the shares sheet
+DECILE_METRICS = ["0-10%", "10-20%", "20-30%", "30-40%", "40-50%", "50-60%", "60-70%", "70-80%", "80-90%", "90-100%"]
+TOP_METRICS = ["Top 5%", "Top 1%"]
+
+# table1data decile share columns
+PCE_DECILES = [f"Decile{i}" for i in range(1, 11)]
+
+# Groupings of the shares-sheet quantiles: name -> {group: (shares metrics
+# summed into the group, table1data decile columns behind its PCE breakdown)}.
+# table1data has no top-tail columns, so those groups have no PCE breakdown.
+GROUPINGS = {
+    "quintiles": {
+        f"{20 * i}-{20 * (i + 1)}%": (DECILE_METRICS[2 * i:2 * i + 2], PCE_DECILES[2 * i:2 * i + 2])
+        for i in range(5)
+    },
+    "deciles": {metric: ([metric], [column]) for metric, column in zip(DECILE_METRICS, PCE_DECILES)},
+    "top": {metric: ([metric], []) for metric in TOP_METRICS}
+}
+
+CATEGORIES = list(GROUPINGS["quintiles"])
+
+# Decile to quintile mapping of the shares sheet
+QUANTILE_MAPPING = {metric: group for group, (metrics, _) in GROUPINGS["quintiles"].items() for metric in metrics}
+
+# table1data decile columns summed into each quintile
+DECILE_COLUMNS = {group: columns for group, (_, columns) in GROUPINGS["quintiles"].items()}
+
+
+def load_shares(path=INPUT_FILE):
+    """
+    Load the "shares of NIPA totals" sheet through the Excel cache.
+    """
+    return read_excel_cached(path, SHARES_SHEET)
+
+
+def load_pce_table(path=PCE_FILE):
+    """
+    Load the "table1data" sheet of the distributional PCE workbook through the Excel cache.
+    """
+    return read_excel_cached(path, PCE_SHEET)
+
+
+def check_grouping(name, groups):
+    """
+    Raise ValueError unless every group of a grouping names known shares
+    metrics and table1data columns.
+    """
+    if not groups:
+        raise ValueError(f"Grouping {name} has no groups")
+    for group, (metrics, columns) in groups.items():
+        unknown = [m for m in metrics if m not in DECILE_METRICS + TOP_METRICS]
+        unknown += [c for c in columns if c not in PCE_DECILES]
+        if not metrics or unknown:
+            raise ValueError(f"Group {group} of grouping {name} has no metrics or unknown ones: {unknown}")
+
+
+def load_groupings(path):
+    """
+    Load grouping specs from a JSON file of the form
+    {name: {group: {"metrics": [...], "deciles": [...]}}}, where "deciles"
+    (the table1data columns) may be omitted.
+
+    Returns:
+    - Dictionary in the form of GROUPINGS
+    """
+    with open(path) as f:
+        specs = json.load(f)
+    groupings = {}
+    for name, groups in specs.items():
+        groupings[name] = {group: (spec["metrics"], spec.get("deciles", [])) for group, spec in groups.items()}
+        check_grouping(name, groupings[name])
+    return groupings
+
+
+def write_json(data, path, indent=2, compact=False):
+    """
+    Write data as JSON, replacing the file atomically.
+
+    Parameters:
+    - data: JSON-serialisable object
+    - path: Output file; its directory is created if needed
+    - indent: Indentation of the pretty-printed output
+    - compact: Write without any whitespace instead (for large browser payloads)
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        if compact:
+            json.dump(data, f, separators=(',', ':'))
+        else:
+            json.dump(data, f, indent=indent)
+    os.replace(tmp_path, path)
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+inequality.py - Weighted Gini coefficients, Lorenz curves and top shares of SCF microdata
+
+viz4 compares countries by their SWIID Gini coefficients; this module measures
+inequality inside the SCF microdata, so the US figures can be read next to
+them (SWIID reports Gini coefficients on a 0-100 scale, these are 0-1).
+
+Rows are sorted once by (group, value). Cumulative weights and weighted values
+within each group give the Lorenz curve as a piecewise linear function of the
+population share. The Gini coefficient is one minus twice the area under it
+(trapezoid rule), and top shares and share ratios are read off the curve. The
+overall distribution and every grouping are laid out side by side, so one sort
+serves all of them.
+
+The sort depends only on the values and groups, not on the weights. A layout
+is therefore prepared once and evaluated for a whole matrix of weights (one
+column per bootstrap draw or replicate weight) with cumulative sums down the
+rows, which keeps bootstrap loops cheap; batches of replicates run on the
+standard_errors.py process pool.
+
+Net worth can be negative: the Lorenz curve then dips below zero and the Gini
+coefficient can exceed 1. Groups whose weighted total is not positive get NaN.
+
+Usage:
+    from inequality import inequality_standard_errors, inequality_statistics, lorenz_statistics, prepare_lorenz
+    stats = inequality_statistics(df['NETWORTH'], df['WGT'], {'byWealth': df['WEALTHQUINTILE']})
+    stats['groups']                    # [('overall', None), ('byWealth', 1), ...]
+    stats['gini']                      # one value per group
+
+    layout = prepare_lorenz(df['NETWORTH'], {'byWealth': df['WEALTHQUINTILE']})
+    replicates = lorenz_statistics(layout, multipliers * weights[:, None])   # groups x replicates
+    errors = inequality_standard_errors(df['NETWORTH'], df['WGT'], clusters=df['YY1'])
+"""
+
+import warnings
+
+from lazy_imports import lazy_import
+from standard_errors import (DEFAULT_BATCH_SIZE, DEFAULT_REPLICATES, bootstrap_batches, bootstrap_multipliers,
+                             check_replicate_count, household_clusters, run_batches)
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+OVERALL = 'overall'
+
+# Population shares at which the Lorenz curve is published
+LORENZ_POINTS = tuple(i / 20 for i in range(21))
+
+# Top population shares whose share of the total is published
+TOP_SHARES = (0.01, 0.1)
+
+# Share ratios: name -> (top population share, bottom population share)
+SHARE_RATIOS = {
+    'palmaRatio': (0.1, 0.4),
+    'top10Bottom50Ratio': (0.1, 0.5)
+}
+
+
+def share_label(q):
+    """
+    Return the JSON label of a top share, e.g. 0.01 -> 'top1Share'.
+    """
+    return f"top{round(q * 100):g}Share"
+
+
+def prepare_lorenz(values, groupings=None):
+    """
+    Sort the rows once for the overall distribution and every grouping.
+
+    Each group is opened by an empty row, so every Lorenz curve starts at
+    (0, 0) and the groups can be evaluated together.
+
+    Parameters:
+    - values: Data values; rows with missing values are left out
+    - groupings: Optional dictionary of grouping name -> group label of each
+      row; rows with a missing label are left out of that grouping
+
+    Returns:
+    - Dictionary with the row of each sorted position ('rows', -1 for the
+      empty rows), the sorted 'values', the group 'codes' and 'bounds', and
+      the 'groups' as (grouping, label) pairs, overall first
+    """
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(values)
+    groups = [(OVERALL, None)]
+    codes = [np.where(valid, 0, -1)]
+    for name, keys in (groupings or {}).items():
+        group_codes, labels = pd.factorize(pd.Series(np.asarray(keys)), sort=True)
+        codes.append(np.where(valid & (group_codes >= 0), group_codes + len(groups), -1))
+        groups.extend((name, label) for label in labels)
+
+    # One sort by (group, value) over the rows of every grouping
+    codes = np.concatenate(codes)
+    rows = np.tile(np.arange(len(values)), len(codes) // max(len(values), 1))
+    keep = codes >= 0
+    codes, rows = codes[keep], rows[keep]
+    order = np.lexsort((values[rows], codes))
+    codes, rows = codes[order], rows[order]
+
+    # Open every group with an empty row
+    starts = np.searchsorted(codes, np.arange(len(groups)))
+    rows = np.insert(rows, starts, -1)
+    codes = np.insert(codes, starts, np.arange(len(groups)))
+    return {
+        'rows': rows,
+        'values': np.where(rows >= 0, values[rows], 0.0),
+        'codes': codes,
+        'bounds': np.searchsorted(codes, np.arange(len(groups) + 1)),
+        'groups': groups
+    }
+
+
+def lorenz_statistics(layout, weights, points=LORENZ_POINTS, top_shares=TOP_SHARES, ratios=SHARE_RATIOS):
+    """
+    Evaluate the Lorenz curve, Gini coefficient and top shares of every group.
+
+    Parameters:
+    - layout: Output of prepare_lorenz
+    - weights: Weight of each row, or a (rows x replicates) matrix of weights;
+      missing weights count as 0
+    - points: Population shares at which the Lorenz curve is evaluated
+    - top_shares: Top population shares whose share of the total is returned
+    - ratios: Dictionary of name -> (top, bottom) population shares; the
+      ratio is the share of the top divided by the share of the bottom
+
+    Returns:
+    - Dictionary with 'gini', 'population' and 'total' (groups), 'lorenz'
+      (groups x points), 'top_shares' (groups x top shares) and 'ratios'
+      (name -> groups); a trailing replicate axis is added for a weight matrix
+    """
+    weights = np.asarray(weights, dtype=float)
+    single = weights.ndim == 1
+
+    # One contiguous row per replicate; the appended zero column is the weight of the empty rows (-1)
+    columns = weights.reshape(len(weights), -1).T
+    padded = np.zeros((columns.shape[0], columns.shape[1] + 1))
+    padded[:, :-1] = columns
+    if np.isnan(padded).any():
+        np.nan_to_num(padded, copy=False)
+    sorted_weights = padded[:, layout['rows']]
+    weighted_values = sorted_weights * layout['values']
+
+    # Every group is opened by an empty row, so no group is empty
+    bounds = layout['bounds']
+    starts, ends = bounds[:-1], bounds[1:]
+    population = np.add.reduceat(sorted_weights, starts, axis=1)
+    total = np.add.reduceat(weighted_values, starts, axis=1)
+    valid = (population > 0) & (total > 0)
+
+    # Turn both arrays, in place, into the increments of the population and
+    # value shares within each group. Their running sums rise by 1 per group,
+    # so later groups keep full precision.
+    with np.errstate(divide='ignore'):
+        population_scale = np.where(population > 0, 1 / population, 0)
+        value_scale = np.where(valid, 1 / total, 0)
+    for g, (start, end) in enumerate(zip(starts, ends)):
+        sorted_weights[:, start:end] *= population_scale[:, g:g + 1]
+        weighted_values[:, start:end] *= value_scale[:, g:g + 1]
+    population_step, value_step = sorted_weights, weighted_values
+
+    # Gini = 1 - sum of (p_i - p_i-1) * (L_i + L_i-1) within each group, with
+    # L_i + L_i-1 = 2 L_i - (L_i - L_i-1) and L_i measured from the group's base.
+    # The running sums replace the increments in place as soon as they are no longer needed.
+    area = np.empty_like(population)
+    for g, (start, end) in enumerate(zip(starts, ends)):
+        area[:, g] = -np.einsum('ij,ij->i', population_step[:, start:end], value_step[:, start:end])
+    cumulative_values = np.cumsum(value_step, axis=1, out=value_step)
+    value_base = cumulative_values[:, starts]
+    for g, (start, end) in enumerate(zip(starts, ends)):
+        step = population_step[:, start:end]
+        area[:, g] += (2 * np.einsum('ij,ij->i', step, cumulative_values[:, start:end])
+                       - 2 * value_base[:, g] * step.sum(axis=1))
+    cumulative_shares = np.cumsum(population_step, axis=1, out=population_step)
+    gini = np.where(valid, 1 - area, np.nan)
+
+    # Read every curve off the running sums, one interpolation per replicate
+    top_points = [1 - q for q in top_shares]
+    ratio_points = [1 - top for top, _ in ratios.values()] + [bottom for _, bottom in ratios.values()]
+    targets = np.asarray(list(points) + top_points + ratio_points, dtype=float)
+    curve = np.empty((columns.shape[0], len(starts), len(targets)))
+    for r in range(columns.shape[0]):
+        at = np.minimum(cumulative_shares[r, starts][:, None] + targets[None, :],
+                        cumulative_shares[r, ends - 1][:, None])
+        curve[r] = np.interp(at.ravel(), cumulative_shares[r], cumulative_values[r]).reshape(at.shape)
+    curve = np.where(valid[:, :, None], curve - value_base[:, :, None], np.nan).transpose(1, 2, 0)
+    gini, population, total = gini.T, population.T, total.T
+
+    n_points, n_top, n_ratios = len(points), len(top_shares), len(ratios)
+    top_values = 1 - curve[:, n_points:n_points + n_top]
+    ratio_tops = 1 - curve[:, n_points + n_top:n_points + n_top + n_ratios]
+    ratio_bottoms = curve[:, n_points + n_top + n_ratios:]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ratio_values = np.where(ratio_bottoms > 0, ratio_tops / ratio_bottoms, np.nan)
+
+    result = {
+        'gini': gini,
+        'population': population,
+        'total': total,
+        'lorenz': curve[:, :n_points],
+        'top_shares': top_values,
+        'ratios': {name: ratio_values[:, i] for i, name in enumerate(ratios)}
+    }
+    if single:
+        result = {key: ({name: value[..., 0] for name, value in value.items()} if key == 'ratios'
+                        else value[..., 0]) for key, value in result.items()}
+    return result
+
+
+def inequality_statistics(values, weights=None, groupings=None, points=LORENZ_POINTS, top_shares=TOP_SHARES,
+                          ratios=SHARE_RATIOS):
+    """
+    Gini coefficient, Lorenz curve and top shares of a distribution, overall
+    and by every grouping, from a single sort.
+
+    Parameters:
+    - values: Data values
+    - weights: Weight of each row (default 1)
+    - groupings: Optional dictionary of grouping name -> group label of each row
+
+    Returns:
+    - lorenz_statistics output with the 'groups' of prepare_lorenz
+    """
+    layout = prepare_lorenz(values, groupings)
+    if weights is None:
+        weights = np.ones(len(np.asarray(values)))
+    result = lorenz_statistics(layout, weights, points, top_shares, ratios)
+    result['groups'] = layout['groups']
+    return result
+
+
+def _scalar_statistics(statistics):
+    """
+    Flatten the per-group scalar statistics to name -> array.
+    """
+    flat = {'gini': statistics['gini']}
+    for i in range(statistics['top_shares'].shape[1]):
+        flat[f'top_share_{i}'] = statistics['top_shares'][:, i]
+    for name, values in statistics['ratios'].items():
+        flat[name] = values
+    return flat
+
+
+def _weight_batch(design, weights):
+    return _scalar_statistics(lorenz_statistics(design['layout'], weights, (), design['top_shares'],
+                                                design['ratios']))
+
+
+def _bootstrap_batch(design, clusters, n_clusters, size, seed):
+    multipliers = bootstrap_multipliers(clusters, n_clusters, size, np.random.default_rng(seed))
+    return _weight_batch(design, multipliers * design['weights'][:, None])
+
+
+def inequality_standard_errors(values, weights, groupings=None, replicate_weights=None, clusters=None,
+                               implicates=None, n_replicates=DEFAULT_REPLICATES, batch_size=DEFAULT_BATCH_SIZE,
+                               workers=None, seed=0, top_shares=TOP_SHARES, ratios=SHARE_RATIOS):
+    """
+    Standard errors of the Gini coefficients, top shares and share ratios.
+
+    Uses the variance rule of standard_errors.py: the mean squared deviation
+    of the replicate estimates from the full-sample estimate, plus
+    (1 + 1/m) times the variance across implicates.
+
+    Parameters:
+    - values: Data values
+    - weights: Weight of each row
+    - groupings: Optional dictionary of grouping name -> group label of each row
+    - replicate_weights: Optional (rows x replicates) array of replicate
+      weights; without it a household bootstrap is used
+    - clusters: Household id of each row for the bootstrap (default: each row)
+    - implicates: Implicate number of each row, for the imputation variance
+    - n_replicates: Number of bootstrap replicates
+    - batch_size: Replicates evaluated together in one weight matrix
+    - workers: Number of worker processes (default: CPU count)
+    - seed: Seed for the bootstrap draws
+
+    Returns:
+    - Dictionary with 'groups' and, per group, standard errors of 'gini',
+      'top_shares' (groups x top shares) and 'ratios' (name -> groups)
+    """
+    check_replicate_count(replicate_weights, n_replicates)
+
+    layout = prepare_lorenz(values, groupings)
+    weights = np.nan_to_num(np.asarray(weights, dtype=float))
+    design = {'layout': layout, 'weights': weights, 'top_shares': top_shares, 'ratios': ratios}
+    estimates = _weight_batch(design, weights)
+
+    # Replicates in batches: one (rows x batch) weight matrix per task
+    if replicate_weights is not None:
+        replicate_weights = np.asarray(replicate_weights, dtype=float)
+        tasks = [
+            (_weight_batch, (replicate_weights[:, start:start + batch_size],))
+            for start in range(0, replicate_weights.shape[1], batch_size)
+        ]
+    else:
+        clusters, n_clusters = household_clusters(clusters, len(weights))
+        tasks = [
+            (_bootstrap_batch, (clusters, n_clusters, size, s))
+            for size, s in bootstrap_batches(n_replicates, batch_size, seed)
+        ]
+    batches = run_batches(tasks, design, workers)
+
+    # Implicates, evaluated as one indicator weight matrix
+    by_implicate = None
+    if implicates is not None:
+        implicates = np.asarray(implicates)
+        numbers = np.unique(implicates)
+        if len(numbers) > 1:
+            by_implicate = _weight_batch(design, (implicates[:, None] == numbers[None, :]) * weights[:, None])
+
+    variance = {}
+    with warnings.catch_warnings():
+        # Statistics that are NaN in every replicate (e.g. a negative bottom share) stay NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        for name in estimates:
+            replicates = np.concatenate([batch[name] for batch in batches], axis=1)
+            variance[name] = np.nanmean((replicates - estimates[name][:, None]) ** 2, axis=1)
+            if by_implicate is not None:
+                m = by_implicate[name].shape[1]
+                variance[name] = variance[name] + (1 + 1 / m) * np.nanvar(by_implicate[name], axis=1, ddof=1)
+
+    errors = {name: np.sqrt(value) for name, value in variance.items()}
+    return {
+        'groups': layout['groups'],
+        'gini': errors['gini'],
+        'top_shares': np.stack([errors[f'top_share_{i}'] for i in range(len(top_shares))], axis=1),
+        'ratios': {name: errors[name] for name in ratios}
+    }
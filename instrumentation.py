@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+instrumentation.py - Stage timing, row and byte counts for the data processors
+
+Processors mark their stages with the stage() context manager or the traced()
+decorator. While tracing is off (the default), stage() returns a shared no-op
+object, so an instrumented stage costs one function call. When tracing is
+enabled, every stage produces one record:
+
+    {"type": "stage", "name": "viz3.load", "parent": "viz3", "depth": 1,
+     "start": 0.0123, "duration": 0.4567, "rows_in": ..., "rows_out": ...,
+     "bytes_in": ..., "bytes_out": ...}
+
+Start times are seconds since tracing began. Row and byte counts are
+whatever the stage reports through set(). For traced() functions they are
+taken from the first argument and the return value when those are DataFrames
+or arrays. Records are written as JSON lines or as a Chrome trace
+(chrome://tracing, Perfetto). With memory=True every record also carries the
+peak traced memory of the stage (tracemalloc). A cProfile capture of the
+whole run can be written alongside the trace.
+
+Processors expose this as --trace, --trace-format, --trace-memory and
+--profile. The FMD_TRACE environment variable sets --trace, so runs started
+by build.py or cron can be traced without changing their command lines; a
+{pid} in the path keeps the traces of concurrent processes apart.
+
+Usage:
+    from instrumentation import nbytes, stage, traced
+    with stage('viz3.load', input_file=path) as s:
+        df = load_scf_data(path)
+        s.set(rows_out=len(df), bytes_out=nbytes(df))
+
+    python viz3_data_processing.py --trace trace.jsonl
+    python viz3_data_processing.py --trace trace.json --trace-format chrome --trace-memory
+"""
+
+import atexit
+import cProfile
+import functools
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+TRACE_ENV = 'FMD_TRACE'
+TRACE_FORMATS = ['jsonl', 'chrome']
+
+# Active tracer, None while tracing is disabled
+_TRACER = None
+
+
+def nbytes(obj):
+    """
+    In-memory size of a DataFrame, Series or array (shallow), or of a file
+    given by its path; None for anything else.
+    """
+    if isinstance(obj, (str, os.PathLike)):
+        return os.path.getsize(obj) if os.path.exists(obj) else None
+    if hasattr(obj, 'memory_usage'):
+        usage = obj.memory_usage(index=True)
+        return int(usage.sum()) if hasattr(usage, 'sum') else int(usage)
+    if hasattr(obj, 'nbytes'):
+        return int(obj.nbytes)
+    return None
+
+
+def nrows(obj):
+    """
+    Number of rows of a DataFrame, Series or array; None for anything else.
+    """
+    shape = getattr(obj, 'shape', None)
+    if shape:
+        return int(shape[0])
+    return None
+
+
+class _NullStage:
+    """
+    Stage returned while tracing is disabled; every operation does nothing.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **fields):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    def __init__(self, tracer, name, fields):
+        self.tracer = tracer
+        self.record = {'type': 'stage', 'name': name}
+        self.record.update(fields)
+        self.memory_peak = 0
+
+    def set(self, **fields):
+        """
+        Add counts or other fields (rows_in, rows_out, bytes_in, bytes_out, ...) to the record.
+        """
+        self.record.update(fields)
+
+    def __enter__(self):
+        self.tracer.enter(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        end = time.perf_counter()
+        if exc_type is not None:
+            self.record['error'] = exc_type.__name__
+        self.tracer.exit(self, self.start, end)
+        return False
+
+
+class Tracer:
+    """
+    Collects stage records and writes them when tracing finishes.
+    """
+
+    def __init__(self, trace_file=None, trace_format='jsonl', memory=False, profile_file=None):
+        self.trace_file = trace_file.replace('{pid}', str(os.getpid())) if trace_file else None
+        self.trace_format = trace_format
+        self.memory = memory
+        self.profile_file = profile_file
+        self.records = []
+        self.stack = []
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+        self.profiler = None
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if profile_file:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def enter(self, current):
+        current.record['depth'] = len(self.stack)
+        if self.stack:
+            current.record['parent'] = self.stack[-1].record['name']
+        if self.memory:
+            # Hand the peak so far to the enclosing stage, then measure this one from here
+            size, peak = tracemalloc.get_traced_memory()
+            if self.stack:
+                self.stack[-1].memory_peak = max(self.stack[-1].memory_peak, peak)
+            tracemalloc.reset_peak()
+            current.memory_start = size
+            current.memory_peak = size
+        self.stack.append(current)
+
+    def exit(self, current, start, end):
+        self.stack.pop()
+        record = current.record
+        record['start'] = round(start - self.origin, 6)
+        record['duration'] = round(end - start, 6)
+        if self.memory:
+            size, peak = tracemalloc.get_traced_memory()
+            current.memory_peak = max(current.memory_peak, peak)
+            record['memory_peak'] = current.memory_peak - current.memory_start
+            record['memory_change'] = size - current.memory_start
+            if self.stack:
+                self.stack[-1].memory_peak = max(self.stack[-1].memory_peak, current.memory_peak)
+            tracemalloc.reset_peak()
+        self.records.append(record)
+
+    def finish(self):
+        """
+        Stop profiling and write the trace and profile files.
+        """
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.profile_file)
+            print(f"Profile written to {self.profile_file} (view with: python -m pstats {self.profile_file})",
+                  file=sys.stderr)
+        if self.trace_file:
+            records = sorted(self.records, key=lambda record: record['start'])
+            with open(self.trace_file, 'w') as f:
+                if self.trace_format == 'chrome':
+                    json.dump(chrome_trace(records, self.pid), f, default=_json_value)
+                else:
+                    f.write(json.dumps({'type': 'run', 'argv': sys.argv, 'pid': self.pid}) + '\n')
+                    for record in records:
+                        f.write(json.dumps(record, default=_json_value) + '\n')
+            print(f"Trace written to {self.trace_file}", file=sys.stderr)
+
+
+def _json_value(value):
+    # NumPy scalars reported as counts
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+def chrome_trace(records, pid):
+    """
+    Convert stage records to the Chrome trace event format (complete events, in microseconds).
+    """
+    events = []
+    for record in records:
+        args = {key: value for key, value in record.items()
+                if key not in ('type', 'name', 'start', 'duration', 'depth', 'parent')}
+        events.append({
+            'name': record['name'],
+            'cat': record['name'].split('.')[0],
+            'ph': 'X',
+            'ts': round(record['start'] * 1e6, 3),
+            'dur': round(record['duration'] * 1e6, 3),
+            'pid': pid,
+            'tid': 0,
+            'args': args
+        })
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def enable(trace_file=None, trace_format='jsonl', memory=False, profile_file=None):
+    """
+    Start tracing; the trace is written at exit (or by disable()).
+
+    Returns:
+    - The active Tracer
+    """
+    global _TRACER
+    if trace_format not in TRACE_FORMATS:
+        raise ValueError(f"Unknown trace format {trace_format}, expected one of {', '.join(TRACE_FORMATS)}")
+    disable()
+    _TRACER = Tracer(trace_file, trace_format, memory, profile_file)
+    atexit.register(disable)
+    return _TRACER
+
+
+def disable():
+    """
+    Stop tracing and write any pending output.
+    """
+    global _TRACER
+    tracer, _TRACER = _TRACER, None
+    if tracer is not None:
+        tracer.finish()
+
+
+def enabled():
+    return _TRACER is not None
+
+
+def stage(name, **fields):
+    """
+    Context manager timing one stage; fields are added to its record.
+    """
+    if _TRACER is None:
+        return _NULL_STAGE
+    return _Stage(_TRACER, name, fields)
+
+
+def traced(name=None):
+    """
+    Decorator recording every call of a function as a stage.
+
+    Rows and bytes are taken from the first argument (in) and the return
+    value (out) when they are DataFrames or arrays.
+    """
+    def decorator(function):
+        stage_name = name or f"{function.__module__}.{function.__name__}"
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _TRACER is None:
+                return function(*args, **kwargs)
+            with _Stage(_TRACER, stage_name, {}) as current:
+                if args and nrows(args[0]) is not None:
+                    current.set(rows_in=nrows(args[0]), bytes_in=nbytes(args[0]))
+                result = function(*args, **kwargs)
+                if nrows(result) is not None:
+                    current.set(rows_out=nrows(result), bytes_out=nbytes(result))
+                return result
+        return wrapper
+    return decorator
+
+
+def add_trace_arguments(parser):
+    """
+    Add the --trace, --trace-format, --trace-memory and --profile options to a parser.
+    """
+    parser.add_argument('--trace', default=os.environ.get(TRACE_ENV),
+                        help=f"Write stage timings to this file; {{pid}} is replaced by the process id "
+                             f"(default: ${TRACE_ENV})")
+    parser.add_argument('--trace-format', choices=TRACE_FORMATS, default='jsonl',
+                        help="JSON lines, or Chrome trace events for chrome://tracing")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="With --trace, also record the peak traced memory of every stage (slower)")
+    parser.add_argument('--profile', help="Write a cProfile capture of the run to this file")
+
+
+def configure(args):
+    """
+    Enable tracing as requested by the add_trace_arguments options.
+    """
+    if args.trace or args.profile:
+        enable(args.trace, args.trace_format, args.trace_memory, args.profile)
@@ -3,6 +3,28 @@
  * Handles common functionality across the site
  */
 
+// Data files -> content-hashed copies, written by asset_manifest.py
+const DATA_MANIFEST_URL = 'data/manifest.json';
+
+// Promise of the manifest's assets; null without a manifest, so the plain paths are fetched
+const dataManifest = fetch(DATA_MANIFEST_URL, { cache: 'no-cache' })
+    .then(response => response.ok ? response.json() : null)
+    .then(manifest => manifest ? manifest.assets : null)
+    .catch(() => null);
+
+// Data requested or preloaded so far: logical URL -> promise of the parsed data
+const dataRequests = new Map();
+
+// Fetch every file the visualizations need at page start in parallel, before they ask for it
+dataManifest.then(assets => {
+    if (!assets) return;
+    Object.entries(assets).forEach(([url, entry]) => {
+        if (entry.preload) {
+            loadJsonData(url);
+        }
+    });
+});
+
 document.addEventListener('DOMContentLoaded', function() {
     // Highlight active section in the navigation
     highlightNavigation();
@@ -137,16 +159,78 @@ function formatNumber(num) {
 
 /**
  * Load JSON data from the given URL
+ * URLs ending in .bin are decoded as packed typed arrays (see decodePackedData)
+ * The URL is resolved through the data manifest; each file is fetched once,
+ * later calls (and calls during the preload) share the same request
  */
-async function loadJsonData(url) {
+function loadJsonData(url) {
+    if (!dataRequests.has(url)) {
+        const request = fetchData(url);
+        dataRequests.set(url, request);
+        // Let a failed request be retried
+        request.then(data => {
+            if (data === null) {
+                dataRequests.delete(url);
+            }
+        });
+    }
+    return dataRequests.get(url);
+}
+
+/**
+ * Fetch and parse one data file, from its hashed copy when the manifest lists it
+ */
+async function fetchData(url) {
     try {
-        const response = await fetch(url);
+        const assets = await dataManifest;
+        const entry = assets ? assets[url] : null;
+        let response = await fetch(entry ? entry.path : url);
+        if (!response.ok && entry) {
+            // Manifest older than the deployed files
+            response = await fetch(url);
+        }
         if (!response.ok) {
             throw new Error(`HTTP error! status: ${response.status}`);
         }
+        if (url.endsWith('.bin')) {
+            return decodePackedData(await response.arrayBuffer());
+        }
         return await response.json();
     } catch (error) {
         console.error(`Failed to load data from ${url}:`, error);
         return null;
     }
 }
+
+/**
+ * Decode a packed data file written by packed_data.py
+ * Arrays are typed-array views on the buffer, so no values are copied
+ * @param {ArrayBuffer} buffer - The file contents
+ * @returns {Object} { meta, arrays: { name: { data, shape } } }
+ */
+function decodePackedData(buffer) {
+    const typedArrays = {
+        float32: Float32Array,
+        float64: Float64Array,
+        int32: Int32Array,
+        uint8: Uint8Array
+    };
+    
+    const magic = new TextDecoder().decode(new Uint8Array(buffer, 0, 4));
+    if (magic !== 'FMDP') {
+        throw new Error('Not a packed data file');
+    }
+    const headerLength = new DataView(buffer).getUint32(4, true);
+    const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 8, headerLength)));
+    
+    const arrays = {};
+    Object.entries(header.arrays).forEach(([name, entry]) => {
+        const ArrayType = typedArrays[entry.dtype];
+        arrays[name] = {
+            data: new ArrayType(buffer, entry.offset, entry.length),
+            shape: entry.shape
+        };
+    });
+    
+    return { meta: header.meta, arrays: arrays };
+}
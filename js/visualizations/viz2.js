@@ -21,13 +21,39 @@ document.addEventListener('DOMContentLoaded', function() {
   loadIncomeData();
 });
 
+// Index with the first chart, and the chart series of every view
+const VIZ2_INDEX_URL = 'data/viz2/index.json';
+const VIZ2_CHARTS_URL = 'data/viz2/charts.json';
+
 /**
 * Load and process income data
+* The small index carries the series of the first chart; the series of the
+* other views are fetched in the background
 */
 async function loadIncomeData() {
   try {
-      // First try to load from JSON if already processed
-      let processedData = await loadJsonData('data/viz2_data.json').catch(() => null);
+      const index = await loadJsonData(VIZ2_INDEX_URL).catch(() => null);
+      if (index) {
+          const formattedData = {
+              charts: { income: index.charts.income },
+              categories: index.categories,
+              years: index.years
+          };
+          initVisualization(formattedData, index);
+          
+          // Complete the other views
+          formattedData.pending = loadJsonData(VIZ2_CHARTS_URL).then(charts => {
+              if (!charts) {
+                  throw new Error('Chart series could not be loaded');
+              }
+              Object.assign(formattedData.charts, charts);
+              formattedData.pending = null;
+          });
+          formattedData.pending.catch(error => console.error('Error loading chart series:', error));
+          return;
+      }
+      
+      const processedData = await loadFullData();
       
       if (!processedData) {
           // If JSON not available, display a message
@@ -55,152 +81,133 @@ async function loadIncomeData() {
 }
 
 /**
-* Format data for D3.js visualization
-* @param {Object} data - The processed data
-* @returns {Object} Data formatted for D3 visualizations
+* Load the full data, preferring the packed arrays over the JSON file
+* @returns {Promise<Object|null>} Data in the layout of viz2_data.json, or null if neither file loads
 */
-function formatDataForVisualization(data) {
-  // For income/spending/savings by income group
-  const incomeSpendingByYear = {};
-  const ratiosByYear = {};
-  
-  // Process each year
-  data.years.forEach(year => {
-      const yearStr = year.toString();
-      const yearData = data.yearlyData[yearStr];
-      
-      if (!yearData) return;
-      
-      // Income spending data - for income quintiles
-      const incomeSpendingData = [];
-      data.categories.forEach(category => {
-          incomeSpendingData.push({
-              category: category,
-              Disposable_Income: yearData.income["Disposable Personal Income"][category] || 0,
-              Consumption: yearData.income["Personal Consumption Expenditures"][category] || 0,
-              Savings: yearData.income["Personal Saving"][category] || 0
+async function loadFullData() {
+  const packedData = await loadJsonData('data/viz2_data.bin').catch(() => null);
+  if (packedData) {
+      return expandPackedData(packedData);
+  }
+  return loadJsonData('data/viz2_data.json').catch(() => null);
+}
+
+/**
+* Rebuild the viz2_data.json structure from the packed income and ratio arrays
+* @param {Object} packed - Result of decodePackedData
+* @returns {Object} Data in the layout of viz2_data.json
+*/
+function expandPackedData(packed) {
+  const { years, categories, seriesTypes, ratioTypes } = packed.meta;
+  const income = packed.arrays.income.data;    // years x series x categories
+  const ratios = packed.arrays.ratios.data;     // years x categories x ratio types
+  const yearlyData = {};
+  
+  years.forEach((year, y) => {
+      const yearIncome = {};
+      seriesTypes.forEach((series, s) => {
+          yearIncome[series] = {};
+          categories.forEach((category, c) => {
+              yearIncome[series][category] = income[(y * seriesTypes.length + s) * categories.length + c];
           });
       });
       
-      incomeSpendingByYear[yearStr] = incomeSpendingData;
-      
-      // Consumption ratio data - for stacked area
-      const ratioData = [];
-      data.categories.forEach(category => {
-          if (yearData.ratios && yearData.ratios[category]) {
-              ratioData.push({
-                  category: category,
-                  Household: yearData.ratios[category]["Household Consumption Ratio"] || 0,
-                  Nondurable: yearData.ratios[category]["Nondurable Goods Ratio"] || 0,
-                  Durable: yearData.ratios[category]["Durable Goods Ratio"] || 0,
-                  Nonprofit: yearData.ratios[category]["Nonprofit Consumption Ratio"] || 0
-              });
-          }
-      });
-      
-      ratiosByYear[yearStr] = ratioData;
-  });
-  
-  // For income over time - stacked area chart
-  const incomeTimeData = [];
-  
-  // Structure: [{year: 2004, '0-20%': value, '20-40%': value, ...}, ...]
-  data.years.forEach(year => {
-      const yearStr = year.toString();
-      const yearData = data.yearlyData[yearStr];
-      
-      if (!yearData) return;
-      
-      const timePoint = { year: yearStr };
-      
-      // Add values for each income category
-      data.categories.forEach(category => {
-          timePoint[category] = yearData.income["Disposable Personal Income"][category] || 0;
-      });
-      
-      incomeTimeData.push(timePoint);
-  });
-  
-  // For consumption over time
-  const consumptionTimeData = [];
-  
-  data.years.forEach(year => {
-      const yearStr = year.toString();
-      const yearData = data.yearlyData[yearStr];
-      
-      if (!yearData) return;
-      
-      const timePoint = { year: yearStr };
-      
-      // Add values for each income category
-      data.categories.forEach(category => {
-          timePoint[category] = yearData.income["Personal Consumption Expenditures"][category] || 0;
-      });
-      
-      consumptionTimeData.push(timePoint);
-  });
-  
-  // For savings over time
-  const savingsTimeData = [];
-  
-  data.years.forEach(year => {
-      const yearStr = year.toString();
-      const yearData = data.yearlyData[yearStr];
-      
-      if (!yearData) return;
-      
-      const timePoint = { year: yearStr };
-      
-      // Add values for each income category
-      data.categories.forEach(category => {
-          timePoint[category] = yearData.income["Personal Saving"][category] || 0;
+      const yearRatios = {};
+      categories.forEach((category, c) => {
+          yearRatios[category] = {};
+          ratioTypes.forEach((ratio, r) => {
+              yearRatios[category][ratio] = ratios[(y * categories.length + c) * ratioTypes.length + r];
+          });
       });
       
-      savingsTimeData.push(timePoint);
+      yearlyData[year.toString()] = { income: yearIncome, ratios: yearRatios };
   });
   
-  // For consumption ratio over time
-  const ratioTimeData = {};
+  return { years, categories, seriesTypes, yearlyData };
+}
+
+/**
+* Build the chart series of every view from the viz2_data.json structure
+* data/viz2/charts.json holds the same series precomputed; this is the
+* fallback when only the full data files are available
+* @param {Object} data - The processed data
+* @returns {Object} { charts: { income, consumption, savings, ratio }, categories, years }
+*/
+function formatDataForVisualization(data) {
+  const years = data.years.filter(year => data.yearlyData[year.toString()]);
+  const entries = years.map(year => data.yearlyData[year.toString()]);
+  const seriesValues = series => entries.map(entry =>
+      data.categories.map(category => entry.income[series][category] || 0));
   
-  // Initialize with empty arrays for each category
+  // Ratio line chart points per category
+  const ratio = {};
   data.categories.forEach(category => {
-      ratioTimeData[category] = [];
-  });
-  
-  // Populate with data
-  data.years.forEach(year => {
-      const yearStr = year.toString();
-      const yearData = data.yearlyData[yearStr];
-      
-      if (!yearData || !yearData.ratios) return;
-      
-      // For each income category
-      data.categories.forEach(category => {
-          if (yearData.ratios[category]) {
-              ratioTimeData[category].push({
-                  year: yearStr,
-                  Household: yearData.ratios[category]["Household Consumption Ratio"] || 0,
-                  Nondurable: yearData.ratios[category]["Nondurable Goods Ratio"] || 0,
-                  Durable: yearData.ratios[category]["Durable Goods Ratio"] || 0,
-                  Nonprofit: yearData.ratios[category]["Nonprofit Consumption Ratio"] || 0,
-                  Total: yearData.ratios[category]["Total Consumption Ratio"] || 0
+      ratio[category] = [];
+      entries.forEach((entry, y) => {
+          if (entry.ratios && entry.ratios[category]) {
+              ratio[category].push({
+                  year: years[y],
+                  Household: entry.ratios[category]["Household Consumption Ratio"] || 0,
+                  Nondurable: entry.ratios[category]["Nondurable Goods Ratio"] || 0,
+                  Durable: entry.ratios[category]["Durable Goods Ratio"] || 0,
+                  Nonprofit: entry.ratios[category]["Nonprofit Consumption Ratio"] || 0,
+                  Total: entry.ratios[category]["Total Consumption Ratio"] || 0
               });
           }
       });
   });
   
   return {
-      incomeSpendingByYear,
-      ratiosByYear,
-      incomeTimeData,
-      consumptionTimeData,
-      savingsTimeData,
-      ratioTimeData,
+      charts: {
+          income: stackSeries(years, data.categories, seriesValues("Disposable Personal Income")),
+          consumption: stackSeries(years, data.categories, seriesValues("Personal Consumption Expenditures")),
+          savings: lineSeries(years, data.categories, seriesValues("Personal Saving")),
+          ratio
+      },
       categories: data.categories,
-      years: data.years
+      years
   };
 }
 
+/**
+* Stack per-category values into area layers, as stacked_series in viz2_data_processor.py
+* @param {Array} years - The years of the rows
+* @param {Array} categories - The categories, bottom layer first
+* @param {Array} rows - One array of category values per year
+* @returns {Object} { years, layers: [{ key, values, points: [[y0, y1]] }], totals, max }
+*/
+function stackSeries(years, categories, rows) {
+  const layers = categories.map(key => ({ key, values: [], points: [] }));
+  const totals = rows.map(row => {
+      let top = 0;
+      row.forEach((value, c) => {
+          const bottom = top;
+          top = bottom + value;
+          layers[c].values.push(value);
+          layers[c].points.push([bottom, top]);
+      });
+      return top;
+  });
+  const max = d3.max(layers, layer => d3.max(layer.points, point => point[1])) || 0;
+  return { years, layers, totals, max };
+}
+
+/**
+* Arrange per-category values as line chart points, as line_series in viz2_data_processor.py
+* @param {Array} years - The years of the rows
+* @param {Array} categories - The categories
+* @param {Array} rows - One array of category values per year
+* @returns {Object} { years, series: [{ key, points: [{ year, value }] }], min, max }
+*/
+function lineSeries(years, categories, rows) {
+  const series = categories.map((key, c) => ({
+      key,
+      points: rows.map((row, y) => ({ year: years[y], value: row[c] }))
+  }));
+  const values = rows.flat();
+  return { years, series, min: d3.min(values) || 0, max: d3.max(values) || 0 };
+}
+
 /**
 * Initialize the visualization with processed data
 * @param {Object} formattedData - The formatted data for D3
@@ -261,7 +268,7 @@ function initVisualization(formattedData, rawData) {
   addControls(controlsContainer, formattedData, stackedAreaContainer, secondViewContainer);
   
   // Initialize with default view
-  createStackedAreaChart(formattedData.incomeTimeData, formattedData.categories, 
+  createStackedAreaChart(formattedData.charts.income, formattedData.categories, 
                       'Income Distribution Over Time ($ Billions)', 
                       stackedAreaContainer, 'income');
   
@@ -416,13 +423,35 @@ function updateVisualization(dataType, data, mainContainer, secondContainer) {
   // Update conclusion text
   updateConclusion(dataType);
   
+  // Only the income view is drawn from the index; the others wait for the chart series
+  data.view = dataType;
+  if (dataType !== 'income' && data.pending) {
+      const container = dataType === 'ratio' ? secondContainer : mainContainer;
+      mainContainer.style.display = dataType === 'ratio' ? 'none' : 'block';
+      secondContainer.style.display = dataType === 'ratio' ? 'block' : 'none';
+      container.innerHTML = '<div class="text-center my-5"><div class="spinner-border text-primary" role="status"></div><p class="mt-3">Loading visualization data...</p></div>';
+      data.pending.then(() => {
+          // Draw unless another view was selected meanwhile
+          if (data.view === dataType) {
+              updateVisualization(dataType, data, mainContainer, secondContainer);
+          }
+      }).catch(error => {
+          container.innerHTML = `
+              <div class="alert alert-danger">
+                  <strong>Error loading data:</strong> ${error.message}
+              </div>
+          `;
+      });
+      return;
+  }
+  
   // Update visualization based on data type
   switch (dataType) {
       case 'income':
           // Show income distribution over time
           mainContainer.style.display = 'block';
           secondContainer.style.display = 'none';
-          createStackedAreaChart(data.incomeTimeData, data.categories, 
+          createStackedAreaChart(data.charts.income, data.categories, 
                               'Income Distribution Over Time ($ Billions)', 
                               mainContainer, 'income');
           break;
@@ -431,7 +460,7 @@ function updateVisualization(dataType, data, mainContainer, secondContainer) {
           // Show consumption distribution over time
           mainContainer.style.display = 'block';
           secondContainer.style.display = 'none';
-          createStackedAreaChart(data.consumptionTimeData, data.categories, 
+          createStackedAreaChart(data.charts.consumption, data.categories, 
                               'Consumption Distribution Over Time ($ Billions)', 
                               mainContainer, 'consumption');
           break;
@@ -440,7 +469,7 @@ function updateVisualization(dataType, data, mainContainer, secondContainer) {
           // Show savings distribution over time
           mainContainer.style.display = 'block';
           secondContainer.style.display = 'none';
-          createStackedAreaChart(data.savingsTimeData, data.categories, 
+          createStackedAreaChart(data.charts.savings, data.categories, 
                               'Savings Distribution Over Time ($ Billions)', 
                               mainContainer, 'savings');
           break;
@@ -449,20 +478,20 @@ function updateVisualization(dataType, data, mainContainer, secondContainer) {
           // Show ratios by income percentile
           mainContainer.style.display = 'none';
           secondContainer.style.display = 'block';
-          createConsumptionRatioCharts(data.ratioTimeData, data.categories, secondContainer);
+          createConsumptionRatioCharts(data.charts.ratio, data.categories, secondContainer);
           break;
   }
 }
 
 /**
 * Create the main stacked area chart
-* @param {Array} data - The data for the chart
+* @param {Object} chart - The chart series (see stackSeries and lineSeries)
 * @param {Array} categories - The categories to include
 * @param {string} title - The chart title
 * @param {HTMLElement} container - The container element
 * @param {string} chartType - The type of chart (income, consumption, or savings)
 */
-function createStackedAreaChart(data, categories, title, container, chartType) {
+function createStackedAreaChart(chart, categories, title, container, chartType) {
   // Clear the container
   container.innerHTML = '';
   
@@ -490,40 +519,35 @@ function createStackedAreaChart(data, categories, title, container, chartType) {
   
   // For savings view, use a different approach because of negative values
   if (chartType === 'savings') {
-      createSavingsChart(data, categories, title, svg, width, height, color);
+      createSavingsChart(chart, categories, title, svg, width, height, color);
   } else {
-      // Format the data for stacking
-      const stack = d3.stack()
-          .keys(categories)
-          .order(d3.stackOrderNone)
-          .offset(d3.stackOffsetNone);
-      
-      const stackedData = stack(data);
+      // Layers arrive stacked: points are the [baseline, top] of each year
+      const years = chart.years;
       
       // Create scales
       const x = d3.scaleLinear()
-          .domain(d3.extent(data, d => +d.year))
+          .domain(d3.extent(years))
           .range([0, width]);
       
       const y = d3.scaleLinear()
-          .domain([0, d3.max(stackedData, d => d3.max(d, d => d[1]))])
+          .domain([0, chart.max])
           .nice()
           .range([height, 0]);
       
       // Create the area generator
       const area = d3.area()
-          .x(d => x(+d.data.year))
+          .x((d, i) => x(years[i]))
           .y0(d => y(d[0]))
           .y1(d => y(d[1]))
           .curve(d3.curveMonotoneX); // Smooth curve
       
       // Add areas
       svg.selectAll('.area')
-          .data(stackedData)
+          .data(chart.layers)
           .join('path')
           .attr('class', 'area')
           .attr('fill', d => color(d.key))
-          .attr('d', area)
+          .attr('d', d => area(d.points))
           .attr('opacity', 0.8)
           .on('mouseover', function(event, d) {
               d3.select(this)
@@ -549,7 +573,7 @@ function createStackedAreaChart(data, categories, title, container, chartType) {
       // Add X axis
       const xAxis = svg.append('g')
           .attr('transform', `translate(0,${height})`)
-          .call(d3.axisBottom(x).tickFormat(d => d.toString()).ticks(data.length > 10 ? 10 : data.length));
+          .call(d3.axisBottom(x).tickFormat(d => d.toString()).ticks(years.length > 10 ? 10 : years.length));
       
       // Rotate x-axis labels for better readability
       xAxis.selectAll('text')
@@ -593,7 +617,7 @@ function createStackedAreaChart(data, categories, title, container, chartType) {
           .style('z-index', 1000);
       
       // Add invisible overlay for hover detection
-      const bisect = d3.bisector(d => +d.year).left;
+      const bisect = d3.bisector(d => d).left;
       
       svg.append('rect')
           .attr('width', width)
@@ -606,27 +630,25 @@ function createStackedAreaChart(data, categories, title, container, chartType) {
               
               // Get year at cursor position
               const x0 = x.invert(mouseX);
-              const i = bisect(data, x0, 1);
-              const d0 = data[i - 1];
-              const d1 = data[i] || d0;
-              const d = x0 - d0.year > d1.year - x0 ? d1 : d0;
+              const i = Math.min(bisect(years, x0, 1), years.length - 1);
+              const j = i > 0 && x0 - years[i - 1] <= years[i] - x0 ? i - 1 : i;
+              const year = years[j];
               
               // Position vertical line
               verticalLine
-                  .attr('x1', x(+d.year))
-                  .attr('x2', x(+d.year))
+                  .attr('x1', x(year))
+                  .attr('x2', x(year))
                   .style('opacity', 1);
               
               // Update tooltip content
-              let tooltipContent = `<strong>Year: ${d.year}</strong><br>`;
-              categories.forEach(category => {
-                  const value = d[category];
-                  tooltipContent += `<span style="color: ${color(category)}">● </span>${category}: ${value.toFixed(1)}B<br>`;
+              let tooltipContent = `<strong>Year: ${year}</strong><br>`;
+              chart.layers.forEach(layer => {
+                  const value = layer.values[j];
+                  tooltipContent += `<span style="color: ${color(layer.key)}">● </span>${layer.key}: ${value.toFixed(1)}B<br>`;
               });
               
               // Add total
-              const total = categories.reduce((acc, curr) => acc + d[curr], 0);
-              tooltipContent += `<strong>Total: ${total.toFixed(1)}B</strong>`;
+              tooltipContent += `<strong>Total: ${chart.totals[j].toFixed(1)}B</strong>`;
               
               // Position and show tooltip
               tooltip
@@ -663,7 +685,7 @@ function createStackedAreaChart(data, categories, title, container, chartType) {
 
 /**
 * Create a specialized chart for savings data
-* @param {Array} data - The data for the chart
+* @param {Object} chart - The line chart series (see lineSeries)
 * @param {Array} categories - The categories to include
 * @param {string} title - The chart title
 * @param {d3.Selection} svg - The SVG selection
@@ -671,23 +693,15 @@ function createStackedAreaChart(data, categories, title, container, chartType) {
 * @param {number} height - Chart height
 * @param {Function} colorScale - The color scale to use
 */
-function createSavingsChart(data, categories, title, svg, width, height, colorScale) {
+function createSavingsChart(chart, categories, title, svg, width, height, colorScale) {
   // Create scales
   const x = d3.scaleLinear()
-      .domain(d3.extent(data, d => +d.year))
+      .domain(d3.extent(chart.years))
       .range([0, width]);
   
-  // Find the min and max values across all categories
-  const allValues = [];
-  data.forEach(d => {
-      categories.forEach(cat => {
-          allValues.push(d[cat]);
-      });
-  });
-  
-  const yMin = d3.min(allValues);
-  const yMax = d3.max(allValues);
-  const absMax = Math.max(Math.abs(yMin), Math.abs(yMax));
+  // The min and max values across all categories
+  const yMin = chart.min;
+  const yMax = chart.max;
   
   // Create y scale with buffer for negative values
   const y = d3.scaleLinear()
@@ -738,12 +752,9 @@ function createSavingsChart(data, categories, title, svg, width, height, colorSc
       .text('$0');
   
   // Draw lines and areas for each category
-  categories.forEach((category, i) => {
-      // Prepare data for this category
-      const categoryData = data.map(d => ({
-          year: +d.year,
-          value: d[category]
-      }));
+  chart.series.forEach((line, i) => {
+      const category = line.key;
+      const categoryData = line.points;
       
       // Draw area for positive values
       svg.append('path')
@@ -851,7 +862,7 @@ function createSavingsChart(data, categories, title, svg, width, height, colorSc
   });
   
   // Add year labels on x-axis
-  const years = data.map(d => +d.year);
+  const years = chart.years;
   const yearStep = Math.ceil(years.length / 10); // Show approx. 10 labels
   
   const xAxis = svg.append('g')
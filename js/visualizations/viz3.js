@@ -52,16 +52,7 @@ async function loadAndProcessData() {
  * Load the data from JSON file
  */
 async function loadData() {
-  try {
-    const response = await fetch('data/viz3_data.json');
-    if (!response.ok) {
-      throw new Error(`HTTP error! status: ${response.status}`);
-    }
-    return await response.json();
-  } catch (e) {
-    console.error('Error loading JSON:', e);
-    return null;
-  }
+  return loadJsonData('data/viz3_data.json');
 }
 
 /**
@@ -29,12 +29,12 @@ document.addEventListener('DOMContentLoaded', function() {
   }
   
   // Load the JSON data
-  fetch('data/redistribution_data.json')
-      .then(response => response.json())
+  loadJsonData('data/redistribution_data.json')
       .then(data => {
-          if (data) {
-              createChoroplethMap(data);
+          if (!data) {
+              throw new Error('No data');
           }
+          createChoroplethMap(data);
       })
       .catch(error => {
           console.error('Error loading data:', error);
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+lazy_imports.py - Deferred imports of heavy dependencies
+
+NumPy, pandas and matplotlib take most of a second to import, which dominates
+the run time of command-line paths that do no numeric work (--help,
+build.py --status, a rebuild where every product is up to date). Modules bind
+them with lazy_import instead, and the real import happens on the first
+attribute access, e.g. the first call of np.zeros.
+
+Usage:
+    from lazy_imports import lazy_import
+    np = lazy_import('numpy')
+    plt = lazy_import('matplotlib.pyplot')
+"""
+
+import importlib
+import sys
+
+
+class LazyModule:
+    """
+    Stand-in for a module that imports it on first attribute access.
+    """
+
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        module = self.__dict__['_module']
+        if module is None:
+            module = importlib.import_module(self._name)
+            self.__dict__['_module'] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = 'loaded' if self.__dict__['_module'] is not None else 'not loaded'
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def lazy_import(name):
+    """
+    Return the module if it is already imported, otherwise a LazyModule for it.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
+
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+packed_data.py - Packed columnar binary format for the browser visualizations
+
+Dense numeric cubes (years x series x categories, ...) are written as raw
+little-endian typed arrays behind a small JSON header, so the browser can
+view them as Float32Arrays without parsing a JSON tree. js/main.js decodes
+the format in loadJsonData when the URL ends in .bin.
+
+Layout:
+    bytes 0-3   magic b'FMDP'
+    bytes 4-7   uint32 header length in bytes
+    header      UTF-8 JSON, padded with spaces to a multiple of 8 bytes:
+                {"version": 1, "meta": {...},
+                 "arrays": {name: {"dtype", "shape", "offset", "length"}}}
+    data        array buffers; offsets are from the start of the file and
+                aligned to 8 bytes
+
+Usage:
+    from packed_data import write_packed, read_packed
+    write_packed('data/viz2_data.bin', {'income': income}, meta={'years': years})
+    arrays, meta = read_packed('data/viz2_data.bin')
+"""
+
+import json
+import os
+import struct
+
+from lazy_imports import lazy_import
+
+np = lazy_import('numpy')
+
+MAGIC = b'FMDP'
+FORMAT_VERSION = 1
+ALIGNMENT = 8
+
+# Element types the browser loader maps to typed arrays
+DTYPES = {
+    'float32': '<f4',
+    'float64': '<f8',
+    'int32': '<i4',
+    'uint8': 'u1'
+}
+
+
+def _pad(length, alignment=ALIGNMENT):
+    return (-length) % alignment
+
+
+def write_packed(path, arrays, meta=None, dtype='float32'):
+    """
+    Write named arrays and JSON metadata to a packed binary file.
+
+    Parameters:
+    - path: Output file path
+    - arrays: Dictionary of name -> array-like; each is stored C-contiguous
+    - meta: JSON-serialisable labels describing the axes
+    - dtype: Default element type for arrays that are not integer or uint8
+
+    Returns:
+    - Number of bytes written
+    """
+    prepared = {}
+    for name, values in arrays.items():
+        values = np.asarray(values)
+        kind = dtype if values.dtype.kind == 'f' else values.dtype.name
+        if kind not in DTYPES:
+            kind = dtype
+        prepared[name] = np.ascontiguousarray(values, dtype=DTYPES[kind]), kind
+
+    # Offsets depend on the header length, which depends on the offsets'
+    # digits, so grow the header size estimate until it is stable
+    header_size = 0
+    while True:
+        offset = 8 + header_size
+        entries = {}
+        for name, (values, kind) in prepared.items():
+            offset += _pad(offset)
+            entries[name] = {'dtype': kind, 'shape': list(values.shape), 'offset': offset, 'length': int(values.size)}
+            offset += values.nbytes
+        header = json.dumps({'version': FORMAT_VERSION, 'meta': meta or {}, 'arrays': entries},
+                            separators=(',', ':')).encode('utf-8')
+        needed = len(header) + _pad(8 + len(header))
+        if needed == header_size:
+            break
+        header_size = needed
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<I', header_size))
+        f.write(header + b' ' * (header_size - len(header)))
+        for name, (values, kind) in prepared.items():
+            f.write(b'\0' * (entries[name]['offset'] - f.tell()))
+            f.write(values.tobytes())
+        size = f.tell()
+    os.replace(tmp_path, path)
+    return size
+
+
+def read_packed(path):
+    """
+    Read a packed binary file.
+
+    Returns:
+    - (arrays, meta): dictionary of name -> NumPy array and the metadata
+    """
+    with open(path, 'rb') as f:
+        buffer = f.read()
+    if buffer[:4] != MAGIC:
+        raise ValueError(f"{path} is not a packed data file")
+    header_size, = struct.unpack('<I', buffer[4:8])
+    header = json.loads(buffer[8:8 + header_size].decode('utf-8'))
+    if header['version'] != FORMAT_VERSION:
+        raise ValueError(f"Unsupported packed data version {header['version']}")
+
+    arrays = {
+        name: np.frombuffer(buffer, dtype=DTYPES[entry['dtype']], count=entry['length'],
+                            offset=entry['offset']).reshape(entry['shape'])
+        for name, entry in header['arrays'].items()
+    }
+    return arrays, header['meta']
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+panel_regression.py - Fixed-effects panel regression with grouped linear algebra
+
+Fits y ~ x on a country-year panel with country and year fixed effects.
+The fixed effects are removed by the within transformation: every variable
+is demeaned by country and by year, alternating until the means vanish,
+which is exact for unbalanced panels. Group means are bincount sums, so no
+dummy matrix is ever built and the cost is O(rows x regressors) per sweep.
+
+Standard errors are clustered by country. Following the usual convention for
+absorbed effects, effects nested in the clusters (the country effects) are
+not counted in the small-sample correction; the year effects are.
+
+Usage:
+    from panel_regression import fit_fixed_effects, country_slopes
+    fit = fit_fixed_effects(y, x, [country_codes, year_codes], clusters=country_codes)
+    slopes = country_slopes(y, x, country_codes)
+"""
+
+from lazy_imports import lazy_import
+
+np = lazy_import('numpy')
+
+DEFAULT_TOLERANCE = 1e-10
+MAX_ITERATIONS = 1000
+
+
+def group_means(values, codes, n_groups):
+    """
+    Mean of every column of values within each group, returned per row.
+    """
+    counts = np.bincount(codes, minlength=n_groups)
+    counts = np.where(counts > 0, counts, 1)
+    means = np.column_stack([
+        np.bincount(codes, weights=column, minlength=n_groups) / counts for column in values.T
+    ])
+    return means[codes]
+
+
+def absorb(values, groupings, tolerance=DEFAULT_TOLERANCE, max_iterations=MAX_ITERATIONS):
+    """
+    Remove the fixed effects of one or more groupings from every column.
+
+    With one grouping this is a single demeaning; with several, demeaning
+    alternates between them until no group mean exceeds the tolerance.
+
+    Parameters:
+    - values: (rows x columns) array
+    - groupings: List of integer code arrays, codes 0..n-1
+
+    Returns:
+    - (demeaned values, number of sweeps)
+    """
+    result = np.array(values, dtype=np.float64).reshape(len(values), -1)
+    sizes = [int(codes.max()) + 1 for codes in groupings]
+    scale = max(np.abs(result).max(), 1.0)
+    for sweep in range(1, max_iterations + 1):
+        change = 0.0
+        for codes, n_groups in zip(groupings, sizes):
+            means = group_means(result, codes, n_groups)
+            result -= means
+            change = max(change, np.abs(means).max())
+        if len(groupings) == 1 or change <= tolerance * scale:
+            return result, sweep
+    return result, max_iterations
+
+
+def cluster_covariance(X, residuals, clusters, absorbed_parameters=0):
+    """
+    Cluster-robust (CR1) covariance of least-squares coefficients.
+
+    Parameters:
+    - X: (rows x k) regressors, already demeaned if effects were absorbed
+    - residuals: Residual of each row
+    - clusters: Integer cluster code of each row
+    - absorbed_parameters: Absorbed effects not nested in the clusters,
+      counted in the small-sample correction
+    """
+    n, k = X.shape
+    n_clusters = int(clusters.max()) + 1
+    scores = X * residuals[:, None]
+    cluster_scores = np.column_stack([
+        np.bincount(clusters, weights=column, minlength=n_clusters) for column in scores.T
+    ])
+    bread = np.linalg.inv(X.T @ X)
+    meat = cluster_scores.T @ cluster_scores
+    g = len(np.unique(clusters))
+    correction = g / (g - 1) * (n - 1) / (n - k - absorbed_parameters)
+    return correction * bread @ meat @ bread
+
+
+def _valid_rows(y, x):
+    valid = ~np.isnan(y)
+    for column in np.asarray(x, dtype=float).reshape(len(y), -1).T:
+        valid &= ~np.isnan(column)
+    return valid
+
+
+def fit_pooled(y, x, clusters):
+    """
+    Pooled OLS of y on an intercept and x with cluster-robust standard errors.
+
+    Returns:
+    - Dictionary with coefficients (intercept first), standard errors and counts
+    """
+    y = np.asarray(y, dtype=float)
+    x = np.asarray(x, dtype=float).reshape(len(y), -1)
+    valid = _valid_rows(y, x)
+    y, x, clusters = y[valid], x[valid], np.unique(clusters[valid], return_inverse=True)[1]
+
+    X = np.column_stack([np.ones(len(y)), x])
+    coefficients, *_ = np.linalg.lstsq(X, y, rcond=None)
+    residuals = y - X @ coefficients
+    covariance = cluster_covariance(X, residuals, clusters)
+    return {
+        'coefficients': coefficients,
+        'standard_errors': np.sqrt(np.diag(covariance)),
+        'rows': len(y),
+        'clusters': int(clusters.max()) + 1
+    }
+
+
+def fit_fixed_effects(y, x, groupings, clusters, tolerance=DEFAULT_TOLERANCE):
+    """
+    Regress y on x with the fixed effects of every grouping absorbed.
+
+    Parameters:
+    - y: Dependent variable
+    - x: Regressor(s), one column per variable
+    - groupings: List of integer code arrays (e.g. [country, year])
+    - clusters: Cluster code of each row; must be one of the groupings (or
+      nested in one) for the degrees-of-freedom correction to apply
+    - tolerance: Convergence tolerance of the alternating demeaning
+
+    Returns:
+    - Dictionary with coefficients, standard errors, within R-squared, counts
+      and the number of demeaning sweeps
+    """
+    y = np.asarray(y, dtype=float)
+    x = np.asarray(x, dtype=float).reshape(len(y), -1)
+    valid = _valid_rows(y, x)
+    groupings = [np.unique(codes[valid], return_inverse=True)[1] for codes in groupings]
+    clusters = np.unique(clusters[valid], return_inverse=True)[1]
+
+    demeaned, sweeps = absorb(np.column_stack([y[valid], x[valid]]), groupings, tolerance)
+    y_within, X_within = demeaned[:, 0], demeaned[:, 1:]
+    coefficients, *_ = np.linalg.lstsq(X_within, y_within, rcond=None)
+    residuals = y_within - X_within @ coefficients
+
+    # Effects nested in the clusters do not use up degrees of freedom
+    absorbed = sum(
+        int(codes.max()) for codes in groupings
+        if not _nested(clusters, codes)
+    )
+    covariance = cluster_covariance(X_within, residuals, clusters, absorbed)
+    return {
+        'coefficients': coefficients,
+        'standard_errors': np.sqrt(np.diag(covariance)),
+        'r2_within': 1 - (residuals @ residuals) / (y_within @ y_within),
+        'rows': int(valid.sum()),
+        'clusters': int(clusters.max()) + 1,
+        'sweeps': sweeps
+    }
+
+
+def _nested(clusters, codes):
+    """
+    True when every group of codes lies inside a single cluster.
+    """
+    n_groups = int(codes.max()) + 1
+    first = np.full(n_groups, -1)
+    first[codes[::-1]] = clusters[::-1]
+    return bool((first[codes] == clusters).all())
+
+
+def country_slopes(y, x, codes, n_groups=None, min_rows=3):
+    """
+    Slope of y on x within every group (country), from grouped sums.
+
+    Returns:
+    - Dictionary of arrays indexed by group code: 'slope', 'standard_error'
+      and 'rows'; NaN for groups with fewer than min_rows rows or no
+      variation in x
+    """
+    y = np.asarray(y, dtype=float)
+    x = np.asarray(x, dtype=float)
+    valid = ~(np.isnan(y) | np.isnan(x))
+    y, x, codes = y[valid], x[valid], codes[valid]
+    n_groups = n_groups or int(codes.max()) + 1
+
+    demeaned = absorb(np.column_stack([y, x]), [codes])[0]
+    y_within, x_within = demeaned[:, 0], demeaned[:, 1]
+    rows = np.bincount(codes, minlength=n_groups)
+    sxx = np.bincount(codes, weights=x_within * x_within, minlength=n_groups)
+    sxy = np.bincount(codes, weights=x_within * y_within, minlength=n_groups)
+
+    # Demeaning leaves rounding noise, so compare against the scale of x
+    usable = (rows >= min_rows) & (sxx > 1e-12 * np.bincount(codes, weights=x * x, minlength=n_groups))
+    slope = np.divide(sxy, sxx, out=np.full(n_groups, np.nan), where=usable)
+    residuals = y_within - np.nan_to_num(slope)[codes] * x_within
+    ssr = np.bincount(codes, weights=residuals * residuals, minlength=n_groups)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        standard_error = np.where(usable, np.sqrt(ssr / (rows - 2) / sxx), np.nan)
+    return {'slope': slope, 'standard_error': standard_error, 'rows': rows}
+
+
+def clustered_mean(values, clusters):
+    """
+    Mean of values with a cluster-robust standard error (a panel-aware
+    replacement for a paired t-test on the differences).
+
+    Returns:
+    - (mean, standard error, t statistic)
+    """
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(values)
+    fit = fit_pooled(values[valid], np.empty((valid.sum(), 0)), clusters[valid])
+    mean, se = fit['coefficients'][0], fit['standard_errors'][0]
+    return mean, se, mean / se
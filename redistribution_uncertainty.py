@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+redistribution_uncertainty.py - Monte Carlo uncertainty for SWIID redistribution
+
+SWIID reports a standard error for every market and disposable Gini. This
+module draws correlated (market, disposable) Gini pairs for every
+country-year as batched arrays of shape (countries x years x draws). It
+turns each draw into country mean relative redistribution. From the draws it
+reports credible intervals for each country's mean and the probability that
+the country is in the top or bottom of the ranking shown by viz4.js.
+
+The two Ginis of a country-year share most of their estimation error. Their
+correlation is recovered from the standard error of the absolute
+redistribution:
+
+    abs_red_se^2 = gini_mkt_se^2 + gini_disp_se^2 - 2 * rho * gini_mkt_se * gini_disp_se
+
+Country-years without abs_red_se use the median implied correlation. Draws
+are generated in chunks, so memory stays bounded for any number of draws,
+and the chunks are spread over a process pool.
+
+Usage:
+    from redistribution_uncertainty import simulate_redistribution
+    intervals = simulate_redistribution(df, n_draws=5000)
+"""
+
+import os
+from concurrent import futures
+
+from lazy_imports import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+DEFAULT_DRAWS = 2000
+DEFAULT_CHUNK_SIZE = 250
+TOP_N = 15
+
+# Columns needed to simulate the Gini pairs
+UNCERTAINTY_COLUMNS = ['country', 'year', 'gini_disp', 'gini_disp_se', 'gini_mkt', 'gini_mkt_se', 'abs_red_se']
+
+# Panel shared with worker processes
+_PANEL = None
+
+
+def implied_correlation(se_mkt, se_disp, se_abs):
+    """
+    Correlation between the market and disposable Gini errors implied by the
+    standard error of their difference; NaN where se_abs is missing.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rho = (se_mkt ** 2 + se_disp ** 2 - se_abs ** 2) / (2 * se_mkt * se_disp)
+    return np.clip(rho, -0.99, 0.99)
+
+
+def panel_arrays(df):
+    """
+    Arrange the country-year rows as dense (countries x years) float32 arrays.
+
+    Missing country-years are NaN in the estimates and 0 in the standard errors.
+
+    Returns:
+    - Dictionary with 'countries', 'years' and the gini_mkt, gini_disp,
+      se_mkt, se_disp and rho arrays
+    """
+    country_index, countries = pd.factorize(df['country'], sort=True)
+    year_index, years = pd.factorize(df['year'], sort=True)
+    shape = (len(countries), len(years))
+
+    def dense(values, fill):
+        array = np.full(shape, fill, dtype=np.float32)
+        array[country_index, year_index] = values
+        return array
+
+    se_mkt = df['gini_mkt_se'].to_numpy(dtype=np.float32)
+    se_disp = df['gini_disp_se'].to_numpy(dtype=np.float32)
+    rho = implied_correlation(se_mkt, se_disp, df['abs_red_se'].to_numpy(dtype=np.float32))
+    rho = np.where(np.isnan(rho), np.nanmedian(rho) if (~np.isnan(rho)).any() else 0, rho)
+
+    return {
+        'countries': list(countries),
+        'years': [int(year) for year in years],
+        'gini_mkt': dense(df['gini_mkt'].to_numpy(dtype=np.float32), np.nan),
+        'gini_disp': dense(df['gini_disp'].to_numpy(dtype=np.float32), np.nan),
+        'se_mkt': dense(np.nan_to_num(se_mkt), 0),
+        'se_disp': dense(np.nan_to_num(se_disp), 0),
+        'rho': dense(rho, 0)
+    }
+
+
+def simulate_country_means(panel, n_draws, rng):
+    """
+    Draw n_draws correlated Gini pairs for every country-year and return each
+    country's mean relative redistribution per draw.
+
+    Returns:
+    - (countries x n_draws) float64 array
+    """
+    shape = panel['gini_mkt'].shape + (n_draws,)
+    z_mkt = rng.standard_normal(shape, dtype=np.float32)
+    z_disp = rng.standard_normal(shape, dtype=np.float32)
+
+    rho = panel['rho'][..., None]
+    gini_mkt = panel['gini_mkt'][..., None] + panel['se_mkt'][..., None] * z_mkt
+    z_disp = rho * z_mkt + np.sqrt(1 - rho ** 2) * z_disp
+    gini_disp = panel['gini_disp'][..., None] + panel['se_disp'][..., None] * z_disp
+
+    relative = (gini_mkt - gini_disp) / gini_mkt * 100
+    observed = ~np.isnan(panel['gini_mkt'])
+    counts = observed.sum(axis=1)
+    sums = np.where(observed[..., None], relative, 0).sum(axis=1, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return sums / counts[:, None]
+
+
+def _init_worker(panel):
+    global _PANEL
+    _PANEL = panel
+
+
+def _simulate_chunk(n_draws, seed):
+    return simulate_country_means(_PANEL, n_draws, np.random.default_rng(seed))
+
+
+def rank_probabilities(means, top_n=TOP_N):
+    """
+    Probability of each country being among the top_n highest and lowest
+    means, over the draws (columns) of a (countries x draws) array.
+    """
+    ranked = np.where(np.isnan(means), -np.inf, means)
+    descending = np.argsort(-ranked, axis=0, kind='stable')
+    ranks = np.empty_like(descending)
+    np.put_along_axis(ranks, descending, np.arange(means.shape[0])[:, None], axis=0)
+
+    n_ranked = (~np.isnan(means)).sum(axis=0)
+    top = (ranks < top_n) & ~np.isnan(means)
+    bottom = (ranks >= n_ranked - top_n) & ~np.isnan(means)
+    return top.mean(axis=1), bottom.mean(axis=1)
+
+
+def simulate_redistribution(df, n_draws=DEFAULT_DRAWS, chunk_size=DEFAULT_CHUNK_SIZE, workers=None,
+                            seed=0, top_n=TOP_N, interval=0.95):
+    """
+    Credible intervals and rank probabilities of country mean relative redistribution.
+
+    Parameters:
+    - df: SWIID rows with the UNCERTAINTY_COLUMNS
+    - n_draws: Number of Monte Carlo draws
+    - chunk_size: Draws generated together; bounds memory at about
+      countries x years x chunk_size x 4 bytes per array
+    - workers: Number of worker processes (default: CPU count)
+    - seed: Seed for the draws
+    - top_n: Size of the top and bottom lists
+    - interval: Width of the credible interval
+
+    Returns:
+    - DataFrame with one row per country: simulated mean and median, interval
+      bounds and the probability of being in the top and bottom top_n
+    """
+    panel = panel_arrays(df)
+    sizes = [min(chunk_size, n_draws - start) for start in range(0, n_draws, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(sizes) > 1:
+        with futures.ProcessPoolExecutor(max_workers=min(workers, len(sizes)),
+                                         initializer=_init_worker, initargs=(panel,)) as pool:
+            chunks = list(pool.map(_simulate_chunk, sizes, seeds))
+    else:
+        _init_worker(panel)
+        chunks = [_simulate_chunk(size, s) for size, s in zip(sizes, seeds)]
+    means = np.concatenate(chunks, axis=1)
+
+    tail = (1 - interval) / 2
+    low, median, high = np.nanquantile(means, [tail, 0.5, 1 - tail], axis=1)
+    prob_top, prob_bottom = rank_probabilities(means, top_n)
+
+    return pd.DataFrame({
+        'country': panel['countries'],
+        'simulated_mean': np.nanmean(means, axis=1),
+        'simulated_median': median,
+        'ci_low': low,
+        'ci_high': high,
+        'prob_top': prob_top,
+        'prob_bottom': prob_bottom
+    })
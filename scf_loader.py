@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+scf_loader.py - Column-projected, compact-dtype loader for SCF summary extracts
+
+The SCF summary extract has hundreds of columns, but the visualization scripts
+only use a handful of them. This module reads just those columns and stores
+them with compact dtypes: int32 for household and implicate ids, int8 for
+category codes, float32 for weights and float64 for dollar amounts and
+ratios. Column names are matched case-insensitively and returned upper-case,
+as in the public extract.
+
+Usage:
+    from scf_loader import load_scf_data, iter_scf_chunks
+    df = load_scf_data('data/SCFP2022.csv')
+    for chunk in iter_scf_chunks('data/SCFP2022.csv', chunksize=100000):
+        ...
+"""
+
+from lazy_imports import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+# Household id (YY1) and household-implicate id (Y1) stored as int32
+ID_COLUMNS = ['YY1', 'Y1']
+
+# Category codes and indicators stored as int8
+CATEGORY_COLUMNS = [
+    'NWPCTLECAT', 'INCQRTCAT', 'INCPCTLECAT', 'FINLIT',
+    'EMERGBORR', 'EMERGSAV', 'EMERGPSTP', 'EMERGCUT'
+]
+
+# Survey weights stored as float32
+WEIGHT_COLUMNS = ['WGT']
+
+# Dollar amounts and ratios kept at full precision, including the
+# alternative stock columns used when STOCKS is missing
+VALUE_COLUMNS = [
+    'NETWORTH', 'INCOME', 'STOCKS', 'EQUITY', 'DEBT2INC',
+    'STOCK', 'STMUTF', 'COMUTF', 'NSTOCKS'
+]
+
+SCF_COLUMNS = ID_COLUMNS + CATEGORY_COLUMNS + WEIGHT_COLUMNS + VALUE_COLUMNS
+
+DEFAULT_CHUNKSIZE = 100000
+
+
+def scf_dtypes(compact_categories=True):
+    """
+    Return the dtype for every known SCF column.
+
+    Parameters:
+    - compact_categories: Store category codes as int8; when False they are
+      stored as float32 so that missing values can be represented
+
+    Returns:
+    - Dictionary of upper-case column name to dtype
+    """
+    category_dtype = np.int8 if compact_categories else np.float32
+    dtypes = {col: np.int32 for col in ID_COLUMNS}
+    dtypes.update({col: category_dtype for col in CATEGORY_COLUMNS})
+    dtypes.update({col: np.float32 for col in WEIGHT_COLUMNS})
+    dtypes.update({col: np.float64 for col in VALUE_COLUMNS})
+    return dtypes
+
+
+def resolve_columns(path, columns=SCF_COLUMNS):
+    """
+    Map the file's own column names to the requested upper-case names.
+
+    Columns that are not present in the file are left out.
+    """
+    header = pd.read_csv(path, nrows=0).columns
+    wanted = set(columns)
+    return {name: name.upper() for name in header if name.upper() in wanted}
+
+
+def load_scf_data(path, columns=SCF_COLUMNS):
+    """
+    Load the requested SCF columns with compact dtypes.
+
+    Parameters:
+    - path: Path to the SCF summary extract CSV
+    - columns: Upper-case column names to load
+
+    Returns:
+    - DataFrame containing the columns present in the file
+    """
+    return next(_read_scf(path, columns, chunksize=None))
+
+
+def iter_scf_chunks(path, chunksize=DEFAULT_CHUNKSIZE, columns=SCF_COLUMNS):
+    """
+    Iterate over the requested SCF columns in chunks of at most `chunksize` rows.
+
+    Parameters:
+    - path: Path to the SCF summary extract CSV
+    - chunksize: Number of rows per chunk
+    - columns: Upper-case column names to load
+
+    Yields:
+    - DataFrame chunks with compact dtypes
+    """
+    return _read_scf(path, columns, chunksize=chunksize)
+
+
+def _read_scf(path, columns, chunksize):
+    names = resolve_columns(path, columns)
+    rows_read = 0
+
+    # Category codes with missing values cannot be stored as int8, so retry
+    # the remaining rows with float32 codes
+    for compact in (True, False):
+        dtypes = scf_dtypes(compact)
+        try:
+            reader = pd.read_csv(
+                path,
+                usecols=list(names),
+                dtype={name: dtypes[upper] for name, upper in names.items()},
+                chunksize=chunksize,
+                skiprows=range(1, rows_read + 1)
+            )
+            if chunksize is None:
+                yield reader.rename(columns=names)
+                return
+            for chunk in reader:
+                rows_read += len(chunk)
+                yield chunk.rename(columns=names)
+            return
+        except ValueError:
+            if not compact:
+                raise
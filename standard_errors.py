@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+standard_errors.py - Replicate-weight and bootstrap standard errors for viz3 statistics
+
+SCF estimates carry two sources of uncertainty: sampling error, measured with
+replicate weights or a household bootstrap, and imputation error, measured as
+the spread of the estimate across the five implicates. This module evaluates
+the viz3 statistics for a whole matrix of weights at once (one column per
+replicate) and spreads batches of replicates over a process pool.
+
+Every statistic is defined by a base weight per row (WGT for the weighted
+statistics, 1 for the unweighted net worth median) and a replicate multiplies
+those base weights by a per-row factor. The total variance of a statistic is
+
+    sampling variance + (1 + 1/m) * between-implicate variance
+
+where the sampling variance is the mean squared deviation of the replicate
+estimates from the full-sample estimate.
+
+Usage:
+    from standard_errors import replicate_standard_errors
+    errors = replicate_standard_errors(df, n_replicates=200)
+    errors = replicate_standard_errors(df, replicate_weights=rw_matrix)
+"""
+
+import os
+from concurrent import futures
+
+from lazy_imports import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+DEFAULT_REPLICATES = 200
+DEFAULT_BATCH_SIZE = 50
+
+# Statistics evaluated for every weight column
+STATISTICS = [
+    'ownership_wealth', 'median_value_wealth',
+    'ownership_income', 'median_value_income',
+    'median_networth'
+]
+
+# Design shared with worker processes
+_DESIGN = None
+
+
+def prepare_design(df, stocks=None, n_groups=5):
+    """
+    Extract the arrays needed to evaluate the viz3 statistics for any weights.
+
+    Parameters:
+    - df: SCF data with WEALTHQUINTILE, INCQUINTILE, NETWORTH and WGT
+    - stocks: Stock holdings of each row (default: the STOCKS column)
+    - n_groups: Number of quintile groups
+
+    Returns:
+    - Dictionary of NumPy arrays and per-group sort orders
+    """
+    weights = df['WGT'].to_numpy(dtype=np.float64)
+    stocks = pd.to_numeric(df['STOCKS'] if stocks is None else stocks, errors='coerce').to_numpy(dtype=np.float64)
+    wealth = df['WEALTHQUINTILE'].to_numpy(dtype=np.float64)
+    income = df['INCQUINTILE'].to_numpy(dtype=np.float64)
+    networth = df['NETWORTH'].to_numpy(dtype=np.float64)
+
+    in_sample = ~(np.isnan(stocks) | np.isnan(weights) | np.isnan(wealth) | np.isnan(income))
+    owners = in_sample & (stocks > 0)
+
+    design = {
+        'n_rows': len(df),
+        'n_groups': n_groups,
+        'weights': np.nan_to_num(weights),
+        'in_sample': in_sample,
+        'owners': owners
+    }
+
+    # Row order and group bounds for grouped sums over the stock sample
+    for key, codes in (('wealth', wealth), ('income', income)):
+        design[f'{key}_sum'] = _group_layout(codes, in_sample, None, n_groups)
+        design[f'{key}_median'] = _group_layout(codes, owners, stocks, n_groups)
+    design['networth_median'] = _group_layout(wealth, ~np.isnan(networth), networth, n_groups)
+
+    return design
+
+
+def _group_layout(codes, mask, values, n_groups):
+    """
+    Sort the masked rows by group (and value) once and record group bounds.
+    """
+    rows = np.flatnonzero(mask & (codes >= 1) & (codes <= n_groups))
+    sort_keys = (codes[rows],) if values is None else (values[rows], codes[rows])
+    rows = rows[np.lexsort(sort_keys)]
+    bounds = np.searchsorted(codes[rows], np.arange(1, n_groups + 2))
+    return {
+        'rows': rows,
+        'bounds': bounds,
+        'values': None if values is None else values[rows]
+    }
+
+
+def _grouped_sums(layout, weights):
+    """
+    Sum each weight column over every group.
+    """
+    cumulative = np.cumsum(weights[layout['rows']], axis=0)
+    cumulative = np.vstack([np.zeros((1, weights.shape[1])), cumulative])
+    bounds = layout['bounds']
+    return cumulative[bounds[1:]] - cumulative[bounds[:-1]]
+
+
+def _grouped_medians(layout, weights):
+    """
+    Weighted median of every group for each weight column.
+
+    Uses the rule of grouped_weighted_quantiles: the first value whose
+    cumulative weight reaches half of the group's total weight.
+    """
+    bounds = layout['bounds']
+    result = np.full((len(bounds) - 1, weights.shape[1]), np.nan)
+    for g in range(len(bounds) - 1):
+        start, end = bounds[g], bounds[g + 1]
+        if end == start:
+            continue
+        group_weights = weights[layout['rows'][start:end]]
+        cumulative = np.cumsum(group_weights, axis=0)
+        totals = cumulative[-1]
+        idx = np.minimum((cumulative < totals / 2.0).sum(axis=0), end - start - 1)
+        result[g] = np.where(totals > 0, layout['values'][start:end][idx], np.nan)
+    return result
+
+
+def evaluate_statistics(design, multipliers):
+    """
+    Evaluate every statistic for a matrix of replicate multipliers.
+
+    Parameters:
+    - design: Output of prepare_design
+    - multipliers: (rows x replicates) factors applied to the base weights
+
+    Returns:
+    - Dictionary of statistic name -> (groups x replicates) array
+    """
+    weighted = multipliers * design['weights'][:, None]
+    results = {}
+    for key in ('wealth', 'income'):
+        totals = _grouped_sums(design[f'{key}_sum'], np.where(design['in_sample'][:, None], weighted, 0))
+        owned = _grouped_sums(design[f'{key}_sum'], np.where(design['owners'][:, None], weighted, 0))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            results[f'ownership_{key}'] = np.where(totals > 0, owned / totals * 100, np.nan)
+        results[f'median_value_{key}'] = _grouped_medians(design[f'{key}_median'], weighted)
+    results['median_networth'] = _grouped_medians(design['networth_median'], multipliers)
+    return results
+
+
+def bootstrap_multipliers(clusters, n_clusters, size, rng):
+    """
+    Draw household bootstrap multipliers: each column resamples the clusters
+    with replacement and every row gets its cluster's draw count.
+    """
+    counts = rng.multinomial(n_clusters, np.full(n_clusters, 1.0 / n_clusters), size=size)
+    return counts.T[clusters].astype(np.float64)
+
+
+def check_replicate_count(replicate_weights, n_replicates):
+    """
+    Raise a ValueError when a bootstrap without replicate weights is asked
+    for fewer than one replicate.
+    """
+    if replicate_weights is None and n_replicates < 1:
+        raise ValueError(f"n_replicates must be at least 1 without replicate weights, got {n_replicates}")
+
+
+def household_clusters(ids, n_rows):
+    """
+    Cluster code of every row for the household bootstrap and the number of
+    clusters; without household ids every row is its own cluster.
+    """
+    if ids is None:
+        return np.arange(n_rows), n_rows
+    clusters, households = pd.factorize(np.asarray(ids))
+    return clusters, len(households)
+
+
+def bootstrap_batches(n_replicates, batch_size=DEFAULT_BATCH_SIZE, seed=0):
+    """
+    Split n_replicates bootstrap draws into batches of at most batch_size,
+    each drawn from its own child of the seed.
+
+    Returns:
+    - List of (batch size, np.random.SeedSequence)
+    """
+    seeds = np.random.SeedSequence(seed).spawn((n_replicates + batch_size - 1) // batch_size)
+    return [(min(batch_size, n_replicates - i * batch_size), s) for i, s in enumerate(seeds)]
+
+
+def _init_worker(design):
+    global _DESIGN
+    _DESIGN = design
+
+
+def _run_task(func, args):
+    return func(_DESIGN, *args)
+
+
+def run_batches(tasks, design, workers=None):
+    """
+    Evaluate (func, args) tasks as func(design, *args), over a process pool
+    when there are several workers and tasks.
+
+    The design is sent to every worker once, at start-up, so func must be a
+    module-level function the workers can import.
+
+    Parameters:
+    - tasks: List of (func, args) tuples
+    - design: Data shared by every task
+    - workers: Number of worker processes (default: CPU count)
+
+    Returns:
+    - List of the task results, in order
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(tasks) > 1:
+        with futures.ProcessPoolExecutor(max_workers=min(workers, len(tasks)),
+                                         initializer=_init_worker, initargs=(design,)) as pool:
+            submitted = [pool.submit(_run_task, func, args) for func, args in tasks]
+            return [future.result() for future in submitted]
+    return [func(design, *args) for func, args in tasks]
+
+
+def _bootstrap_batch(design, clusters, n_clusters, size, seed):
+    rng = np.random.default_rng(seed)
+    return evaluate_statistics(design, bootstrap_multipliers(clusters, n_clusters, size, rng))
+
+
+def _multiplier_batch(design, multipliers):
+    return evaluate_statistics(design, multipliers)
+
+
+def replicate_standard_errors(df, stocks=None, replicate_weights=None, n_replicates=DEFAULT_REPLICATES,
+                              batch_size=DEFAULT_BATCH_SIZE, workers=None, seed=0, n_groups=5):
+    """
+    Standard errors of the viz3 statistics from replicates and implicates.
+
+    Parameters:
+    - df: SCF data with quintiles assigned; YY1/Y1 identify households and implicates
+    - stocks: Stock holdings of each row (default: the STOCKS column)
+    - replicate_weights: Optional (rows x replicates) array of replicate weights
+      aligned with df; without it a household bootstrap is used
+    - n_replicates: Number of bootstrap replicates
+    - batch_size: Replicates evaluated together in one weight matrix
+    - workers: Number of worker processes (default: CPU count)
+    - seed: Seed for the bootstrap draws
+    - n_groups: Number of quintile groups
+
+    Returns:
+    - Dictionary of statistic name -> array of standard errors per group
+    """
+    check_replicate_count(replicate_weights, n_replicates)
+
+    design = prepare_design(df, stocks, n_groups)
+    estimates = evaluate_statistics(design, np.ones((len(df), 1)))
+
+    # Build one task per batch of replicates
+    if replicate_weights is not None:
+        base = np.where(design['weights'] > 0, design['weights'], 1.0)
+        replicate_weights = np.asarray(replicate_weights, dtype=np.float64)
+        tasks = [
+            (_multiplier_batch, (replicate_weights[:, start:start + batch_size] / base[:, None],))
+            for start in range(0, replicate_weights.shape[1], batch_size)
+        ]
+    else:
+        clusters, n_clusters = household_clusters(df['YY1'] if 'YY1' in df.columns else None, len(df))
+        tasks = [
+            (_bootstrap_batch, (clusters, n_clusters, size, s))
+            for size, s in bootstrap_batches(n_replicates, batch_size, seed)
+        ]
+
+    batches = run_batches(tasks, design, workers)
+
+    replicates = {
+        name: np.concatenate([batch[name] for batch in batches], axis=1) for name in STATISTICS
+    }
+
+    # Imputation variance across implicates, evaluated as one indicator weight matrix
+    implicate_variance = {name: np.zeros(n_groups) for name in STATISTICS}
+    if 'Y1' in df.columns:
+        # Y1 = 10 * YY1 + implicate number
+        implicate = df['Y1'].to_numpy() % 10
+        implicates = np.unique(implicate)
+        if len(implicates) > 1:
+            indicators = (implicate[:, None] == implicates[None, :]).astype(np.float64)
+            by_implicate = evaluate_statistics(design, indicators)
+            m = len(implicates)
+            implicate_variance = {
+                name: (1 + 1 / m) * np.nanvar(by_implicate[name], axis=1, ddof=1)
+                for name in STATISTICS
+            }
+
+    errors = {}
+    for name in STATISTICS:
+        sampling_variance = np.nanmean((replicates[name] - estimates[name]) ** 2, axis=1)
+        errors[name] = np.sqrt(sampling_variance + implicate_variance[name])
+    return errors
+
+
+def load_replicate_weights(path, df, prefix='WT1B', multiplicity_prefix='MM', id_column='YY1'):
+    """
+    Load an SCF replicate weight file and align it with the rows of df.
+
+    Replicate weights are matched on the household id, so every implicate of
+    a household gets the same replicate weights. When multiplicity columns
+    (MM1, MM2, ...) are present, each replicate weight is multiplied by its
+    multiplicity, following the SCF documentation.
+
+    Returns:
+    - (rows x replicates) float32 array
+    """
+    header = pd.read_csv(path, nrows=0).columns
+    names = {name: name.upper() for name in header}
+    weight_cols = [name for name, upper in names.items() if upper.startswith(prefix)]
+    mult_cols = [name for name, upper in names.items() if upper.startswith(multiplicity_prefix)]
+    id_col = next(name for name, upper in names.items() if upper == id_column)
+
+    rw = pd.read_csv(path, usecols=[id_col] + weight_cols + mult_cols,
+                     dtype={col: np.float32 for col in weight_cols + mult_cols})
+    rw = rw.drop_duplicates(subset=id_col).set_index(id_col)
+    weights = rw[weight_cols].to_numpy()
+    if len(mult_cols) == len(weight_cols):
+        weights = weights * rw[mult_cols].to_numpy()
+
+    positions = rw.index.get_indexer(df[id_column])
+    if (positions < 0).any():
+        raise ValueError(f"{(positions < 0).sum()} rows have no replicate weights")
+    return weights[positions]
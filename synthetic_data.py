@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+synthetic_data.py - Synthetic, scalable inputs for the data processors
+
+Generates stand-ins for every processor input with the same columns and
+dtypes as the real files, at a multiple of the real row count:
+
+- synthetic_shares: the BEA "shares of NIPA totals" sheet (1,938 rows per
+  scale, as 19 more years per scale)
+- synthetic_table1data: the distributional PCE "table1data" sheet (529 rows
+  per scale, as 23 more years per scale)
+- synthetic_scf: an SCF summary extract (22,975 rows, i.e. 4,595 households
+  x 5 implicates, per scale) with the columns read by scf_loader
+- synthetic_swiid: a SWIID summary panel (about 6,400 rows, i.e. 199
+  countries, per scale)
+
+The values are random but shaped like the real data (decile shares sum to
+one, net worth is heavy-tailed, the market Gini exceeds the disposable Gini),
+so every code path of the processors is exercised. The same scale and seed
+always give the same data.
+
+Usage:
+    from synthetic_data import synthetic_scf
+    df = synthetic_scf(scale=10)
+
+    python synthetic_data.py --scale 10 --output-dir /tmp/synthetic
+"""
+
+import argparse
+import os
+
+from fiscal_data import (DECILE_METRICS, PCE_DECILES, PCE_SHEET, RANKING, SERIES_TYPES, SHARES_SHEET, TOP_METRICS,
+                         TOTAL_METRIC)
+from lazy_imports import lazy_import
+from scf_loader import scf_dtypes
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+FIRST_SHARES_YEAR = 2004
+SHARES_YEARS = 19
+FIRST_PCE_YEAR = 2000
+PCE_YEARS = 23
+SCF_HOUSEHOLDS = 4595
+SCF_IMPLICATES = 5
+SWIID_COUNTRIES = 199
+SWIID_YEARS = (1960, 2022)
+
+SHARES_RANKINGS = [RANKING, "Equivalized Personal Consumption Expenditure"]
+SUMMARY_METRICS = [TOTAL_METRIC, "Mean (Nominal)", "Mean ($2017)", "Median (Nominal)", "Median ($2017)"]
+
+# table1data rows read by the processors, followed by filler rows
+PCE_ROWS = [
+    "Personal Consumption Expenditures",
+    "Goods",
+    "Durable goods",
+    "Nondurable goods",
+    "Services",
+    "Household consumption expenditures (for services)",
+    "Final consumption expenditures of nonprofit institutions serving households (NPISHs) (132)"
+]
+PCE_ROWS += [f"Expenditure line {i}" for i in range(len(PCE_ROWS) + 1, 24)]
+
+
+def _decile_shares(rng, rows):
+    # Increasing shares that sum to one, like an income distribution
+    shares = np.sort(rng.gamma(2.0, 1.0, (rows, 10)), axis=1) + np.linspace(0.2, 2.0, 10)
+    return shares / shares.sum(axis=1, keepdims=True)
+
+
+def synthetic_shares(scale=1, seed=0):
+    """
+    Return a synthetic "shares of NIPA totals" sheet with 19 x scale years.
+    """
+    rng = np.random.default_rng([seed, 1])
+    years = np.arange(FIRST_SHARES_YEAR, FIRST_SHARES_YEAR + SHARES_YEARS * scale)
+    metrics = SUMMARY_METRICS + DECILE_METRICS + TOP_METRICS
+    groups = len(years) * len(SHARES_RANKINGS) * len(SERIES_TYPES)
+
+    totals = rng.uniform(500, 20000, groups)
+    deciles = _decile_shares(rng, groups)
+    values = np.column_stack([
+        totals,
+        rng.uniform(2e4, 2e5, (groups, 4)),
+        deciles,
+        deciles[:, -1:] * rng.uniform(0.5, 0.7, (groups, 1)),
+        deciles[:, -1:] * rng.uniform(0.2, 0.35, (groups, 1))
+    ])
+
+    year, ranking, series = (axis.ravel() for axis in np.meshgrid(
+        years, np.arange(len(SHARES_RANKINGS)), np.arange(len(SERIES_TYPES)), indexing='ij'))
+    rows = len(metrics)
+    return pd.DataFrame({
+        "Year": np.repeat(year, rows),
+        "Ranking": np.repeat(np.array(SHARES_RANKINGS, dtype=object)[ranking], rows),
+        "Series": np.repeat(np.array(SERIES_TYPES, dtype=object)[series], rows),
+        "NIPA Table21 LineNumber": np.repeat(27 + series, rows),
+        "Quantile or Summary Metric": np.tile(np.array(metrics, dtype=object), groups),
+        "Value": values.ravel()
+    })
+
+
+def synthetic_table1data(scale=1, seed=0):
+    """
+    Return a synthetic distributional PCE "table1data" sheet with 23 x scale years.
+    """
+    rng = np.random.default_rng([seed, 2])
+    years = np.arange(FIRST_PCE_YEAR, FIRST_PCE_YEAR + PCE_YEARS * scale)
+    rows = len(years) * len(PCE_ROWS)
+
+    df = pd.DataFrame({
+        "year": np.repeat(years, len(PCE_ROWS)),
+        "lineno": np.tile(np.arange(1, len(PCE_ROWS) + 1), len(years)),
+        "pce_mp": np.tile(np.arange(len(PCE_ROWS)) * 100, len(years)),
+        "pce_title": np.tile(np.array(PCE_ROWS, dtype=object), len(years)),
+        "Total": rng.uniform(50, 15000, rows)
+    })
+    df[PCE_DECILES] = _decile_shares(rng, rows)
+    return df
+
+
+def synthetic_scf(scale=1, seed=0):
+    """
+    Return a synthetic SCF extract with 4,595 x scale households and 5
+    implicates each, with the columns and dtypes of scf_loader.load_scf_data.
+    """
+    rng = np.random.default_rng([seed, 3])
+    households = SCF_HOUSEHOLDS * scale
+    n = households * SCF_IMPLICATES
+    household = np.repeat(np.arange(1, households + 1), SCF_IMPLICATES)
+    implicate = np.tile(np.arange(1, SCF_IMPLICATES + 1), households)
+
+    networth = np.round(np.exp(rng.normal(11, 2.5, n)) - rng.exponential(20000, n), -1)
+    income = np.round(np.exp(rng.normal(10.8, 0.9, n) + 2e-6 * np.clip(networth, 0, 1e6)), -1)
+    networth_rank = np.argsort(np.argsort(networth)) / n
+
+    df = pd.DataFrame({
+        'YY1': household,
+        'Y1': household * 10 + implicate,
+        'NWPCTLECAT': np.minimum((networth_rank * 12).astype(int) + 1, 12),
+        'INCQRTCAT': rng.integers(1, 5, n),
+        'INCPCTLECAT': rng.integers(1, 13, n),
+        'FINLIT': rng.integers(0, 4, n),
+        'EMERGBORR': rng.integers(0, 2, n),
+        'EMERGSAV': rng.integers(0, 2, n),
+        'EMERGPSTP': rng.integers(0, 2, n),
+        'EMERGCUT': rng.integers(0, 2, n),
+        'WGT': np.repeat(rng.uniform(500, 30000, households), SCF_IMPLICATES) / scale,
+        'NETWORTH': networth,
+        'INCOME': income,
+        'STOCKS': np.where(rng.random(n) < 0.2, np.round(np.exp(rng.normal(9, 2, n)), -2), 0),
+        'EQUITY': np.where(rng.random(n) < 0.5, np.round(np.exp(rng.normal(10, 2, n)), -2), 0),
+        'DEBT2INC': np.round(rng.exponential(0.5, n), 4)
+    })
+    dtypes = scf_dtypes()
+    return df.astype({col: dtypes[col] for col in df.columns})
+
+
+def synthetic_swiid(scale=1, seed=0):
+    """
+    Return a synthetic SWIID summary panel with 199 x scale countries.
+
+    Each country is observed over a contiguous run of years ending in 2022,
+    with market and disposable Ginis and their standard errors.
+    """
+    rng = np.random.default_rng([seed, 4])
+    n_countries = SWIID_COUNTRIES * scale
+    first_year, last_year = SWIID_YEARS
+    starts = rng.integers(first_year, last_year - 5, n_countries)
+    lengths = last_year - starts + 1
+    codes = np.repeat(np.arange(n_countries), lengths)
+    # Year within each country's run: position since the run started
+    offsets = np.arange(len(codes)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    years = starts[codes] + offsets
+
+    n = len(codes)
+    country_level = rng.uniform(35, 55, n_countries)[codes]
+    country_effect = rng.uniform(0.3, 0.9, n_countries)[codes]
+    gini_mkt = country_level + np.cumsum(rng.normal(0, 0.3, n)) * 0.1 + rng.normal(0, 1, n)
+    gini_disp = gini_mkt * country_effect + rng.normal(5, 1, n)
+    gini_mkt_se = rng.uniform(0.3, 2.0, n)
+    gini_disp_se = rng.uniform(0.3, 1.5, n)
+    abs_red_se = np.sqrt(gini_mkt_se ** 2 + gini_disp_se ** 2) * rng.uniform(0.3, 0.9, n)
+
+    names = pd.Categorical.from_codes(codes, [f"Country {i:06d}" for i in range(n_countries)])
+    return pd.DataFrame({
+        'country': names,
+        'year': years.astype(np.int16),
+        'gini_disp': gini_disp.astype(np.float32),
+        'gini_disp_se': gini_disp_se.astype(np.float32),
+        'gini_mkt': gini_mkt.astype(np.float32),
+        'gini_mkt_se': gini_mkt_se.astype(np.float32),
+        'abs_red_se': abs_red_se.astype(np.float32)
+    })
+
+
+def write_synthetic_inputs(output_dir, scale=1, seed=0):
+    """
+    Write every synthetic input to output_dir: CSVs for SCF and SWIID, and the
+    two sheets as workbooks when they fit in one Excel sheet (else as CSVs).
+
+    Returns:
+    - List of the files written
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for name, frame in (('SCFP_synthetic.csv', synthetic_scf(scale, seed)),
+                        ('swiid_synthetic.csv', synthetic_swiid(scale, seed))):
+        paths.append(os.path.join(output_dir, name))
+        frame.to_csv(paths[-1], index=False)
+
+    for name, sheet, frame in (('full_dataset_synthetic', SHARES_SHEET, synthetic_shares(scale, seed)),
+                               ('distributional_pce_synthetic', PCE_SHEET, synthetic_table1data(scale, seed))):
+        if len(frame) < 1048576:
+            paths.append(os.path.join(output_dir, f"{name}.xlsx"))
+            frame.to_excel(paths[-1], sheet_name=sheet, index=False)
+        else:
+            paths.append(os.path.join(output_dir, f"{name}.csv"))
+            frame.to_csv(paths[-1], index=False)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write synthetic inputs for the data processors")
+    parser.add_argument('--scale', type=int, default=1, help="Multiple of the real row counts")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed")
+    parser.add_argument('--output-dir', default='synthetic', help="Directory for the generated files")
+    args = parser.parse_args()
+
+    for path in write_synthetic_inputs(args.output_dir, args.scale, args.seed):
+        print(f"Wrote {path}")
+
+
+if __name__ == "__main__":
+    main()
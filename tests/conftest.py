@@ -0,0 +1,9 @@
+"""
+conftest.py - Shared pytest setup: the modules live at the repository root.
+"""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
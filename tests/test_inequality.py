@@ -0,0 +1,56 @@
+"""
+Tests for inequality.py: Gini coefficients against the pairwise definition
+and the standard errors on the process pool against a serial run.
+"""
+
+import numpy as np
+
+from inequality import inequality_standard_errors, inequality_statistics
+
+
+def pairwise_gini(values, weights):
+    """Sum of w_i w_j |x_i - x_j| over all pairs, divided by 2 W^2 times the weighted mean."""
+    total = weights.sum()
+    mean = (weights * values).sum() / total
+    differences = np.abs(values[:, None] - values[None, :])
+    return (weights[:, None] * weights[None, :] * differences).sum() / (2 * total ** 2 * mean)
+
+
+def sample(rng, n=600):
+    values = rng.lognormal(11, 1.5, n) - 2e4      # some negative net worth
+    values[:20] = values[20:40]                   # ties
+    weights = rng.random(n) * 1000
+    groups = rng.integers(1, 6, n).astype(float)
+    return values, weights, groups
+
+
+def test_gini_matches_pairwise_definition():
+    rng = np.random.default_rng(25)
+    values, weights, groups = sample(rng)
+    stats = inequality_statistics(values, weights, {'byWealth': groups})
+
+    for (name, group), gini in zip(stats['groups'], stats['gini']):
+        rows = np.ones(len(values), dtype=bool) if name == 'overall' else groups == group
+        np.testing.assert_allclose(gini, pairwise_gini(values[rows], weights[rows]), rtol=1e-10)
+
+
+def test_unweighted_gini_of_equal_values_is_zero():
+    stats = inequality_statistics(np.full(10, 3.0))
+    np.testing.assert_allclose(stats['gini'], [0.0], atol=1e-12)
+
+
+def test_standard_errors_do_not_depend_on_workers():
+    rng = np.random.default_rng(26)
+    values, weights, groups = sample(rng)
+    clusters = np.arange(len(values)) // 3
+    serial, parallel = (
+        inequality_standard_errors(values, weights, {'byWealth': groups}, clusters=clusters,
+                                   implicates=np.arange(len(values)) % 3 + 1, n_replicates=40,
+                                   batch_size=10, workers=workers)
+        for workers in (1, 2)
+    )
+    assert serial['groups'] == parallel['groups']
+    np.testing.assert_allclose(parallel['gini'], serial['gini'], rtol=1e-12)
+    np.testing.assert_allclose(parallel['top_shares'], serial['top_shares'], rtol=1e-12)
+    for name, errors in serial['ratios'].items():
+        np.testing.assert_allclose(parallel['ratios'][name], errors, rtol=1e-12)
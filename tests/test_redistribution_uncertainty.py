@@ -0,0 +1,60 @@
+"""
+Tests for redistribution_uncertainty.py: country means over panels with
+missing years and rank probabilities, against per-country and per-draw loops.
+"""
+
+import numpy as np
+import pandas as pd
+
+from redistribution_uncertainty import panel_arrays, rank_probabilities, simulate_country_means
+
+
+def gappy_panel(rng, n_countries=12):
+    rows = []
+    for i in range(n_countries):
+        # Each country covers a random subset of 1980-2020, so the years have gaps
+        for year in np.sort(rng.choice(np.arange(1980, 2021), size=rng.integers(1, 25), replace=False)):
+            gini_mkt = rng.uniform(35, 55)
+            rows.append({'country': f'C{i:02d}', 'year': int(year), 'gini_mkt': gini_mkt,
+                         'gini_disp': gini_mkt - rng.uniform(0, 20), 'gini_mkt_se': 0.0,
+                         'gini_disp_se': 0.0, 'abs_red_se': np.nan})
+    return pd.DataFrame(rows)
+
+
+def test_country_means_match_loop_with_year_gaps():
+    rng = np.random.default_rng(14)
+    df = gappy_panel(rng)
+    panel = panel_arrays(df)
+
+    # Zero standard errors: every draw is the observed mean relative redistribution
+    means = simulate_country_means(panel, 3, np.random.default_rng(0))
+
+    for i, country in enumerate(panel['countries']):
+        rows = df[df['country'] == country]
+        expected = ((rows['gini_mkt'] - rows['gini_disp']) / rows['gini_mkt'] * 100).mean()
+        np.testing.assert_allclose(means[i], expected, rtol=1e-5)
+
+
+def naive_rank_probabilities(means, top_n):
+    n_countries, n_draws = means.shape
+    top, bottom = np.zeros(n_countries), np.zeros(n_countries)
+    for draw in range(n_draws):
+        ranked = sorted((i for i in range(n_countries) if not np.isnan(means[i, draw])),
+                        key=lambda i: -means[i, draw])
+        for i in ranked[:top_n]:
+            top[i] += 1
+        for i in ranked[max(len(ranked) - top_n, 0):]:
+            bottom[i] += 1
+    return top / n_draws, bottom / n_draws
+
+
+def test_rank_probabilities_match_loop():
+    rng = np.random.default_rng(15)
+    means = rng.normal(30, 10, (20, 50))
+    means[3] = np.nan                        # a country without data
+    means[rng.random(means.shape) < 0.1] = np.nan
+    means[7] = means[8]                      # ties keep the country order
+
+    for top_n in (1, 5, 15, 25):
+        for result, expected in zip(rank_probabilities(means, top_n), naive_rank_probabilities(means, top_n)):
+            np.testing.assert_allclose(result, expected)
@@ -0,0 +1,32 @@
+"""
+Tests for viz2_data_processor.py: a rebuild reproduces the committed outputs.
+"""
+
+import os
+
+import pytest
+
+from conftest import ROOT
+from fiscal_data import INPUT_FILE, PCE_FILE, load_pce_table, load_shares
+from viz2_data_processor import process_sheets
+
+# Committed outputs of process_sheets, relative to data/
+OUTPUTS = ['viz2_data.json', 'viz2_groupings.json', 'viz2_data.bin', 'viz2/index.json', 'viz2/charts.json']
+
+
+@pytest.fixture(scope='module')
+def rebuilt(tmp_path_factory):
+    out = tmp_path_factory.mktemp('data')
+    df_shares = load_shares(os.path.join(ROOT, INPUT_FILE))
+    pce_data = load_pce_table(os.path.join(ROOT, PCE_FILE))
+    process_sheets(df_shares, pce_data, output_file=str(out / 'viz2_data.json'),
+                   packed_output_file=str(out / 'viz2_data.bin'), hash_file=str(out / 'hashes.json'),
+                   chart_dir=str(out / 'viz2'), groupings_output_file=str(out / 'viz2_groupings.json'))
+    return out
+
+
+@pytest.mark.parametrize('name', OUTPUTS)
+def test_rebuild_is_byte_identical(rebuilt, name):
+    with open(os.path.join(ROOT, 'data', name), 'rb') as f:
+        committed = f.read()
+    assert (rebuilt / name).read_bytes() == committed
@@ -0,0 +1,46 @@
+"""
+Tests for viz4_data_processing.py: rolling means over country-years with gaps.
+"""
+
+import numpy as np
+
+from viz4_data_processing import rolling_means
+
+
+def naive_rolling_means(codes, years, values, window):
+    """Mean of the non-missing values of the same country in [year - window + 1, year]."""
+    means = np.full(len(values), np.nan)
+    for i in range(len(values)):
+        rows = (codes == codes[i]) & (years > years[i] - window) & (years <= years[i]) & ~np.isnan(values)
+        if rows.any():
+            means[i] = values[rows].mean()
+    return means
+
+
+def test_rolling_means_match_loop_with_year_gaps():
+    rng = np.random.default_rng(13)
+    codes, years = [], []
+    for code in range(8):
+        # Each country covers a random subset of 1960-2020, so the years have gaps
+        covered = np.sort(rng.choice(np.arange(1960, 2021), size=rng.integers(1, 40), replace=False))
+        codes.extend([code] * len(covered))
+        years.extend(covered)
+    codes, years = np.array(codes), np.array(years)
+    values = rng.normal(5, 2, len(years))
+    values[rng.random(len(years)) < 0.1] = np.nan
+
+    # Shuffled rows: the result must come back in the input order
+    order = rng.permutation(len(years))
+    codes, years, values = codes[order], years[order], values[order]
+
+    for window in (1, 3, 5, 10):
+        np.testing.assert_allclose(rolling_means(codes, years, values, window),
+                                   naive_rolling_means(codes, years, values, window), rtol=1e-12)
+
+
+def test_rolling_means_skip_missing_years():
+    codes = np.array([0, 0, 0, 1])
+    years = np.array([2000, 2001, 2005, 2001])
+    values = np.array([1.0, 3.0, 10.0, 7.0])
+    # 2005 sees no other year of its country within a 4-year window
+    np.testing.assert_allclose(rolling_means(codes, years, values, 4), [1.0, 2.0, 10.0, 7.0])
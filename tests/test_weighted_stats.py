@@ -0,0 +1,46 @@
+"""
+Tests for weighted_stats.py: the single-sort grouped quantiles agree with a
+per-group loop.
+"""
+
+import numpy as np
+
+from weighted_stats import DISTRIBUTION_QUANTILES, grouped_weighted_median, grouped_weighted_quantiles
+
+
+def naive_weighted_quantile(values, weights, q):
+    """The first sorted value whose cumulative weight reaches q of the total."""
+    order = np.argsort(values, kind='stable')
+    cumsum_weights = np.cumsum(weights[order])
+    for value, cumulative in zip(values[order], cumsum_weights):
+        if cumulative >= q * cumsum_weights[-1]:
+            return value
+    return values[order][-1]
+
+
+def test_grouped_quantiles_match_per_group_loop():
+    rng = np.random.default_rng(5)
+    n_groups = 6
+    keys = rng.integers(1, n_groups + 1, 2000).astype(float)
+    keys[keys == 4] = 3  # group 4 is empty
+    values = rng.lognormal(10, 2, 2000) - 5e4
+    weights = rng.random(2000) * 100
+    values[rng.random(2000) < 0.05] = np.nan
+    keys[rng.random(2000) < 0.05] = np.nan
+
+    result = grouped_weighted_quantiles(keys, values, weights, DISTRIBUTION_QUANTILES, n_groups)
+
+    assert result.shape == (n_groups, len(DISTRIBUTION_QUANTILES))
+    for group in range(1, n_groups + 1):
+        rows = (keys == group) & ~np.isnan(values)
+        for j, q in enumerate(DISTRIBUTION_QUANTILES):
+            if rows.any():
+                assert result[group - 1, j] == naive_weighted_quantile(values[rows], weights[rows], q)
+            else:
+                assert np.isnan(result[group - 1, j])
+
+
+def test_grouped_median_matches_unweighted_median_of_odd_groups():
+    keys = np.array([1, 1, 1, 2, 2, 2, 2, 2])
+    values = np.array([3.0, 1.0, 2.0, 9.0, 5.0, 7.0, 6.0, 8.0])
+    np.testing.assert_array_equal(grouped_weighted_median(keys, values, np.ones(8), n_groups=2), [2.0, 7.0])
@@ -1,199 +1,622 @@
-import pandas as pd
+import argparse
+import hashlib
 import json
-import numpy as np
+import os
 
-def process_excel_to_json():
-    """Process Excel data and convert to JSON for viz2.js"""
-    print("Processing Excel data...")
-    
-    # Load Excel file
-    file_path = r"C:\Users\kuku-\Documents\GitHub\FinanceMyths\data\full_dataset.xlsx"
-    xls = pd.ExcelFile(file_path)
-    
-    # Load the "shares of NIPA totals" sheet
-    df_shares = pd.read_excel(xls, sheet_name="shares of NIPA totals")
-    
-    # Process data
-    years = list(range(2004, 2023))  # 2004 to 2022
-    categories = ["0-20%", "20-40%", "40-60%", "60-80%", "80-100%"]
-    series_types = ["Disposable Personal Income", "Personal Consumption Expenditures", "Personal Saving"]
-    
-    # Prepare result structure
-    result = {
-        "years": years,
-        "categories": categories,
-        "seriesTypes": series_types,
-        "yearlyData": {}
+import data_cube
+import fiscal_data
+from data_cube import DataCube
+from excel_cache import CACHE_DIR, file_digest
+from fiscal_data import (GROUPINGS, INPUT_FILE, PCE_DECILES, PCE_FILE, RANKING, SERIES_TYPES, TOTAL_METRIC,
+                         load_groupings, load_pce_table, load_shares, write_json)
+from instrumentation import add_trace_arguments, configure, nbytes, stage, traced
+from lazy_imports import lazy_import
+from packed_data import write_packed
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+# Configure paths
+OUTPUT_FILE = 'data/viz2_data.json'
+PACKED_OUTPUT_FILE = 'data/viz2_data.bin'
+# Groupings other than the top-level one (deciles, top groups), kept out of
+# the files viz2.js loads
+GROUPINGS_OUTPUT_FILE = 'data/viz2_groupings.json'
+# Index with the first chart, loaded first by viz2.js
+CHART_DIR = 'data/viz2'
+INDEX_NAME = 'index.json'
+# Chart series of every view, bound directly to D3 by viz2.js
+CHARTS_NAME = 'charts.json'
+# Per-year input hashes of the current output, used by --incremental
+HASH_FILE = os.path.join(CACHE_DIR, 'viz2-year-hashes.json')
+
+FIRST_YEAR = 2004  # Every later year in the shares sheet is processed
+
+# table1data expenditure rows behind each consumption ratio
+PCE_TITLES = {
+    "Household Consumption Ratio": "Household consumption expenditures (for services)",
+    "Nondurable Goods Ratio": "Nondurable goods",
+    "Durable Goods Ratio": "Durable goods",
+    "Nonprofit Consumption Ratio": "Final consumption expenditures of nonprofit institutions serving households (NPISHs) (132)"
+}
+
+RATIO_TYPES = ["Total Consumption Ratio"] + list(PCE_TITLES)
+
+# Keys of the ratio line chart points in viz2.js -> ratio type
+CHART_RATIOS = {
+    "Household": "Household Consumption Ratio",
+    "Nondurable": "Nondurable Goods Ratio",
+    "Durable": "Durable Goods Ratio",
+    "Nonprofit": "Nonprofit Consumption Ratio",
+    "Total": "Total Consumption Ratio"
+}
+
+# viz2.js view -> series drawn as stacked areas
+STACKED_VIEWS = {"income": SERIES_TYPES[0], "consumption": SERIES_TYPES[1]}
+
+# Placeholder ratios (base, spread) used when PCE data is not available
+PLACEHOLDER_RATIOS = [[50, 20], [25, 10], [15, 10], [2, 2]]
+# Seed of the placeholder draws, so a rebuild reproduces the committed output
+PLACEHOLDER_SEED = 0
+
+
+@traced('viz2.compute_income')
+def compute_income(df_shares, years, groupings=None):
+    """
+    Build absolute income values for every year, series and group in one pass.
+
+    The sheet is filtered once into a cube of share * total per year, series
+    and quantile metric; every grouping is a roll-up of that cube.
+
+    Parameters:
+    - df_shares: The "shares of NIPA totals" sheet
+    - years: Years to compute
+    - groupings: Dictionary in the form of fiscal_data.GROUPINGS (default: quintiles)
+
+    Returns:
+    - Dictionary of grouping name -> DataCube (year x series x group) of share
+      * total sums, whose counts are the quantile rows behind each cell
+    """
+    groupings = groupings or {"quintiles": GROUPINGS["quintiles"]}
+    metrics = list(dict.fromkeys(
+        metric for groups in groupings.values() for members, _ in groups.values() for metric in members
+    ))
+
+    df = df_shares[
+        (df_shares["Ranking"] == RANKING) &
+        (df_shares["Series"].isin(SERIES_TYPES)) &
+        (df_shares["Year"].isin(years))
+    ]
+    year_idx = pd.Index(years).get_indexer(df["Year"])
+    series_idx = pd.Index(SERIES_TYPES).get_indexer(df["Series"])
+    metric = df["Quantile or Summary Metric"]
+    values = df["Value"].to_numpy(dtype=float)
+
+    # First total row per (year, series), 0 when missing
+    totals = np.zeros((len(years), len(SERIES_TYPES)))
+    is_total = (metric == TOTAL_METRIC).to_numpy()
+    total_keys = pd.DataFrame({"year": year_idx[is_total], "series": series_idx[is_total]})
+    first = ~total_keys.duplicated().to_numpy()
+    totals[total_keys["year"][first], total_keys["series"][first]] = values[is_total][first]
+
+    # Multiply share by total to get the absolute value of every quantile metric
+    amounts = pd.DataFrame({
+        "Year": df["Year"].to_numpy(),
+        "Series": df["Series"].to_numpy(),
+        "Metric": metric.to_numpy(),
+        "Value": values * totals[year_idx, series_idx]
+    })
+    cube = DataCube.from_frame(amounts, {"year": "Year", "series": "Series", "metric": "Metric"}, "Value",
+                               labels={"year": years, "series": SERIES_TYPES, "metric": metrics})
+
+    return {
+        name: cube.roll_up("metric", {group: members for group, (members, _) in groups.items()})
+        for name, groups in groupings.items()
     }
-    
-    # Process data for each year
-    for year in years:
-        print(f"Processing year {year}...")
-        
-        # Process income data
-        income_data = {}
-        
-        for series_type in series_types:
-            # Filter data for this series and year
-            df_series = df_shares[
-                (df_shares["Ranking"] == "Equivalized Disposable Personal Income") &
-                (df_shares["Series"] == series_type) &
-                (df_shares["Year"] == year)
-            ].copy()
-            
-            # Get total value
-            total_value = df_series[
-                df_series["Quantile or Summary Metric"] == "Total ($ Billions)"
-            ]["Value"].values[0] if not df_series[
-                df_series["Quantile or Summary Metric"] == "Total ($ Billions)"
-            ].empty else 0
-            
-            # Create quantile mapping as in charles 189.py
-            quantile_mapping = {
-                "0-10%": "0-20%",
-                "10-20%": "0-20%",
-                "20-30%": "20-40%",
-                "30-40%": "20-40%",
-                "40-50%": "40-60%",
-                "50-60%": "40-60%",
-                "60-70%": "60-80%",
-                "70-80%": "60-80%",
-                "80-90%": "80-100%",
-                "90-100%": "80-100%",
-            }
-            
-            # Initialize category values
-            category_values = {category: 0 for category in categories}
-            
-            # Process each row
-            for _, row in df_series.iterrows():
-                quantile = row["Quantile or Summary Metric"]
-                if quantile in quantile_mapping:
-                    category = quantile_mapping[quantile]
-                    # Multiply share by total to get absolute value
-                    category_values[category] += row["Value"] * total_value
-            
-            income_data[series_type] = category_values
-        
-        # Load PCE data for consumption breakdowns
+
+
+@traced('viz2.compute_pce_values')
+def compute_pce_values(pce_data, years, groupings=None):
+    """
+    Compute absolute PCE values per year, ratio type and group.
+
+    Returns:
+    - Dictionary of grouping name -> DataCube (year x title x group) for the
+      PCE-based ratios, 0 for groups without table1data columns
+    - Boolean per year saying whether the required rows were found
+    """
+    groupings = groupings or {"quintiles": GROUPINGS["quintiles"]}
+    titles = list(PCE_TITLES.values())
+    pce_rows = pce_data[pce_data["year"].isin(years) & pce_data["pce_title"].isin(titles)]
+    pce_rows = pce_rows.drop_duplicates(subset=["year", "pce_title"])
+
+    year_idx = pd.Index(years).get_indexer(pce_rows["year"])
+    title_idx = pd.Index(titles).get_indexer(pce_rows["pce_title"])
+
+    found = np.zeros((len(years), len(titles)), dtype=bool)
+    found[year_idx, title_idx] = True
+
+    # Decile shares and totals per year and title, 0 where no row was found
+    shares = np.zeros((len(years), len(titles), len(PCE_DECILES)))
+    shares[year_idx, title_idx] = pce_rows[PCE_DECILES].fillna(0).to_numpy(dtype=float)
+    totals = np.zeros((len(years), len(titles)))
+    totals[year_idx, title_idx] = pce_rows["Total"].to_numpy(dtype=float)
+    cube = DataCube(shares, {"year": years, "title": titles, "decile": PCE_DECILES},
+                    np.repeat(found[..., None], len(PCE_DECILES), axis=-1))
+
+    # Sum the decile shares making up each group
+    values = {}
+    for name, groups in groupings.items():
+        rolled = cube.roll_up("decile", {group: columns for group, (_, columns) in groups.items()})
+        axes = {"year": years, "title": titles, "group": rolled.labels("decile")}
+        values[name] = DataCube(rolled.values * totals[..., None], axes, rolled.counts)
+
+    # Household, nondurable and durable rows are required; nonprofit defaults to 0
+    available = found[:, :3].all(axis=1)
+
+    return values, available
+
+
+@traced('viz2.compute_ratios')
+def compute_ratios(income, pce_values, pce_available, pce_groups=None, rng=None):
+    """
+    Compute the consumption ratio block for every year and group.
+
+    Parameters:
+    - income: One grouping's cube from compute_income
+    - pce_values, pce_available: The grouping's PCE cube and the per-year
+      availability from compute_pce_values
+    - pce_groups: Boolean per group, False for groups without table1data
+      columns, whose PCE-based ratios are NaN (default: all True)
+    - rng: np.random.RandomState of the placeholder draws (default: the global one)
+
+    Returns a (years x groups x ratio types) array and a mask of the cells
+    with positive disposable income.
+    """
+    disposable, consumption = SERIES_TYPES[:2]
+    positive = income.sel(series=disposable).filled() > 0
+    if pce_groups is None:
+        pce_groups = np.ones(positive.shape[1], dtype=bool)
+
+    ratios = np.zeros(positive.shape + (len(RATIO_TYPES),))
+    ratios[..., 0] = income.ratio("series", consumption, disposable, scale=100).values
+    safe_income = np.where(positive, income.sel(series=disposable).values, 1)
+    ratios[..., 1:] = ((pce_values.values / safe_income[:, None, :]) * 100).transpose(0, 2, 1)
+    ratios[:, ~pce_groups, 1:] = np.nan
+
+    # Fallback if PCE data not available, drawn in year/group order
+    placeholder = positive & ~pce_available[:, None] & pce_groups
+    base, spread = np.array(PLACEHOLDER_RATIOS).T
+    draws = (rng or np.random).rand(int(placeholder.sum()), len(PLACEHOLDER_RATIOS))
+    ratios[..., 1:][placeholder] = base + draws * spread
+
+    return ratios, positive
+
+
+def year_hashes(df, year_column, columns):
+    """
+    Hash the rows of every year independently of their order in the sheet.
+
+    Returns:
+    - Dictionary of year -> hex digest
+    """
+    row_hashes = pd.util.hash_pandas_object(df[columns], index=False).to_numpy()
+    year_values = df[year_column].to_numpy()
+    order = np.lexsort((row_hashes, year_values))
+    year_values, row_hashes = year_values[order], row_hashes[order]
+
+    unique_years, starts = np.unique(year_values, return_index=True)
+    ends = np.append(starts[1:], len(year_values))
+    return {
+        int(year): hashlib.sha256(row_hashes[start:end].tobytes()).hexdigest()
+        for year, start, end in zip(unique_years, starts, ends)
+    }
+
+
+def input_hashes(df_shares, pce_data, years):
+    """
+    Combine the shares and table1data hashes of each year into one digest.
+    """
+    shares = df_shares[(df_shares["Ranking"] == RANKING) & (df_shares["Series"].isin(SERIES_TYPES))]
+    share_hashes = year_hashes(shares, "Year", ["Series", "Quantile or Summary Metric", "Value"])
+    pce_hashes = {}
+    if pce_data is not None:
+        pce_columns = ["pce_title", "Total"] + PCE_DECILES
+        pce_hashes = year_hashes(pce_data, "year", pce_columns)
+
+    return {
+        str(year): hashlib.sha256(f"{share_hashes.get(year, '')}:{pce_hashes.get(year, '')}".encode()).hexdigest()
+        for year in years
+    }
+
+
+def build_yearly_data(df_shares, pce_data, years, groupings=None, rng=None):
+    """
+    Compute the yearlyData entries of the given years for every grouping.
+
+    rng is passed on to compute_ratios for the placeholder draws.
+
+    Returns:
+    - Dictionary of grouping name -> yearlyData entries
+    """
+    groupings = groupings or {"quintiles": GROUPINGS["quintiles"]}
+    income = compute_income(df_shares, years, groupings)
+
+    # Fallback if PCE data not available
+    pce_values = {
+        name: DataCube(np.zeros((len(years), len(PCE_TITLES), len(groups))),
+                       {"year": years, "title": list(PCE_TITLES.values()), "group": list(groups)})
+        for name, groups in groupings.items()
+    }
+    pce_available = np.zeros(len(years), dtype=bool)
+    if pce_data is not None:
         try:
-            pce_file_path = r"C:\Users\kuku-\Documents\GitHub\FinanceMyths\data\distributional-pce-2000-2022.xlsx"
-            pce_data = pd.read_excel(pce_file_path, sheet_name="table1data")
-            
-            # Filter for the current year
-            pce_year_data = pce_data[pce_data["year"] == year]
-            
-            # Get main consumption categories
-            household_consumption = pce_year_data[pce_year_data["pce_title"] == "Household consumption expenditures (for services)"]
-            durable_goods = pce_year_data[pce_year_data["pce_title"] == "Durable goods"]
-            nondurable_goods = pce_year_data[pce_year_data["pce_title"] == "Nondurable goods"]
-            nonprofit_consumption = pce_year_data[pce_year_data["pce_title"] == "Final consumption expenditures of nonprofit institutions serving households (NPISHs) (132)"]
-            
-            # Process consumption ratios
-            ratio_data = {}
-            
-            for category in categories:
-                disposable_income = income_data["Disposable Personal Income"][category]
-                
-                if disposable_income > 0:
-                    # Map from data columns to category ranges
-                    col_mapping = {
-                        "0-20%": ["Decile1", "Decile2"],
-                        "20-40%": ["Decile3", "Decile4"],
-                        "40-60%": ["Decile5", "Decile6"],
-                        "60-80%": ["Decile7", "Decile8"],
-                        "80-100%": ["Decile9", "Decile10"]
-                    }
-                    
-                    # Calculate consumption ratios from PCE data
-                    if not household_consumption.empty and not durable_goods.empty and not nondurable_goods.empty:
-                        # Get column names for this category
-                        cols = col_mapping[category]
-                        
-                        # Sum the values for the two deciles
-                        hc_share = household_consumption[cols].sum(axis=1).values[0] if not household_consumption.empty else 0
-                        dg_share = durable_goods[cols].sum(axis=1).values[0] if not durable_goods.empty else 0
-                        ndg_share = nondurable_goods[cols].sum(axis=1).values[0] if not nondurable_goods.empty else 0
-                        npc_share = nonprofit_consumption[cols].sum(axis=1).values[0] if not nonprofit_consumption.empty else 0
-                        
-                        # Get total values
-                        hc_total = household_consumption["Total"].values[0] if not household_consumption.empty else 0
-                        dg_total = durable_goods["Total"].values[0] if not durable_goods.empty else 0
-                        ndg_total = nondurable_goods["Total"].values[0] if not nondurable_goods.empty else 0
-                        npc_total = nonprofit_consumption["Total"].values[0] if not nonprofit_consumption.empty else 0
-                        
-                        # Calculate absolute values
-                        hc_value = hc_share * hc_total
-                        dg_value = dg_share * dg_total
-                        ndg_value = ndg_share * ndg_total
-                        npc_value = npc_share * npc_total
-                        
-                        # Calculate ratios to disposable income
-                        hc_ratio = (hc_value / disposable_income) * 100
-                        dg_ratio = (dg_value / disposable_income) * 100
-                        ndg_ratio = (ndg_value / disposable_income) * 100
-                        npc_ratio = (npc_value / disposable_income) * 100
-                        
-                        # Store ratios
-                        ratio_data[category] = {
-                            "Total Consumption Ratio": (income_data["Personal Consumption Expenditures"][category] / disposable_income) * 100,
-                            "Household Consumption Ratio": hc_ratio,
-                            "Nondurable Goods Ratio": ndg_ratio,
-                            "Durable Goods Ratio": dg_ratio,
-                            "Nonprofit Consumption Ratio": npc_ratio
-                        }
-                    else:
-                        # Fallback if PCE data not available
-                        ratio_data[category] = {
-                            "Total Consumption Ratio": (income_data["Personal Consumption Expenditures"][category] / disposable_income) * 100,
-                            "Household Consumption Ratio": 50 + np.random.rand() * 20, # placeholder
-                            "Nondurable Goods Ratio": 25 + np.random.rand() * 10,     # placeholder
-                            "Durable Goods Ratio": 15 + np.random.rand() * 10,        # placeholder
-                            "Nonprofit Consumption Ratio": 2 + np.random.rand() * 2    # placeholder
-                        }
-                else:
-                    ratio_data[category] = {
-                        "Total Consumption Ratio": 0,
-                        "Household Consumption Ratio": 0,
-                        "Nondurable Goods Ratio": 0, 
-                        "Durable Goods Ratio": 0,
-                        "Nonprofit Consumption Ratio": 0
-                    }
+            pce_values, pce_available = compute_pce_values(pce_data, years, groupings)
         except Exception as e:
             print(f"Error processing PCE data: {e}")
-            # Fallback if PCE file not available
-            ratio_data = {}
-            for category in categories:
-                disposable_income = income_data["Disposable Personal Income"][category]
-                
-                if disposable_income > 0:
-                    ratio_data[category] = {
-                        "Total Consumption Ratio": (income_data["Personal Consumption Expenditures"][category] / disposable_income) * 100,
-                        "Household Consumption Ratio": 50 + np.random.rand() * 20, # placeholder
-                        "Nondurable Goods Ratio": 25 + np.random.rand() * 10,     # placeholder
-                        "Durable Goods Ratio": 15 + np.random.rand() * 10,        # placeholder
-                        "Nonprofit Consumption Ratio": 2 + np.random.rand() * 2    # placeholder
+
+    result = {}
+    for name, groups in groupings.items():
+        categories = list(groups)
+        pce_groups = np.array([bool(columns) for _, columns in groups.values()])
+        ratios, positive = compute_ratios(income[name], pce_values[name], pce_available, pce_groups, rng)
+
+        yearly_data = {}
+        income_values = income[name].values.tolist()
+        counts = income[name].counts
+        ratio_values = ratios.tolist()
+        for y, year in enumerate(years):
+            with stage('viz2.year', year=year, grouping=name):
+                income_data = {
+                    series_type: {
+                        category: income_values[y][s][c] if counts[y, s, c] else 0
+                        for c, category in enumerate(categories)
                     }
-                else:
-                    ratio_data[category] = {
-                        "Total Consumption Ratio": 0,
-                        "Household Consumption Ratio": 0,
-                        "Nondurable Goods Ratio": 0, 
-                        "Durable Goods Ratio": 0,
-                        "Nonprofit Consumption Ratio": 0
+                    for s, series_type in enumerate(SERIES_TYPES)
+                }
+                ratio_data = {
+                    category: {
+                        # NaN (no PCE breakdown for the group) is written as null
+                        ratio_type: value if value == value else None
+                        for ratio_type, value in zip(
+                            RATIO_TYPES, ratio_values[y][c] if positive[y, c] else [0] * len(RATIO_TYPES))
                     }
-        
-        # Add year data to result
-        result["yearlyData"][str(year)] = {
-            "income": income_data,
-            "ratios": ratio_data
+                    for c, category in enumerate(categories)
+                }
+
+                yearly_data[str(year)] = {
+                    "income": income_data,
+                    "ratios": ratio_data
+                }
+        result[name] = yearly_data
+
+    return result
+
+
+def code_fingerprint(groupings=None):
+    """
+    Hash this script, the shared fiscal_data and data_cube modules, which
+    shape the output, and the grouping specs.
+    """
+    digests = [file_digest(path) for path in (__file__, fiscal_data.__file__, data_cube.__file__)]
+    digests.append(json.dumps(groupings, sort_keys=True))
+    return hashlib.sha256("".join(digests).encode("utf-8")).hexdigest()
+
+
+def load_previous_output(code_digest, output_file=OUTPUT_FILE, groupings_output_file=GROUPINGS_OUTPUT_FILE,
+                         hash_file=HASH_FILE):
+    """
+    Return the yearlyData of every grouping of the existing output and its
+    per-year hashes if they can be reused.
+
+    Both are discarded when any file is missing or the processor code or
+    grouping specs have changed since they were written.
+
+    Returns:
+    - (grouping name -> yearlyData, year -> input hash), or (None, {})
+    """
+    try:
+        with open(output_file) as f:
+            previous = json.load(f)
+        with open(groupings_output_file) as f:
+            previous_groupings = json.load(f)
+        with open(hash_file) as f:
+            hashes = json.load(f)
+    except (OSError, ValueError):
+        return None, {}
+    if hashes.get("code") != code_digest:
+        return None, {}
+    previous_data = {previous_groupings.get("grouping"): previous["yearlyData"]}
+    for name, grouping in previous_groupings.get("groupings", {}).items():
+        previous_data[name] = grouping["yearlyData"]
+    return previous_data, hashes.get("years", {})
+
+
+def pack_result(result):
+    """
+    Arrange the yearlyData entries as dense income and ratio arrays.
+    Missing ratios are NaN.
+    """
+    categories = result["categories"]
+    yearly = [result["yearlyData"][str(year)] for year in result["years"]]
+    income = [[[entry["income"][s][c] for c in categories] for s in SERIES_TYPES] for entry in yearly]
+    ratios = [[[entry["ratios"][c][r] for r in RATIO_TYPES] for c in categories] for entry in yearly]
+    return {"income": np.array(income, dtype=float), "ratios": np.array(ratios, dtype=float)}
+
+
+def stacked_series(years, categories, values):
+    """
+    Stack one series' values per category into the layers of a stacked area chart.
+
+    Parameters:
+    - years: Years of the rows of values
+    - categories: Categories of the columns of values, bottom layer first
+    - values: (years x categories) array
+
+    Returns:
+    - {"years", "layers": [{"key", "values", "points": [[y0, y1], ...]}],
+      "totals", "max"}, where y0 and y1 are the baseline and top of a layer
+    """
+    top = np.cumsum(values, axis=1)
+    bottom = np.concatenate([np.zeros((len(years), 1)), top[:, :-1]], axis=1)
+    return {
+        "years": years,
+        "layers": [
+            {
+                "key": category,
+                "values": values[:, c].tolist(),
+                "points": np.stack([bottom[:, c], top[:, c]], axis=1).tolist()
+            }
+            for c, category in enumerate(categories)
+        ],
+        "totals": top[:, -1].tolist() if len(categories) else [0.0] * len(years),
+        "max": float(top.max()) if top.size else 0.0
+    }
+
+
+def line_series(years, categories, values):
+    """
+    Arrange one series' values per category as the points of a line chart.
+
+    Returns:
+    - {"years", "series": [{"key", "points": [{"year", "value"}, ...]}], "min", "max"}
+    """
+    return {
+        "years": years,
+        "series": [
+            {"key": category, "points": [{"year": year, "value": value} for year, value in zip(years, column)]}
+            for category, column in zip(categories, values.T.tolist())
+        ],
+        "min": float(values.min()) if values.size else 0.0,
+        "max": float(values.max()) if values.size else 0.0
+    }
+
+
+def result_arrays(result):
+    """
+    Return the top-level grouping's income as a dictionary of series ->
+    (years x categories) array and its ratios as a (years x categories x
+    ratio types) array, with missing values as 0.
+    """
+    yearly = [result["yearlyData"][str(year)] for year in result["years"]]
+    categories = result["categories"]
+    income = {
+        series: np.array([[entry["income"][series][c] or 0 for c in categories] for entry in yearly],
+                         dtype=float).reshape(len(yearly), len(categories))
+        for series in SERIES_TYPES
+    }
+    ratios = np.array([[[entry["ratios"][c][r] or 0 for r in RATIO_TYPES] for c in categories] for entry in yearly],
+                      dtype=float).reshape(len(yearly), len(categories), len(RATIO_TYPES))
+    return income, ratios
+
+
+def chart_series(result):
+    """
+    Build the series every view of viz2.js draws, so the browser binds them
+    to D3 without reshaping: stacked areas for income and consumption, lines
+    for savings and one ratio line chart per category.
+    """
+    years = result["years"]
+    categories = result["categories"]
+    income, ratios = result_arrays(result)
+
+    charts = {view: stacked_series(years, categories, income[series]) for view, series in STACKED_VIEWS.items()}
+    charts["savings"] = line_series(years, categories, income[SERIES_TYPES[2]])
+
+    columns = [RATIO_TYPES.index(ratio_type) for ratio_type in CHART_RATIOS.values()]
+    charts["ratio"] = {
+        category: [
+            dict(year=year, **dict(zip(CHART_RATIOS, values)))
+            for year, values in zip(years, ratios[:, c, columns].tolist())
+        ]
+        for c, category in enumerate(categories)
+    }
+    return charts
+
+
+def chart_index(result, income_chart):
+    """
+    Build the index of the chart output.
+
+    It carries everything the first chart needs: the labels, the yearly
+    total of every series and the income chart series.
+    """
+    income, _ = result_arrays(result)
+    return {
+        "years": result["years"],
+        "categories": result["categories"],
+        "seriesTypes": SERIES_TYPES,
+        "ratioTypes": RATIO_TYPES,
+        "totals": {series: values.sum(axis=1).tolist() for series, values in income.items()},
+        "charts": {"income": income_chart}
+    }
+
+
+def write_chart_files(result, chart_dir=CHART_DIR):
+    """
+    Write the index and the chart series of every view to chart_dir.
+    """
+    os.makedirs(chart_dir, exist_ok=True)
+    charts = chart_series(result)
+    write_json(charts, os.path.join(chart_dir, CHARTS_NAME), compact=True)
+    write_json(chart_index(result, charts["income"]), os.path.join(chart_dir, INDEX_NAME), compact=True)
+
+
+def process_excel_to_json(incremental=False, groupings=None):
+    """
+    Process Excel data and convert to JSON for viz2.js
+
+    With incremental=True, only years whose input rows changed (or that are
+    missing from the existing output) are recomputed; the other years are
+    copied from the existing output. groupings selects the resolutions to
+    compute (default: every grouping of fiscal_data.GROUPINGS).
+    """
+    print("Processing Excel data...")
+
+    # Load the "shares of NIPA totals" sheet
+    with stage('viz2.load_shares', input_file=INPUT_FILE) as s:
+        df_shares = load_shares(INPUT_FILE)
+        s.set(bytes_in=nbytes(INPUT_FILE), rows_out=len(df_shares), bytes_out=nbytes(df_shares))
+
+    # Load PCE data for consumption breakdowns
+    try:
+        with stage('viz2.load_pce', input_file=PCE_FILE) as s:
+            pce_data = load_pce_table(PCE_FILE)
+            s.set(bytes_in=nbytes(PCE_FILE), rows_out=len(pce_data), bytes_out=nbytes(pce_data))
+    except Exception as e:
+        print(f"Error processing PCE data: {e}")
+        pce_data = None
+
+    process_sheets(df_shares, pce_data, incremental, groupings=groupings)
+
+
+def process_sheets(df_shares, pce_data, incremental=False, output_file=OUTPUT_FILE,
+                   packed_output_file=PACKED_OUTPUT_FILE, hash_file=HASH_FILE, groupings=None,
+                   chart_dir=CHART_DIR, groupings_output_file=GROUPINGS_OUTPUT_FILE):
+    """
+    Build the viz2 outputs from the parsed sheets.
+
+    The first grouping fills the categories and yearlyData of the files read
+    by viz2.js; the others are written to groupings_output_file, under
+    "groupings" with their own categories and yearlyData. Groups without
+    table1data columns (the top groups) have null PCE-based ratios there.
+
+    Parameters:
+    - df_shares: The "shares of NIPA totals" sheet
+    - pce_data: The "table1data" sheet, or None when it could not be loaded
+    - incremental: Reuse the years of the existing output whose inputs are unchanged
+    - output_file, packed_output_file, hash_file: Where the JSON, packed
+      arrays and per-year input hashes are written
+    - groupings: Dictionary in the form of fiscal_data.GROUPINGS (default: all of them)
+    - chart_dir: Directory of the index and chart series (see write_chart_files)
+    - groupings_output_file: Where the groupings other than the first are written
+    """
+    groupings = groupings or GROUPINGS
+    names = list(groupings)
+    years = sorted(int(year) for year in df_shares["Year"].unique() if year >= FIRST_YEAR)
+    with stage('viz2.input_hashes', rows_in=len(df_shares) + (0 if pce_data is None else len(pce_data))):
+        hashes = input_hashes(df_shares, pce_data, years)
+    code_digest = code_fingerprint(groupings)
+
+    previous_data, previous_hashes = (
+        load_previous_output(code_digest, output_file, groupings_output_file, hash_file) if incremental else (None, {})
+    )
+    if previous_data is None or any(name not in previous_data for name in names):
+        # No usable output, or one written before its groupings existed
+        changed = years
+    else:
+        changed = [
+            year for year in years
+            if previous_hashes.get(str(year)) != hashes[str(year)] or str(year) not in previous_data[names[0]]
+        ]
+        print(f"Recomputing {len(changed)} of {len(years)} years: {changed}")
+
+    with stage('viz2.build_yearly_data', years=len(changed), groupings=len(names)):
+        rng = np.random.RandomState(PLACEHOLDER_SEED)
+        yearly_data = build_yearly_data(df_shares, pce_data, changed, groupings, rng) if changed else {}
+
+    def merged(name):
+        computed = yearly_data.get(name, {})
+        return {
+            str(year): computed[str(year)] if str(year) in computed else previous_data[name][str(year)]
+            for year in years
+        }
+
+    # Prepare result structure
+    result = {
+        "years": years,
+        "categories": list(groupings[names[0]]),
+        "seriesTypes": SERIES_TYPES,
+        "yearlyData": merged(names[0])
+    }
+    other_groupings = {
+        "years": years,
+        "seriesTypes": SERIES_TYPES,
+        "ratioTypes": RATIO_TYPES,
+        "grouping": names[0],
+        "groupings": {
+            name: {"categories": list(groupings[name]), "yearlyData": merged(name)}
+            for name in names[1:]
         }
-    
+    }
+
     # Save to JSON file
-    with open('data/viz2_data.json', 'w') as f:
-        json.dump(result, f, indent=2)
-    
-    print("Processing complete! JSON saved to data/viz2_data.json")
+    with stage('viz2.save_json', output_file=output_file) as s:
+        write_json(result, output_file)
+        s.set(bytes_out=nbytes(output_file))
+
+    # Save the other groupings separately, so viz2.js does not download them
+    with stage('viz2.save_groupings', output_file=groupings_output_file) as s:
+        write_json(other_groupings, groupings_output_file, compact=True)
+        s.set(bytes_out=nbytes(groupings_output_file))
+
+    # Save the same cube as packed float32 arrays for the browser
+    with stage('viz2.save_packed', output_file=packed_output_file) as s:
+        size = write_packed(packed_output_file, pack_result(result), meta={
+            "years": years,
+            "categories": result["categories"],
+            "seriesTypes": SERIES_TYPES,
+            "ratioTypes": RATIO_TYPES
+        })
+        s.set(bytes_out=size)
+
+    # Save a small index and the chart series for viz2.js
+    with stage('viz2.save_charts', output_dir=chart_dir):
+        write_chart_files(result, chart_dir)
+
+    # Record the input hashes the output was built from
+    write_json({"code": code_digest, "years": hashes}, hash_file)
+
+    print(f"Processing complete! JSON saved to {output_file}, packed arrays to {packed_output_file}, "
+          f"other groupings to {groupings_output_file}, chart series to {chart_dir}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Process the BEA workbooks into JSON for viz2.js")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Recompute only the years whose input rows changed")
+    parser.add_argument('--groupings', nargs='+', metavar='NAME',
+                        help=f"Groupings to compute, the first one at the top level "
+                             f"(default: {' '.join(GROUPINGS)} and those of --grouping-file)")
+    parser.add_argument('--grouping-file',
+                        help='JSON file of extra grouping specs: {name: {group: {"metrics": [...], "deciles": [...]}}}')
+    add_trace_arguments(parser)
+    args = parser.parse_args()
+
+    available = dict(GROUPINGS)
+    if args.grouping_file:
+        try:
+            available.update(load_groupings(args.grouping_file))
+        except (OSError, ValueError, KeyError) as e:
+            parser.error(f"cannot load {args.grouping_file}: {e}")
+    unknown = [name for name in args.groupings or [] if name not in available]
+    if unknown:
+        parser.error(f"unknown grouping {', '.join(unknown)} (available: {', '.join(available)})")
+    groupings = {name: available[name] for name in args.groupings} if args.groupings else available
+
+    configure(args)
+    process_excel_to_json(incremental=args.incremental, groupings=groupings)
+
 
 if __name__ == "__main__":
-    process_excel_to_json()
\ No newline at end of file
+    main()
@@ -10,21 +10,45 @@ This version uses wealth quintiles (5 groups) rather than 12 percentiles for cle
 
 Usage:
     python process_viz3_data.py
+    python process_viz3_data.py --chunksize 100000   # streaming mode for large files
+    python process_viz3_data.py --replicates 200     # add bootstrap standard errors
+    python process_viz3_data.py --waves              # every SCF wave, 1989-2022, in parallel
+
+The output also carries weighted Gini coefficients, Lorenz curves and top
+shares of net worth, income and stock holdings (see inequality.py), overall
+and by wealth and income quintile, to sit next to the SWIID country Gini
+coefficients of viz4.
 """
 
-import pandas as pd
-import numpy as np
-import json
+import argparse
+import io
 import os
-from pathlib import Path
+import time
+from concurrent import futures
+from contextlib import redirect_stdout
+
+from fiscal_data import write_json
+from inequality import (LORENZ_POINTS, SHARE_RATIOS, TOP_SHARES, inequality_standard_errors, inequality_statistics,
+                        share_label)
+from instrumentation import add_trace_arguments, configure, nbytes, stage, traced
+from lazy_imports import lazy_import
+from scf_loader import DEFAULT_CHUNKSIZE, iter_scf_chunks, load_scf_data
+from standard_errors import DEFAULT_BATCH_SIZE, load_replicate_weights, replicate_standard_errors
+from weighted_stats import (DISTRIBUTION_QUANTILES, LogHistogramSketch, cross_counts, group_stats, markov_powers,
+                            quantile_label, transition_matrix, weighted_ntile_codes)
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
 
 # Configure paths
 INPUT_FILE = 'data/SCFP2022.csv'
 OUTPUT_DIR = 'data'
 OUTPUT_FILE = os.path.join(OUTPUT_DIR, 'viz3_data.json')
+WAVE_INPUT_PATTERN = os.path.join(OUTPUT_DIR, 'SCFP{year}.csv')
+WAVES_OUTPUT_FILE = os.path.join(OUTPUT_DIR, 'viz3_waves.json')
 
-# Ensure output directory exists
-Path(OUTPUT_DIR).mkdir(parents=True, exist_ok=True)
+# Survey waves of the SCF summary extract (triennial, 1989-2022)
+SCF_WAVES = list(range(1989, 2023, 3))
 
 # Define wealth quintiles with descriptive labels and approximate dollar ranges
 # These dollar ranges will be updated based on actual data if available
@@ -36,17 +60,222 @@ WEALTH_QUINTILES = [
     {"index": 5, "label": "Top 20%", "description": "Top 20% of households", "range": "> $500,000"}
 ]
 
+EMERGENCY_COLUMNS = ['EMERGBORR', 'EMERGSAV', 'EMERGPSTP', 'EMERGCUT']
+ALTERNATIVE_STOCK_COLUMNS = ['STOCK', 'STMUTF', 'COMUTF', 'NSTOCKS']
+
+# Wealth x income groupings for the empirical mobility matrices. Resolutions
+# without category codes use weighted N-tiles of NETWORTH and INCOME.
+MOBILITY_CATEGORIES = {
+    5: ('WEALTHQUINTILE', 'INCQUINTILE'),
+    12: ('NWPCTLECAT', 'INCPCTLECAT')
+}
+MOBILITY_RESOLUTIONS = [5, 12]
+
+# Distributions whose inequality is measured: JSON key -> SCF column
+INEQUALITY_MEASURES = {'netWorth': 'NETWORTH', 'income': 'INCOME', 'stocks': 'STOCKS'}
+
+# Groupings of the inequality measures: JSON key -> quintile column
+INEQUALITY_GROUPINGS = {'byWealth': 'WEALTHQUINTILE', 'byIncome': 'INCQUINTILE'}
+
+# Per-quintile values tracked across waves: series name -> (section, list key, field)
+WAVE_SERIES = {
+    'medianNetWorth': ('wealthQuintiles', None, 'medianNetWorth'),
+    'stockOwnershipByWealth': ('stockOwnership', 'byWealth', 'ownership'),
+    'stockOwnershipByIncome': ('stockOwnership', 'byIncome', 'ownership'),
+    'medianStockValueByWealth': ('stockOwnership', 'byWealth', 'medianValue'),
+    'medianStockValueByIncome': ('stockOwnership', 'byIncome', 'medianValue'),
+    'debtToIncome': ('wealthBarriers', None, 'debtToIncome'),
+    'investmentAccess': ('wealthBarriers', None, 'investmentAccess'),
+    'financialLiteracy': ('wealthBarriers', None, 'financialLiteracy'),
+    'emergencyExpenses': ('wealthBarriers', None, 'emergencyExpenses')
+}
+
 def main():
-    print(f"Processing {INPUT_FILE} for Visualization 3...")
+    parser = argparse.ArgumentParser(description="Process SCF data for Visualization 3")
+    parser.add_argument('--input', default=INPUT_FILE, help="SCF summary extract CSV")
+    parser.add_argument('--output', default=OUTPUT_FILE, help="Output JSON file")
+    parser.add_argument('--chunksize', type=int, nargs='?', const=DEFAULT_CHUNKSIZE,
+                        help="Stream the input in chunks of this many rows instead of loading it at once")
+    parser.add_argument('--mobility-resolutions', type=int, nargs='+', default=MOBILITY_RESOLUTIONS,
+                        help="Sizes of the empirical mobility matrices, e.g. 5 12 100")
+    parser.add_argument('--mobility-steps', type=int, nargs='+', default=[],
+                        help="Also publish k-step Markov powers of each mobility matrix")
+    parser.add_argument('--replicates', type=int, default=0,
+                        help="Number of bootstrap replicates used for standard errors (0 = none)")
+    parser.add_argument('--replicate-weights', help="SCF replicate weight CSV used instead of the bootstrap")
+    parser.add_argument('--workers', type=int,
+                        help="Worker processes for the replicates or waves (default: CPU count)")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Replicates evaluated together in each task")
+    parser.add_argument('--waves', type=int, nargs='*',
+                        help=f"Process these survey waves (default: all of {SCF_WAVES[0]}-{SCF_WAVES[-1]}) "
+                             "into one time-indexed dataset instead of a single file")
+    parser.add_argument('--wave-pattern', default=WAVE_INPUT_PATTERN,
+                        help="Input file of each wave, with {year} for the survey year")
+    parser.add_argument('--waves-output', default=WAVES_OUTPUT_FILE, help="Output JSON file of the waves")
+    add_trace_arguments(parser)
+    args = parser.parse_args()
+    if args.replicates < 0:
+        parser.error(f"--replicates must be 0 or more, got {args.replicates}")
+    if (args.replicates or args.replicate_weights) and (args.waves is not None or args.chunksize):
+        # Standard errors need the microdata of a single file in memory
+        parser.error("--replicates and --replicate-weights cannot be combined with --waves or --chunksize")
+    configure(args)
+    
+    if args.waves is not None:
+        inputs = {year: args.wave_pattern.format(year=year) for year in args.waves or SCF_WAVES}
+        missing = [year for year, path in inputs.items() if not os.path.exists(path)]
+        if missing:
+            print(f"Skipping waves without input files: {missing}")
+        inputs = {year: path for year, path in inputs.items() if year not in missing}
+        if not inputs:
+            print("No wave input files found")
+            return
+        
+        print(f"Processing {len(inputs)} SCF waves for Visualization 3...")
+        results = process_waves(inputs, args.workers, args.mobility_resolutions, args.mobility_steps)
+        save_processed_data(build_wave_dataset(results), args.waves_output)
+        print(f"Processed waves saved to {args.waves_output}")
+        return
+    
+    print(f"Processing {args.input} for Visualization 3...")
+    
+    if args.chunksize:
+        try:
+            processed_data = process_streaming(args.input, args.chunksize,
+                                               args.mobility_resolutions, args.mobility_steps)
+        except Exception as e:
+            print(f"Error loading data: {e}")
+            return
+        save_processed_data(processed_data, args.output)
+        print(f"Processed data saved to {args.output}")
+        return
     
     # Load the data
     try:
-        df = pd.read_csv(INPUT_FILE)
+        with stage('viz3.load', input_file=args.input) as s:
+            df = load_scf_data(args.input)
+            s.set(bytes_in=nbytes(args.input), rows_out=len(df), bytes_out=nbytes(df))
         print(f"Successfully loaded dataset with {df.shape[0]} rows and {df.shape[1]} columns")
     except Exception as e:
         print(f"Error loading data: {e}")
         return
     
+    with stage('viz3.assign_quintiles', rows_in=len(df)):
+        assign_quintiles(df)
+    
+    # Compute every per-quintile statistic once, then build each section from it
+    print("Calculating quintile statistics...")
+    with stage('viz3.compute_quintile_statistics', rows_in=len(df), bytes_in=nbytes(df)):
+        stats = compute_quintile_statistics(df, mobility_resolutions=args.mobility_resolutions)
+    processed_data = build_processed_data(stats, df, args.mobility_steps)
+    
+    # Standard errors from replicate weights or a household bootstrap
+    if args.replicates or args.replicate_weights:
+        print("Calculating standard errors...")
+        try:
+            with stage('viz3.standard_errors', rows_in=len(df), replicates=args.replicates):
+                replicate_weights = None
+                if args.replicate_weights:
+                    replicate_weights = load_replicate_weights(args.replicate_weights, df)
+                errors = replicate_standard_errors(df, stock_values(df), replicate_weights, args.replicates,
+                                                   args.batch_size, args.workers)
+                add_standard_errors(processed_data, errors)
+                if 'inequality' in processed_data:
+                    add_inequality_errors(processed_data['inequality'],
+                                          calculate_inequality_errors(df, replicate_weights, args.replicates,
+                                                                      args.batch_size, args.workers))
+        except Exception as e:
+            print(f"Error calculating standard errors: {e}")
+    
+    # Save the processed data
+    save_processed_data(processed_data, args.output)
+    print(f"Processed data saved to {args.output}")
+
+def process_wave(year, input_file, mobility_resolutions=MOBILITY_RESOLUTIONS, mobility_steps=()):
+    """
+    Process one survey wave in memory, without progress output.
+    
+    Returns:
+    - (year, processed data, input rows, elapsed seconds)
+    """
+    start = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        df = load_scf_data(input_file)
+        assign_quintiles(df)
+        stats = compute_quintile_statistics(df, mobility_resolutions=mobility_resolutions)
+        processed_data = build_processed_data(stats, df, mobility_steps)
+    return year, processed_data, len(df), time.perf_counter() - start
+
+def process_waves(inputs, workers=None, mobility_resolutions=MOBILITY_RESOLUTIONS, mobility_steps=()):
+    """
+    Process several survey waves concurrently, one wave per worker process.
+    
+    Parameters:
+    - inputs: Dictionary of survey year -> input CSV
+    - workers: Number of worker processes (default: CPU count)
+    
+    Returns:
+    - Dictionary of survey year -> processed data, in year order
+    """
+    # Largest files first, so a long wave does not start last
+    years = sorted(inputs, key=lambda year: os.path.getsize(inputs[year]), reverse=True)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(years)))
+    
+    results = {}
+    def record(result):
+        year, processed_data, rows, elapsed = result
+        results[year] = processed_data
+        print(f"Wave {year}: {rows} rows in {elapsed:.1f}s")
+    
+    if workers == 1:
+        for year in years:
+            record(process_wave(year, inputs[year], mobility_resolutions, mobility_steps))
+    else:
+        with futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            tasks = [pool.submit(process_wave, year, inputs[year], mobility_resolutions, mobility_steps)
+                     for year in years]
+            for task in futures.as_completed(tasks):
+                record(task.result())
+    return {year: results[year] for year in sorted(results)}
+
+def build_wave_dataset(results):
+    """
+    Combine the per-wave outputs into a time-indexed dataset.
+    
+    'series' holds, for every WAVE_SERIES entry, one list per quintile with
+    a value per wave (None where a wave lacks it); 'gini' holds the overall
+    Gini coefficient of every inequality measure per wave; 'byWave' keeps
+    each wave's complete viz3 structure.
+    """
+    waves = list(results)
+    series = {}
+    for name, (section, key, field) in WAVE_SERIES.items():
+        values = []
+        for processed_data in results.values():
+            rows = processed_data.get(section, {})
+            rows = rows.get(key, []) if key else rows
+            values.append([row.get(field) for row in rows] + [None] * (len(WEALTH_QUINTILES) - len(rows)))
+        series[name] = [list(quintile) for quintile in zip(*values)]
+    
+    gini = {
+        key: [processed_data.get('inequality', {}).get('measures', {}).get(key, {}).get('overall', {}).get('gini')
+              for processed_data in results.values()]
+        for key in INEQUALITY_MEASURES
+    }
+    
+    return {
+        'waves': waves,
+        'quintiles': [quintile['label'] for quintile in WEALTH_QUINTILES],
+        'series': series,
+        'gini': gini,
+        'byWave': {str(year): processed_data for year, processed_data in results.items()}
+    }
+
+def assign_quintiles(df):
+    """
+    Add INCQUINTILE and WEALTHQUINTILE columns (1-5) to the data in place.
+    """
     # Convert INCQRTCAT to quintiles for our analysis (if available)
     # INCQRTCAT is 1-4, we'll use this to create income quintiles 1-5
     if 'INCQRTCAT' in df.columns:
@@ -73,124 +302,183 @@ def main():
         print("Warning: NWPCTLECAT column not found, wealth quintiles will be simulated.")
         df['WEALTHQUINTILE'] = np.random.choice([1, 2, 3, 4, 5], size=len(df))
     
-    # Process the data
+    return df
+
+def compute_quintile_statistics(df, n_groups=5, mobility_resolutions=MOBILITY_RESOLUTIONS):
+    """
+    Compute every per-quintile statistic used by viz3 in one grouped pass per key.
+    
+    Returns a dictionary with:
+    - 'wealth': group_stats table keyed by WEALTHQUINTILE
+    - 'income': group_stats table keyed by INCQUINTILE (None without income data)
+    - 'transitions': wealth x income quintile household counts (None without income data)
+    - 'mobility': resolution -> weighted wealth x income cross-tab
+    """
+    has_income = 'INCQUINTILE' in df.columns
+    stats_df = pd.DataFrame({'WEALTHQUINTILE': df['WEALTHQUINTILE']})
+    if has_income:
+        stats_df['INCQUINTILE'] = df['INCQUINTILE']
+    
+    # Net worth ranges and barrier indicators by wealth quintile
+    wealth_aggregations = {}
+    if 'NETWORTH' in df.columns:
+        stats_df['NETWORTH'] = df['NETWORTH']
+        wealth_aggregations['NETWORTH'] = ['count', 'min', 'max', 'median']
+    if 'DEBT2INC' in df.columns:
+        stats_df['DEBT2INC'] = df['DEBT2INC']
+        wealth_aggregations['DEBT2INC'] = ['count', 'median']
+    if 'FINLIT' in df.columns:
+        stats_df['FINLIT'] = df['FINLIT']
+        wealth_aggregations['FINLIT'] = ['count', 'mean']
+    emergency_cols = [col for col in EMERGENCY_COLUMNS if col in df.columns]
+    if emergency_cols:
+        # Combine emergency indicators
+        stats_df['EMERGENCY'] = df[emergency_cols].mean(axis=1)
+        wealth_aggregations['EMERGENCY'] = ['count', 'mean']
+    
+    # Weighted distributions use WGT, or equal weights without it
+    weights = df['WGT'].astype(np.float64) if 'WGT' in df.columns else pd.Series(1.0, index=df.index)
+    wealth_quantiles = {}
+    if 'NETWORTH' in df.columns:
+        stats_df['WEIGHT'] = weights
+        wealth_quantiles['NETWORTH'] = 'WEIGHT'
+    
+    # Stock ownership uses the rows with no missing quintile, stock or weight values
+    stocks = pd.to_numeric(stock_values(df), errors='coerce')
+    in_sample = stocks.notna() & weights.notna() & stats_df['WEALTHQUINTILE'].notna()
+    if has_income:
+        in_sample &= stats_df['INCQUINTILE'].notna()
+    owners = in_sample & (stocks > 0)
+    stats_df['STOCK_WGT'] = weights.where(in_sample)
+    stats_df['OWNER_WGT'] = weights.where(owners)
+    stats_df['OWNER_STOCKS'] = stocks.where(owners)
+    stock_aggregations = {'STOCK_WGT': ['count', 'sum'], 'OWNER_WGT': ['count', 'sum']}
+    stock_quantiles = {'OWNER_STOCKS': 'OWNER_WGT'}
+    
+    stats = {
+        'wealth': group_stats(stats_df, 'WEALTHQUINTILE', n_groups,
+                              {**wealth_aggregations, **stock_aggregations},
+                              {**wealth_quantiles, **stock_quantiles}),
+        'income': None,
+        'transitions': None,
+        'mobility': {}
+    }
+    
+    for resolution in mobility_resolutions:
+        codes = mobility_codes(df, resolution)
+        if codes is not None:
+            stats['mobility'][resolution] = cross_counts(*codes, resolution, weights)
+    
+    if has_income:
+        stats['income'] = group_stats(stats_df, 'INCQUINTILE', n_groups, stock_aggregations, stock_quantiles)
+        if 'WGT' in df.columns:
+            in_mobility = df['WGT'].notna().to_numpy()
+            stats['transitions'] = cross_counts(stats_df['WEALTHQUINTILE'][in_mobility],
+                                                stats_df['INCQUINTILE'][in_mobility], n_groups)
+    
+    return stats
+
+def build_processed_data(stats, df, mobility_steps=()):
+    """
+    Build the viz3 data structure from precomputed quintile statistics.
+    """
     processed_data = {}
     
     # Add quintile definitions with net worth ranges from the data
-    processed_data['wealthQuintiles'] = update_quintile_ranges(df, WEALTH_QUINTILES)
+    processed_data['wealthQuintiles'] = update_quintile_ranges(stats['wealth'], WEALTH_QUINTILES)
     
     # Process wealth mobility data
     print("Calculating wealth mobility metrics...")
-    processed_data['wealthMobility'] = calculate_wealth_mobility(df)
+    processed_data['wealthMobility'] = calculate_wealth_mobility(stats['transitions'])
+    processed_data['empiricalMobility'] = calculate_empirical_mobility(stats.get('mobility', {}), mobility_steps)
     
     # Process stock ownership data
     print("Calculating stock ownership metrics...")
-    processed_data['stockOwnership'] = calculate_stock_ownership(df)
+    processed_data['stockOwnership'] = calculate_stock_ownership(stats['wealth'], stats['income'])
     
     # Process investment returns data
     print("Calculating investment returns metrics...")
-    processed_data['investmentReturns'] = calculate_investment_returns(df)
+    processed_data['investmentReturns'] = calculate_investment_returns(df, stats['wealth'].index)
     
     # Process wealth barriers data
     print("Calculating wealth barriers metrics...")
-    processed_data['wealthBarriers'] = calculate_wealth_barriers(df)
+    processed_data['wealthBarriers'] = calculate_wealth_barriers(stats['wealth'])
     
-    # Save the processed data
-    save_processed_data(processed_data, OUTPUT_FILE)
-    print(f"Processed data saved to {OUTPUT_FILE}")
+    # Inequality needs the microdata, which the streaming mode does not keep
+    if len(df):
+        print("Calculating inequality metrics...")
+        processed_data['inequality'] = calculate_inequality(df)
+    
+    return processed_data
+
+def add_standard_errors(processed_data, errors):
+    """
+    Add standard errors next to the wealth quintile and stock ownership estimates.
+    """
+    for i, quintile in enumerate(processed_data['wealthQuintiles']):
+        if 'medianNetWorth' in quintile:
+            quintile['medianNetWorthSE'] = float(errors['median_networth'][i])
+    
+    for name, key in (('byWealth', 'wealth'), ('byIncome', 'income')):
+        for i, row in enumerate(processed_data['stockOwnership'][name]):
+            row['ownershipSE'] = float(errors[f'ownership_{key}'][i])
+            row['medianValueSE'] = float(errors[f'median_value_{key}'][i])
 
-def update_quintile_ranges(df, quintiles):
+def update_quintile_ranges(wealth_stats, quintiles):
     """
     Update the quintile definitions with actual net worth ranges from the data.
     """
-    updated_quintiles = quintiles.copy()
+    updated_quintiles = [dict(quintile) for quintile in quintiles]
     
     # Try to extract actual net worth ranges from the data
-    if all(col in df.columns for col in ['NETWORTH', 'WEALTHQUINTILE']):
-        try:
-            # Calculate the wealth ranges for each quintile
-            for i, quintile in enumerate(updated_quintiles):
-                q_index = quintile['index']
-                q_data = df[df['WEALTHQUINTILE'] == q_index]['NETWORTH']
-                
-                if len(q_data) > 0:
-                    min_val = q_data.min()
-                    max_val = q_data.max()
-                    median_val = q_data.median()
-                    
-                    # Format the range string with dollar formatting
-                    if q_index == 1:
-                        range_str = f"Up to ${max_val:,.0f}"
-                        if min_val < 0:
-                            range_str = f"Negative to ${max_val:,.0f}"
-                    elif q_index == 5:
-                        range_str = f"${min_val:,.0f} and above"
-                    else:
-                        range_str = f"${min_val:,.0f} to ${max_val:,.0f}"
-                    
-                    updated_quintiles[i]['range'] = range_str
-                    updated_quintiles[i]['medianNetWorth'] = float(median_val)
-        except Exception as e:
-            print(f"Error updating quintile ranges: {e}")
-            # Keep the predefined ranges if there's an error
+    if 'NETWORTH_min' in wealth_stats.columns:
+        for quintile in updated_quintiles:
+            q_index = quintile['index']
+            if q_index not in wealth_stats.index:
+                continue
+            q_stats = wealth_stats.loc[q_index]
+            
+            if q_stats['rows'] > 0:
+                # Format the range string with dollar formatting
+                quintile['range'] = format_networth_range(q_index, q_stats['NETWORTH_min'], q_stats['NETWORTH_max'])
+                quintile['medianNetWorth'] = float(q_stats['NETWORTH_median'])
+                if 'NETWORTH_p50' in wealth_stats.columns:
+                    quintile['netWorthDistribution'] = weighted_distribution(q_stats, 'NETWORTH')
     
     return updated_quintiles
 
-def calculate_wealth_mobility(df):
+@traced('viz3.calculate_wealth_mobility')
+def calculate_wealth_mobility(transitions, transition_strength=0.7):
     """
     Calculate wealth mobility metrics between quintiles rather than percentiles.
-    """
-    # Get wealth and income quintiles
-    df_filtered = df[['WEALTHQUINTILE', 'INCQUINTILE', 'WGT']].dropna()
     
-    # Create mobility matrix (5 quintiles)
+    Parameters:
+    - transitions: Wealth quintile x income quintile household counts, or None
+    - transition_strength: Strength of correlation between income and wealth
+    """
+    n = 5 if transitions is None else transitions.shape[0]
     mobility_matrix = []
     
-    # Calculate transition probabilities based on correlations in the data
-    transition_strength = 0.7  # Strength of correlation between income and wealth
-    
-    for start_quintile in range(1, 6):
-        # Select households in this wealth quintile
-        quintile_df = df_filtered[df_filtered['WEALTHQUINTILE'] == start_quintile]
-        
-        # Create row for this starting quintile
+    for start in range(n):
+        start_quintile = start + 1
         row = {'startQuintile': start_quintile}
+        row_total = 0 if transitions is None else transitions[start].sum()
         
-        if len(quintile_df) > 0:
+        if row_total > 0:
             # Calculate probabilities based on income distribution
-            for end_quintile in range(1, 6):
-                # Base probability calculation
-                # Higher probability of staying in same quintile or moving slightly
-                if start_quintile == end_quintile:
-                    base_prob = 0.4 + (start_quintile / 25)  # Higher stability at higher quintiles
-                elif abs(start_quintile - end_quintile) == 1:
-                    base_prob = 0.2 - (abs(start_quintile - 3) / 15)
-                else:
-                    # Probability decreases with distance from current quintile
-                    # And is lower for downward mobility from top quintiles
-                    distance_factor = abs(start_quintile - end_quintile)
-                    direction_factor = 1.0 if end_quintile > start_quintile else 0.7
-                    quintile_factor = 0.3 if start_quintile >= 4 and end_quintile < start_quintile else 1.0
-                    
-                    base_prob = max(0, (0.15 - (distance_factor * 0.06))) * direction_factor * quintile_factor
+            for end in range(n):
+                end_quintile = end + 1
+                base_prob = base_transition_probability(start_quintile, end_quintile)
                 
-                # Adjust based on actual income-wealth correlation in the data
-                if len(quintile_df) > 10 and 'INCQUINTILE' in quintile_df.columns:
-                    # Get income counts for this wealth quintile
-                    income_counts = quintile_df['INCQUINTILE'].value_counts(normalize=True)
-                    
-                    # Adjust probability based on income distribution if available
-                    if end_quintile in income_counts.index:
-                        income_prob = income_counts[end_quintile]
-                        # Blend base probability with observed income probability
-                        row[f'to{end_quintile}'] = (1 - transition_strength) * base_prob + transition_strength * income_prob
-                    else:
-                        row[f'to{end_quintile}'] = base_prob
+                # Blend base probability with observed income probability
+                if row_total > 10 and transitions[start, end] > 0:
+                    income_prob = transitions[start, end] / row_total
+                    row[f'to{end_quintile}'] = (1 - transition_strength) * base_prob + transition_strength * income_prob
                 else:
                     row[f'to{end_quintile}'] = base_prob
         else:
             # If no data for this quintile, use base probabilities
-            for end_quintile in range(1, 6):
+            for end_quintile in range(1, n + 1):
                 if start_quintile == end_quintile:
                     row[f'to{end_quintile}'] = 0.4
                 elif abs(start_quintile - end_quintile) == 1:
@@ -200,140 +488,116 @@ def calculate_wealth_mobility(df):
                     row[f'to{end_quintile}'] = max(0, 0.3 - (distance * 0.1))
         
         # Normalize to ensure probabilities sum to 1
-        prob_sum = sum(row[f'to{i}'] for i in range(1, 6))
+        prob_sum = sum(row[f'to{i}'] for i in range(1, n + 1))
         if prob_sum > 0:
-            for i in range(1, 6):
+            for i in range(1, n + 1):
                 row[f'to{i}'] = row[f'to{i}'] / prob_sum
         
         mobility_matrix.append(row)
     
     return mobility_matrix
 
-def calculate_stock_ownership(df):
+def mobility_codes(df, resolution):
     """
-    Calculate stock ownership by wealth and income quintiles.
+    Return the (wealth, income) group codes of each row for a mobility matrix.
+    
+    Resolutions listed in MOBILITY_CATEGORIES use the SCF category codes;
+    any other resolution uses weighted N-tiles of NETWORTH and INCOME.
+    Returns None when the required columns are missing.
     """
-    # Check for necessary columns
-    required_cols = ['WEALTHQUINTILE', 'INCQUINTILE', 'STOCKS', 'WGT']
+    if resolution in MOBILITY_CATEGORIES:
+        row_col, col_col = MOBILITY_CATEGORIES[resolution]
+        if row_col not in df.columns or col_col not in df.columns:
+            return None
+        return df[row_col].to_numpy(dtype=float), df[col_col].to_numpy(dtype=float)
     
-    # Make sure STOCKS column exists, if not try to use similar columns
-    if 'STOCKS' not in df.columns:
-        potential_stock_cols = ['STOCK', 'STMUTF', 'COMUTF', 'NSTOCKS']
-        for col in potential_stock_cols:
-            if col in df.columns:
-                print(f"STOCKS column not found, using {col} instead")
-                df['STOCKS'] = df[col]
-                break
-        else:
-            # If no stock column found, create a dummy with zeros
-            print("No stock ownership column found, creating a dummy column")
-            df['STOCKS'] = 0
-    
-    # Filter the dataframe to include only necessary columns and drop NAs
-    stock_cols = [col for col in required_cols if col in df.columns]
-    df_stocks = df[stock_cols].copy()
-    df_stocks = df_stocks.dropna()
-    
-    # Convert to numeric and ensure stocks are properly coded
-    for col in ['WEALTHQUINTILE', 'INCQUINTILE', 'STOCKS', 'WGT']:
-        if col in df_stocks.columns:
-            df_stocks[col] = pd.to_numeric(df_stocks[col], errors='coerce')
-    
-    # Replace missing values with 0 for STOCKS
-    if 'STOCKS' in df_stocks.columns:
-        df_stocks['STOCKS'] = df_stocks['STOCKS'].fillna(0)
-    
-    # Calculate stock ownership by wealth quintile
-    stock_ownership_by_wealth = []
-    stock_ownership_by_income = []
-    
-    for quintile in range(1, 6):
-        # Wealth quintile calculations
-        if 'WEALTHQUINTILE' in df_stocks.columns:
-            wealth_group = df_stocks[df_stocks['WEALTHQUINTILE'] == quintile]
-            
-            if len(wealth_group) > 0:
-                # Stock ownership percentage (weighted)
-                ownership_pct = 0
-                stock_owners = wealth_group[wealth_group['STOCKS'] > 0]
-                
-                if 'WGT' in wealth_group.columns:
-                    total_weight = wealth_group['WGT'].sum()
-                    if total_weight > 0:
-                        owners_weight = stock_owners['WGT'].sum() if len(stock_owners) > 0 else 0
-                        ownership_pct = (owners_weight / total_weight) * 100
-                else:
-                    ownership_pct = (len(stock_owners) / len(wealth_group)) * 100
-                
-                # Median value for stock owners
-                median_value = 0
-                if len(stock_owners) > 0 and 'STOCKS' in stock_owners.columns:
-                    if 'WGT' in stock_owners.columns:
-                        # Use weighted median if possible
-                        median_value = weighted_median(stock_owners['STOCKS'], stock_owners['WGT'])
-                    else:
-                        median_value = stock_owners['STOCKS'].median()
-            else:
-                ownership_pct = 0
-                median_value = 0
-        else:
-            # If WEALTHQUINTILE not available, use simulated data
-            ownership_pct = min(95, max(5, 5 + (quintile - 1) * 20))
-            median_value = min(10000000, max(1000, 1000 * quintile ** 2.5))
-        
-        stock_ownership_by_wealth.append({
-            'quintile': quintile,
-            'ownership': ownership_pct,
-            'medianValue': float(median_value)
+    if 'NETWORTH' not in df.columns or 'INCOME' not in df.columns:
+        return None
+    weights = df['WGT'].to_numpy(dtype=float) if 'WGT' in df.columns else None
+    return (weighted_ntile_codes(df['NETWORTH'], weights, resolution),
+            weighted_ntile_codes(df['INCOME'], weights, resolution))
+
+@traced('viz3.calculate_empirical_mobility')
+def calculate_empirical_mobility(mobility_counts, steps=()):
+    """
+    Build weighted wealth-to-income transition matrices from the cross-tabs.
+    
+    Parameters:
+    - mobility_counts: Dictionary of resolution -> weighted N x N cross-tab
+    - steps: Numbers of steps for which Markov powers are also published
+    """
+    matrices = []
+    for resolution, counts in sorted(mobility_counts.items()):
+        matrix = transition_matrix(counts)
+        rows, columns = MOBILITY_CATEGORIES.get(resolution, ('NETWORTH', 'INCOME'))
+        matrices.append({
+            'resolution': int(resolution),
+            'rows': rows,
+            'columns': columns,
+            'weightedTotal': float(counts.sum()),
+            'matrix': matrix.tolist(),
+            'powers': {str(k): power.tolist() for k, power in markov_powers(matrix, steps).items()}
         })
-        
-        # Income quintile calculations
-        if 'INCQUINTILE' in df_stocks.columns:
-            income_group = df_stocks[df_stocks['INCQUINTILE'] == quintile]
-            
-            if len(income_group) > 0:
+    return matrices
+
+def quintile_position(group, n_groups):
+    """
+    Position of a group (1..n_groups) on the 1..5 quintile scale the default
+    curves below are written for; the identity for quintiles.
+    """
+    return 1 + (group - 1) * 4 / max(n_groups - 1, 1)
+
+@traced('viz3.calculate_stock_ownership')
+def calculate_stock_ownership(wealth_stats, income_stats):
+    """
+    Calculate stock ownership by wealth and income group, for every group of
+    the group_stats tables.
+    """
+    # Simulated (ownership, median value) curves used when a quintile type is unavailable
+    simulated = {
+        'byWealth': lambda q: (min(95, max(5, 5 + (q - 1) * 20)), min(10000000, max(1000, 1000 * q ** 2.5))),
+        'byIncome': lambda q: (min(85, max(5, 5 + (q - 1) * 17)), min(5000000, max(1000, 1000 * q ** 2)))
+    }
+    
+    stock_ownership = {}
+    for name, stats in (('byWealth', wealth_stats), ('byIncome', income_stats)):
+        rows = []
+        groups = (wealth_stats if stats is None else stats).index
+        for quintile in groups:
+            if stats is None:
+                ownership_pct, median_value = simulated[name](quintile_position(quintile, len(groups)))
+            elif stats.loc[quintile, 'STOCK_WGT_count'] > 0:
                 # Stock ownership percentage (weighted)
                 ownership_pct = 0
-                stock_owners = income_group[income_group['STOCKS'] > 0]
-                
-                if 'WGT' in income_group.columns:
-                    total_weight = income_group['WGT'].sum()
-                    if total_weight > 0:
-                        owners_weight = stock_owners['WGT'].sum() if len(stock_owners) > 0 else 0
-                        ownership_pct = (owners_weight / total_weight) * 100
-                else:
-                    ownership_pct = (len(stock_owners) / len(income_group)) * 100
+                total_weight = stats.loc[quintile, 'STOCK_WGT_sum']
+                if total_weight > 0:
+                    ownership_pct = (stats.loc[quintile, 'OWNER_WGT_sum'] / total_weight) * 100
                 
-                # Median value for stock owners
+                # Weighted median value for stock owners
                 median_value = 0
-                if len(stock_owners) > 0 and 'STOCKS' in stock_owners.columns:
-                    if 'WGT' in stock_owners.columns:
-                        # Use weighted median if possible
-                        median_value = weighted_median(stock_owners['STOCKS'], stock_owners['WGT'])
-                    else:
-                        median_value = stock_owners['STOCKS'].median()
+                if stats.loc[quintile, 'OWNER_WGT_count'] > 0:
+                    median_value = stats.loc[quintile, 'OWNER_STOCKS_p50']
             else:
                 ownership_pct = 0
                 median_value = 0
-        else:
-            # If INCQUINTILE not available, use simulated data
-            ownership_pct = min(85, max(5, 5 + (quintile - 1) * 17))
-            median_value = min(5000000, max(1000, 1000 * quintile ** 2))
-        
-        stock_ownership_by_income.append({
-            'quintile': quintile,
-            'ownership': ownership_pct,
-            'medianValue': float(median_value)
-        })
+            
+            row = {
+                'quintile': int(quintile),
+                'ownership': float(ownership_pct),
+                'medianValue': float(median_value)
+            }
+            if stats is not None and stats.loc[quintile, 'OWNER_WGT_count'] > 0:
+                # Weighted distribution of holdings among stock owners
+                row['valueDistribution'] = weighted_distribution(stats.loc[quintile], 'OWNER_STOCKS')
+            rows.append(row)
+        stock_ownership[name] = rows
     
-    return {
-        'byWealth': stock_ownership_by_wealth,
-        'byIncome': stock_ownership_by_income
-    }
+    return stock_ownership
 
-def calculate_investment_returns(df):
+@traced('viz3.calculate_investment_returns')
+def calculate_investment_returns(df, groups=range(1, 6)):
     """
-    Calculate investment returns by wealth quintile.
+    Calculate investment returns by wealth quintile, for every group code in groups.
     """
     # Create array for investment returns by wealth quintile
     returns_by_wealth = []
@@ -344,24 +608,25 @@ def calculate_investment_returns(df):
     # Check if we have NETWORTH, STOCKS, and EQUITY data for better estimates
     has_detailed_data = all(col in df.columns for col in ['NETWORTH', 'STOCKS', 'EQUITY'])
     
-    for quintile in range(1, 6):
+    for quintile in groups:
         # Use quintile-specific factors
+        position = quintile_position(quintile, len(groups))
         
         # Base return is the same theoretical market return for all
         base_return = base_market_return
         
         # Adjustment factors that affect real-world returns
         # Higher wealth groups pay lower fees and have better diversification
-        fees = -1.5 + ((quintile - 1) * 0.3)  # Ranges from -1.5% to -0.3%
+        fees = -1.5 + ((position - 1) * 0.3)  # Ranges from -1.5% to -0.3%
         
         # Access to diversification improves with wealth
-        access_to_diversification = -0.5 + ((quintile - 1) * 0.15)  # -0.5% to 0.1%
+        access_to_diversification = -0.5 + ((position - 1) * 0.15)  # -0.5% to 0.1%
         
         # Lower wealth groups may have shorter time horizons (need money sooner)
-        time_horizon = -1.0 + ((quintile - 1) * 0.25)  # -1.0% to 0%
+        time_horizon = -1.0 + ((position - 1) * 0.25)  # -1.0% to 0%
         
         # Emergency withdrawals more common in lower wealth groups
-        emergency_withdrawals = -1.2 + ((quintile - 1) * 0.3)  # -1.2% to 0%
+        emergency_withdrawals = -1.2 + ((position - 1) * 0.3)  # -1.2% to 0%
         
         # Calculate effective return with all factors
         effective_return = base_return + fees + access_to_diversification + time_horizon + emergency_withdrawals
@@ -381,7 +646,7 @@ def calculate_investment_returns(df):
                 print(f"Error processing detailed return data: {e}")
         
         returns_by_wealth.append({
-            'quintile': quintile,
+            'quintile': int(quintile),
             'baseReturn': float(base_return),
             'effectiveReturn': float(effective_return),
             'factors': {
@@ -394,64 +659,39 @@ def calculate_investment_returns(df):
     
     return returns_by_wealth
 
-def calculate_wealth_barriers(df):
+@traced('viz3.calculate_wealth_barriers')
+def calculate_wealth_barriers(wealth_stats):
     """
-    Calculate wealth barriers by quintile.
+    Calculate wealth barriers by quintile, for every group of the group_stats table.
     """
     # Create array for barriers by wealth quintile
     barriers_by_wealth = []
     
-    # Check for necessary columns for better estimates
-    has_debt_data = 'DEBT2INC' in df.columns
-    has_fin_literacy = 'FINLIT' in df.columns
-    has_emergency_data = any(col in df.columns for col in ['EMERGBORR', 'EMERGSAV', 'EMERGPSTP', 'EMERGCUT'])
-    
-    for quintile in range(1, 6):
+    for quintile in wealth_stats.index:
         # Default barrier metrics
-        debt_to_income = 80 - (quintile * 15)  # 65% down to 5%
-        investment_access = 10 + (quintile * 20)  # 30% up to 90%
-        financial_literacy = 20 + (quintile * 15)  # 35% up to 80%
-        emergency_expenses = 90 - (quintile * 18)  # 72% down to 0%
+        position = quintile_position(quintile, len(wealth_stats))
+        debt_to_income = 80 - (position * 15)  # 65% down to 5%
+        investment_access = 10 + (position * 20)  # 30% up to 90%
+        financial_literacy = 20 + (position * 15)  # 35% up to 80%
+        emergency_expenses = 90 - (position * 18)  # 72% down to 0%
         
-        # Try to use actual data if available
-        try:
-            quintile_df = df[df['WEALTHQUINTILE'] == quintile]
+        # Use actual data if available
+        q_stats = wealth_stats.loc[quintile]
+        if q_stats['rows'] > 10:
+            # Use the median debt-to-income ratio, capped at 100%
+            if q_stats.get('DEBT2INC_count', 0) > 0:
+                debt_to_income = min(100, float(q_stats['DEBT2INC_median'] * 100))
             
-            if len(quintile_df) > 10:
-                # Debt-to-income ratio
-                if has_debt_data:
-                    debt_series = quintile_df['DEBT2INC'].dropna()
-                    if len(debt_series) > 0:
-                        # Use the median debt-to-income ratio, capped at 100%
-                        debt_to_income = min(100, float(debt_series.median() * 100))
-                
-                # Financial literacy
-                if has_fin_literacy:
-                    lit_series = quintile_df['FINLIT'].dropna()
-                    if len(lit_series) > 0:
-                        # Higher values indicate better literacy
-                        financial_literacy = float(lit_series.mean() * 100)
-                
-                # Emergency expense vulnerability
-                if has_emergency_data:
-                    # Combine emergency indicators
-                    emergency_indicators = []
-                    for col in ['EMERGBORR', 'EMERGSAV', 'EMERGPSTP', 'EMERGCUT']:
-                        if col in quintile_df.columns:
-                            emergency_indicators.append(col)
-                    
-                    if emergency_indicators:
-                        # Calculate emergency vulnerability metric
-                        emergency_series = quintile_df[emergency_indicators].mean(axis=1).dropna()
-                        if len(emergency_series) > 0:
-                            emergency_expenses = float(emergency_series.mean() * 100)
-        
-        except Exception as e:
-            print(f"Error processing barrier data for quintile {quintile}: {e}")
-            # Fall back to default values if there's an error
+            # Financial literacy, higher values indicate better literacy
+            if q_stats.get('FINLIT_count', 0) > 0:
+                financial_literacy = float(q_stats['FINLIT_mean'] * 100)
+            
+            # Emergency expense vulnerability
+            if q_stats.get('EMERGENCY_count', 0) > 0:
+                emergency_expenses = float(q_stats['EMERGENCY_mean'] * 100)
         
         barriers_by_wealth.append({
-            'quintile': quintile,
+            'quintile': int(quintile),
             'debtToIncome': float(debt_to_income),
             'investmentAccess': float(investment_access),
             'financialLiteracy': float(financial_literacy),
@@ -460,47 +700,340 @@ def calculate_wealth_barriers(df):
     
     return barriers_by_wealth
 
-def weighted_median(data, weights):
+def inequality_inputs(df):
     """
-    Calculate the weighted median of a data series.
+    Return the values of each inequality measure, the weights and the quintile groupings in the data.
+    
+    Returns:
+    - (measure key -> values, weights, grouping key -> quintile of each row)
+    """
+    measures = {}
+    for key, column in INEQUALITY_MEASURES.items():
+        if column == 'STOCKS':
+            measures[key] = pd.to_numeric(stock_values(df), errors='coerce').to_numpy(dtype=float)
+        elif column in df.columns:
+            measures[key] = df[column].to_numpy(dtype=float)
+    weights = df['WGT'].to_numpy(dtype=float) if 'WGT' in df.columns else np.ones(len(df))
+    groupings = {key: df[column].to_numpy(dtype=float)
+                 for key, column in INEQUALITY_GROUPINGS.items() if column in df.columns}
+    return measures, weights, groupings
+
+def json_value(value):
+    """
+    Return a float for the JSON output, None for NaN.
+    """
+    value = float(value)
+    return value if value == value else None
+
+def group_entries(groups, build):
+    """
+    Arrange per-group entries as {'overall': entry, grouping: [{'quintile': q, ...entry}]}.
     
     Parameters:
-    - data: Data values
-    - weights: Weight values
+    - groups: (grouping, label) pairs of inequality.prepare_lorenz, overall first
+    - build: Function of the group position returning its entry
+    """
+    arranged = {'overall': build(0)}
+    for i, (grouping, label) in enumerate(groups[1:], start=1):
+        arranged.setdefault(grouping, []).append({'quintile': int(label), **build(i)})
+    return arranged
+
+@traced('viz3.calculate_inequality')
+def calculate_inequality(df):
+    """
+    Calculate weighted Gini coefficients, Lorenz curves and top shares of net worth,
+    income and stock holdings, overall and by wealth and income quintile.
+    
+    Each measure is sorted once for all of its groups. Gini coefficients are
+    on a 0-1 scale (SWIID uses 0-100); groups whose total is not positive
+    get null.
+    """
+    measures, weights, groupings = inequality_inputs(df)
+    inequality = {
+        'lorenzPoints': list(LORENZ_POINTS),
+        'measures': {}
+    }
+    for key, values in measures.items():
+        stats = inequality_statistics(values, weights, groupings)
+        
+        def entry(i):
+            result = {
+                'gini': json_value(stats['gini'][i]),
+                'lorenz': [json_value(value) for value in stats['lorenz'][i]]
+            }
+            for q, value in zip(TOP_SHARES, stats['top_shares'][i]):
+                result[share_label(q)] = json_value(value)
+            for name, values in stats['ratios'].items():
+                result[name] = json_value(values[i])
+            return result
+        
+        inequality['measures'][key] = group_entries(stats['groups'], entry)
+    return inequality
+
+def calculate_inequality_errors(df, replicate_weights=None, n_replicates=0, batch_size=DEFAULT_BATCH_SIZE,
+                                workers=None):
+    """
+    Standard errors of the inequality statistics from replicates and implicates.
     
     Returns:
-    - Weighted median
+    - Dictionary of measure key -> inequality.inequality_standard_errors output
+    """
+    measures, weights, groupings = inequality_inputs(df)
+    clusters = df['YY1'].to_numpy() if 'YY1' in df.columns else None
+    # Y1 = 10 * YY1 + implicate number
+    implicates = df['Y1'].to_numpy() % 10 if 'Y1' in df.columns else None
+    return {
+        key: inequality_standard_errors(values, weights, groupings, replicate_weights, clusters, implicates,
+                                        n_replicates, batch_size, workers)
+        for key, values in measures.items()
+    }
+
+def add_inequality_errors(inequality, errors):
+    """
+    Add standard errors next to the Gini coefficients, top shares and share ratios.
+    """
+    for key, measure_errors in errors.items():
+        def entry(i):
+            result = {'giniSE': json_value(measure_errors['gini'][i])}
+            for q, value in zip(TOP_SHARES, measure_errors['top_shares'][i]):
+                result[f"{share_label(q)}SE"] = json_value(value)
+            for name in SHARE_RATIOS:
+                result[f"{name}SE"] = json_value(measure_errors['ratios'][name][i])
+            return result
+        
+        arranged = group_entries(measure_errors['groups'], entry)
+        measure = inequality['measures'][key]
+        measure['overall'].update(arranged.pop('overall'))
+        for grouping, rows in arranged.items():
+            for row, row_errors in zip(measure[grouping], rows):
+                row.update({name: value for name, value in row_errors.items() if name != 'quintile'})
+
+def weighted_distribution(q_stats, column):
+    """
+    Return the weighted quantiles of a column for one quintile as a JSON-ready dict.
+    """
+    return {
+        quantile_label(q): float(q_stats[f"{column}_{quantile_label(q)}"])
+        for q in DISTRIBUTION_QUANTILES
+    }
+
+class QuintileStatsAccumulator:
     """
-    # Ensure data and weights are numpy arrays
-    data = np.array(data)
-    weights = np.array(weights)
+    Accumulate the per-quintile statistics used by viz3 over chunks of SCF data.
     
-    # Sort data and weights by data values
-    sorted_indices = np.argsort(data)
-    sorted_data = data[sorted_indices]
-    sorted_weights = weights[sorted_indices]
+    Produces the same tables as compute_quintile_statistics. Counts, weights,
+    sums and min/max are exact. Medians come from a LogHistogramSketch, so they
+    are approximate. Memory use depends only on the number of quintiles, not
+    on the number of rows seen.
+    """
     
-    # Calculate cumulative weights
-    cumsum_weights = np.cumsum(sorted_weights)
+    def __init__(self, n_groups=5, mobility_resolutions=MOBILITY_RESOLUTIONS):
+        self.n_groups = n_groups
+        self.columns = set()
+        self.sums = {}
+        self.networth_min = np.full(n_groups, np.inf)
+        self.networth_max = np.full(n_groups, -np.inf)
+        self.sketches = {}
+        
+        # Wealth quintile x income quintile household counts
+        self.transitions = np.zeros((n_groups, n_groups))
+        
+        # Weighted cross-tabs for the category-coded mobility resolutions;
+        # N-tile resolutions need global ranks and are not available here
+        self.mobility = {
+            resolution: np.zeros((resolution, resolution))
+            for resolution in mobility_resolutions if resolution in MOBILITY_CATEGORIES
+        }
     
-    # Find the median weight (half of total weight)
-    median_weight = cumsum_weights[-1] / 2.0
+    def _add(self, name, codes, weights=None):
+        n = self.n_groups
+        in_range = (codes >= 0) & (codes < n)
+        if weights is not None:
+            weights = weights[in_range]
+        totals = np.bincount(codes[in_range], weights=weights, minlength=n)[:n]
+        self.sums[name] = self.sums.get(name, 0) + totals
     
-    # Find the index where the cumulative weight exceeds the median weight
-    median_idx = np.searchsorted(cumsum_weights, median_weight)
+    def _sketch(self, name, codes, values, weights=None):
+        if name not in self.sketches:
+            self.sketches[name] = LogHistogramSketch(self.n_groups)
+        self.sketches[name].update(codes, values, weights)
     
-    # Return the median value
-    if median_idx < len(sorted_data):
-        return sorted_data[median_idx]
+    def update(self, df):
+        """
+        Add one chunk of data that already has quintile columns assigned.
+        """
+        self.columns.update(df.columns)
+        wealth = df['WEALTHQUINTILE'].to_numpy(dtype=np.int64) - 1
+        weights = df['WGT'].to_numpy(dtype=float) if 'WGT' in df.columns else np.ones(len(df))
+        self._add('rows', wealth)
+        
+        # Net worth ranges and barrier indicators by wealth quintile
+        if 'NETWORTH' in df.columns:
+            networth = df['NETWORTH'].to_numpy(dtype=float)
+            valid = ~np.isnan(networth)
+            self._add('NETWORTH_count', wealth[valid])
+            np.minimum.at(self.networth_min, wealth[valid], networth[valid])
+            np.maximum.at(self.networth_max, wealth[valid], networth[valid])
+            self._sketch('NETWORTH', wealth, networth)
+            self._sketch('NETWORTH_weighted', wealth, networth, weights)
+        
+        if 'DEBT2INC' in df.columns:
+            debt = df['DEBT2INC'].to_numpy(dtype=float)
+            self._add('DEBT2INC_count', wealth[~np.isnan(debt)])
+            self._sketch('DEBT2INC', wealth, debt)
+        
+        if 'FINLIT' in df.columns:
+            finlit = df['FINLIT'].to_numpy(dtype=float)
+            valid = ~np.isnan(finlit)
+            self._add('FINLIT_count', wealth[valid])
+            self._add('FINLIT_sum', wealth[valid], finlit[valid])
+        
+        emergency_cols = [col for col in EMERGENCY_COLUMNS if col in df.columns]
+        if emergency_cols:
+            emergency = df[emergency_cols].mean(axis=1).to_numpy(dtype=float)
+            valid = ~np.isnan(emergency)
+            self._add('EMERGENCY_count', wealth[valid])
+            self._add('EMERGENCY_sum', wealth[valid], emergency[valid])
+        
+        # Stock ownership by wealth and income quintile
+        has_income = 'INCQUINTILE' in df.columns
+        income = df['INCQUINTILE'].to_numpy(dtype=float) - 1 if has_income else None
+        stocks = pd.to_numeric(stock_values(df), errors='coerce').to_numpy(dtype=float)
+        in_sample = ~np.isnan(stocks) & ~np.isnan(weights)
+        if has_income:
+            in_sample &= ~np.isnan(income)
+        owners = in_sample & (stocks > 0)
+        
+        for key, codes in (('wealth', wealth), ('income', income)):
+            if codes is None:
+                continue
+            codes = codes.astype(np.int64)
+            self._add(f'{key}_STOCK_WGT_count', codes[in_sample])
+            self._add(f'{key}_STOCK_WGT_sum', codes[in_sample], weights[in_sample])
+            self._add(f'{key}_OWNER_WGT_count', codes[owners])
+            self._add(f'{key}_OWNER_WGT_sum', codes[owners], weights[owners])
+            self._sketch(f'{key}_OWNER_STOCKS', codes[owners], stocks[owners], weights[owners])
+        
+        if has_income and 'WGT' in df.columns:
+            valid = ~np.isnan(weights)
+            self.transitions += cross_counts(wealth[valid] + 1, income[valid] + 1, self.n_groups)
+        
+        for resolution in self.mobility:
+            codes = mobility_codes(df, resolution)
+            if codes is not None:
+                self.mobility[resolution] += cross_counts(*codes, resolution, weights)
+    
+    def statistics(self):
+        """
+        Return the accumulated statistics in the layout of compute_quintile_statistics.
+        """
+        index = pd.RangeIndex(1, self.n_groups + 1)
+        zeros = np.zeros(self.n_groups)
+        
+        def add_quantiles(result, column, sketch):
+            for q, values in zip(DISTRIBUTION_QUANTILES, sketch.quantiles().T):
+                result[f"{column}_{quantile_label(q)}"] = values
+        
+        def table(key):
+            result = pd.DataFrame(index=index)
+            if key == 'wealth':
+                result['rows'] = self.sums.get('rows', zeros)
+                if 'NETWORTH' in self.sketches:
+                    counts = self.sums.get('NETWORTH_count', zeros)
+                    result['NETWORTH_count'] = counts
+                    result['NETWORTH_min'] = np.where(counts > 0, self.networth_min, np.nan)
+                    result['NETWORTH_max'] = np.where(counts > 0, self.networth_max, np.nan)
+                    result['NETWORTH_median'] = self.sketches['NETWORTH'].quantile(0.5)
+                    add_quantiles(result, 'NETWORTH', self.sketches['NETWORTH_weighted'])
+                if 'DEBT2INC' in self.sketches:
+                    result['DEBT2INC_count'] = self.sums.get('DEBT2INC_count', zeros)
+                    result['DEBT2INC_median'] = self.sketches['DEBT2INC'].quantile(0.5)
+                for col in ('FINLIT', 'EMERGENCY'):
+                    if f'{col}_count' in self.sums:
+                        counts = self.sums[f'{col}_count']
+                        result[f'{col}_count'] = counts
+                        result[f'{col}_mean'] = self.sums[f'{col}_sum'] / np.where(counts > 0, counts, np.nan)
+            for col in ('STOCK_WGT_count', 'STOCK_WGT_sum', 'OWNER_WGT_count', 'OWNER_WGT_sum'):
+                result[col] = self.sums.get(f'{key}_{col}', zeros)
+            add_quantiles(result, 'OWNER_STOCKS', self.sketches[f'{key}_OWNER_STOCKS'])
+            return result
+        
+        has_income = 'INCQUINTILE' in self.columns
+        return {
+            'wealth': table('wealth'),
+            'income': table('income') if has_income else None,
+            'transitions': self.transitions if has_income and 'WGT' in self.columns else None,
+            'mobility': {
+                resolution: counts for resolution, counts in self.mobility.items()
+                if set(MOBILITY_CATEGORIES[resolution]) <= self.columns
+            }
+        }
+
+def process_streaming(input_file, chunksize=DEFAULT_CHUNKSIZE, mobility_resolutions=MOBILITY_RESOLUTIONS,
+                      mobility_steps=()):
+    """
+    Process an SCF file chunk by chunk with flat peak memory.
+    
+    Produces the same structure as the in-memory path; medians are approximate.
+    """
+    accumulator = QuintileStatsAccumulator(mobility_resolutions=mobility_resolutions)
+    total_rows = 0
+    for chunk in iter_scf_chunks(input_file, chunksize):
+        with stage('viz3.update_chunk', rows_in=len(chunk), bytes_in=nbytes(chunk)):
+            accumulator.update(assign_quintiles(chunk))
+        total_rows += len(chunk)
+        print(f"Processed {total_rows} rows...")
+    return build_processed_data(accumulator.statistics(), pd.DataFrame(columns=sorted(accumulator.columns)),
+                                mobility_steps)
+
+def stock_values(df):
+    """
+    Return the stock holdings column, falling back to similar columns or zeros.
+    """
+    if 'STOCKS' in df.columns:
+        return df['STOCKS']
+    for col in ALTERNATIVE_STOCK_COLUMNS:
+        if col in df.columns:
+            return df[col]
+    return pd.Series(0.0, index=df.index)
+
+def format_networth_range(q_index, min_val, max_val):
+    """
+    Format the net worth range string for a wealth quintile.
+    """
+    if q_index == 1:
+        range_str = f"Up to ${max_val:,.0f}"
+        if min_val < 0:
+            range_str = f"Negative to ${max_val:,.0f}"
+    elif q_index == 5:
+        range_str = f"${min_val:,.0f} and above"
     else:
-        return sorted_data[-1]
+        range_str = f"${min_val:,.0f} to ${max_val:,.0f}"
+    return range_str
+
+def base_transition_probability(start_quintile, end_quintile):
+    """
+    Base probability of moving between quintiles before blending with the data.
+    """
+    # Higher probability of staying in same quintile or moving slightly
+    if start_quintile == end_quintile:
+        return 0.4 + (start_quintile / 25)  # Higher stability at higher quintiles
+    elif abs(start_quintile - end_quintile) == 1:
+        return 0.2 - (abs(start_quintile - 3) / 15)
+    # Probability decreases with distance from current quintile
+    # And is lower for downward mobility from top quintiles
+    distance_factor = abs(start_quintile - end_quintile)
+    direction_factor = 1.0 if end_quintile > start_quintile else 0.7
+    quintile_factor = 0.3 if start_quintile >= 4 and end_quintile < start_quintile else 1.0
+    return max(0, (0.15 - (distance_factor * 0.06))) * direction_factor * quintile_factor
 
 def save_processed_data(data, output_file):
     """
-    Save the processed data to a JSON file.
+    Save the processed data to a JSON file (creating its directory if needed).
     """
-    with open(output_file, 'w') as f:
-        json.dump(data, f, indent=2)
+    with stage('viz3.save', output_file=output_file) as s:
+        write_json(data, output_file)
+        s.set(bytes_out=nbytes(output_file))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
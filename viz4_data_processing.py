@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+viz4_data_processing.py - Processes SWIID data for the redistribution visualization
+
+This script reads the Standardized World Income Inequality Database summary
+(swiid9_8_summary.csv) and measures how much taxes and transfers reduce
+inequality in each country: the absolute redistribution (market Gini minus
+disposable Gini) and the relative redistribution (as a percentage of the
+market Gini). It replaces the analysis in viz-4_hypothesis.ipynb.
+
+Outputs:
+- data/redistribution_data.json: per-country mean redistribution, the records
+  used by viz4.js
+- data/viz4_data.json: cross-country means per year, each country's yearly
+  and rolling-window redistribution series, and panel regressions of the
+  disposable Gini on the market Gini
+
+Usage:
+    python viz4_data_processing.py
+    python viz4_data_processing.py --window 10
+    python viz4_data_processing.py --draws 5000    # add Monte Carlo intervals
+"""
+
+import argparse
+import os
+
+from fiscal_data import write_json
+from instrumentation import add_trace_arguments, configure, nbytes, stage
+from lazy_imports import lazy_import
+from panel_regression import clustered_mean, country_slopes, fit_fixed_effects, fit_pooled
+from redistribution_uncertainty import DEFAULT_CHUNK_SIZE, TOP_N, UNCERTAINTY_COLUMNS, simulate_redistribution
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+# Configure paths
+INPUT_FILE = 'swiid9_8_summary.csv'
+OUTPUT_FILE = os.path.join('data', 'redistribution_data.json')
+SUMMARY_FILE = os.path.join('data', 'viz4_data.json')
+
+# Years per rolling window (a window ends at each observed year)
+ROLLING_WINDOW = 5
+
+# Dtypes for the SWIID summary columns: compact keys, full-precision values
+# so the published statistics match the CSV
+SWIID_DTYPES = {
+    'country': 'category',
+    'year': 'int16',
+    'gini_disp': 'float64',
+    'gini_disp_se': 'float64',
+    'gini_mkt': 'float64',
+    'gini_mkt_se': 'float64',
+    'abs_red': 'float64',
+    'abs_red_se': 'float64',
+    'rel_red': 'float64',
+    'rel_red_se': 'float64'
+}
+
+SWIID_COLUMNS = ['country', 'year', 'gini_disp', 'gini_mkt']
+
+MEASURES = ['redistribution_absolute', 'redistribution_relative']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Process SWIID data for Visualization 4")
+    parser.add_argument('--input', default=INPUT_FILE, help="SWIID summary CSV")
+    parser.add_argument('--output', default=OUTPUT_FILE, help="Per-country redistribution JSON for viz4.js")
+    parser.add_argument('--summary', default=SUMMARY_FILE, help="Yearly and rolling redistribution JSON")
+    parser.add_argument('--window', type=int, default=ROLLING_WINDOW, help="Rolling window in years")
+    parser.add_argument('--draws', type=int, default=0,
+                        help="Monte Carlo draws over the SWIID standard errors (0 = none)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="Draws simulated together")
+    parser.add_argument('--workers', type=int, help="Worker processes for the draws (default: CPU count)")
+    add_trace_arguments(parser)
+    args = parser.parse_args()
+    configure(args)
+
+    print(f"Processing {args.input} for Visualization 4...")
+
+    try:
+        columns = UNCERTAINTY_COLUMNS if args.draws else SWIID_COLUMNS
+        with stage('viz4.load', input_file=args.input) as s:
+            df = load_swiid(args.input, columns)
+            s.set(bytes_in=nbytes(args.input), rows_out=len(df), bytes_out=nbytes(df))
+        print(f"Successfully loaded dataset with {df.shape[0]} rows and {df['country'].cat.categories.size} countries")
+    except Exception as e:
+        print(f"Error loading data: {e}")
+        return
+
+    print("Calculating redistribution metrics...")
+    with stage('viz4.compute_redistribution_stats', rows_in=len(df)):
+        stats = compute_redistribution_stats(df, args.window)
+
+    print("Fitting panel regressions...")
+    with stage('viz4.fit_gini_models', rows_in=len(df)):
+        stats['regression'] = fit_gini_models(df)
+
+    if args.draws:
+        print(f"Simulating {args.draws} draws of country redistribution...")
+        with stage('viz4.simulate_redistribution', rows_in=len(df), draws=args.draws):
+            add_uncertainty(stats['countries'], simulate_redistribution(df, args.draws, args.chunk_size, args.workers))
+
+    with stage('viz4.save_country_records', output_file=args.output) as s:
+        save_country_records(stats['countries'], args.output)
+        s.set(bytes_out=nbytes(args.output))
+    print(f"Country redistribution saved to {args.output}")
+
+    with stage('viz4.save_summary', output_file=args.summary) as s:
+        save_summary(stats, args.window, args.summary)
+        s.set(bytes_out=nbytes(args.summary))
+    print(f"Yearly and rolling redistribution saved to {args.summary}")
+
+
+def load_swiid(path, columns=SWIID_COLUMNS):
+    """
+    Load the requested SWIID columns with compact dtypes.
+
+    Country is categorical (codes follow the sorted country names), year is
+    int16 and the Gini values are float64; the Monte Carlo engine narrows its
+    arrays to float32 itself.
+    """
+    return pd.read_csv(path, usecols=columns, dtype={col: SWIID_DTYPES[col] for col in columns})
+
+
+def redistribution(df):
+    """
+    Return the absolute and relative redistribution of each row in float64.
+    """
+    gini_mkt = df['gini_mkt'].to_numpy(dtype=np.float64)
+    gini_disp = df['gini_disp'].to_numpy(dtype=np.float64)
+    absolute = gini_mkt - gini_disp
+    with np.errstate(divide='ignore', invalid='ignore'):
+        relative = absolute / gini_mkt * 100
+    return {'redistribution_absolute': absolute, 'redistribution_relative': relative}
+
+
+def grouped_means(codes, n_groups, values):
+    """
+    Mean of each group ignoring NaNs, with one bincount per sum; NaN for empty groups.
+    """
+    valid = ~np.isnan(values)
+    sums = np.bincount(codes[valid], weights=values[valid], minlength=n_groups)
+    counts = np.bincount(codes[valid], minlength=n_groups)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+def rolling_means(codes, years, values, window):
+    """
+    Mean over the years [year - window + 1, year] of the same country, for every row.
+
+    Rows are sorted by (country, year) once; each window is the difference of
+    two cumulative sums, located with a single searchsorted over a combined
+    country/year key, so gaps in a country's years are handled exactly.
+
+    Returns:
+    - Array of rolling means in the original row order
+    """
+    span = int(years.max()) - int(years.min()) + window + 1
+    keys = codes.astype(np.int64) * span + (years.astype(np.int64) - int(years.min()) + window)
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    sorted_values = values[order]
+
+    valid = ~np.isnan(sorted_values)
+    cumulative_sums = np.concatenate(([0.0], np.cumsum(np.where(valid, sorted_values, 0))))
+    cumulative_counts = np.concatenate(([0], np.cumsum(valid)))
+
+    starts = np.searchsorted(sorted_keys, sorted_keys - (window - 1), side='left')
+    ends = np.searchsorted(sorted_keys, sorted_keys, side='right')
+    counts = cumulative_counts[ends] - cumulative_counts[starts]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        means = np.where(counts > 0, (cumulative_sums[ends] - cumulative_sums[starts]) / counts, np.nan)
+
+    result = np.empty_like(means)
+    result[order] = means
+    return result
+
+
+def compute_redistribution_stats(df, window=ROLLING_WINDOW):
+    """
+    Compute per-country, per-year and rolling redistribution statistics.
+
+    Returns a dictionary with:
+    - 'countries': DataFrame of mean redistribution per country (sorted by name)
+    - 'years': DataFrame of cross-country mean redistribution and country count per year
+    - 'panel': the country-year rows with their redistribution and rolling means
+    """
+    measures = redistribution(df)
+    country_codes = df['country'].cat.codes.to_numpy()
+    countries = df['country'].cat.categories
+    years = df['year'].to_numpy()
+    year_index, year_values = pd.factorize(years, sort=True)
+
+    country_stats = pd.DataFrame({'country': countries})
+    year_stats = pd.DataFrame({
+        'year': year_values.astype(int),
+        'countries': np.bincount(year_index, minlength=len(year_values))
+    })
+    panel = pd.DataFrame({'country': df['country'], 'year': years})
+
+    for name, values in measures.items():
+        country_stats[name] = grouped_means(country_codes, len(countries), values)
+        year_stats[name] = grouped_means(year_index, len(year_values), values)
+        panel[name] = values
+        panel[f'{name}_rolling'] = rolling_means(country_codes, years, values, window)
+
+    return {
+        'countries': country_stats,
+        'years': year_stats,
+        'panel': panel.sort_values(['country', 'year'], kind='stable').reset_index(drop=True)
+    }
+
+
+def add_uncertainty(country_stats, simulated):
+    """
+    Add the simulated interval and rank probabilities to the country means.
+    """
+    simulated = simulated.set_index('country').reindex(country_stats['country'])
+    country_stats['redistribution_relative_ci_low'] = simulated['ci_low'].to_numpy()
+    country_stats['redistribution_relative_ci_high'] = simulated['ci_high'].to_numpy()
+    country_stats[f'prob_top{TOP_N}'] = simulated['prob_top'].to_numpy()
+    country_stats[f'prob_bottom{TOP_N}'] = simulated['prob_bottom'].to_numpy()
+
+
+def fit_gini_models(df):
+    """
+    Regress the disposable Gini on the market Gini, respecting the panel.
+
+    Returns a dictionary with:
+    - 'pooled': OLS with standard errors clustered by country
+    - 'fixedEffects': country and year fixed effects, clustered by country
+    - 'meanRedistribution': mean market-minus-disposable Gini with a
+      country-clustered standard error
+    - 'countrySlopes': within-country slope of each country
+    """
+    country_codes = df['country'].cat.codes.to_numpy()
+    year_codes = pd.factorize(df['year'])[0]
+    gini_disp = df['gini_disp'].to_numpy(dtype=np.float64)
+    gini_mkt = df['gini_mkt'].to_numpy(dtype=np.float64)
+
+    pooled = fit_pooled(gini_disp, gini_mkt, country_codes)
+    fixed = fit_fixed_effects(gini_disp, gini_mkt, [country_codes, year_codes], country_codes)
+    mean, se, t_stat = clustered_mean(gini_mkt - gini_disp, country_codes)
+    countries = df['country'].cat.categories
+    slopes = country_slopes(gini_disp, gini_mkt, country_codes, len(countries))
+
+    return {
+        'pooled': {
+            'intercept': float(pooled['coefficients'][0]),
+            'slope': float(pooled['coefficients'][1]),
+            'interceptSE': float(pooled['standard_errors'][0]),
+            'slopeSE': float(pooled['standard_errors'][1]),
+            'rows': pooled['rows'],
+            'clusters': pooled['clusters']
+        },
+        'fixedEffects': {
+            'slope': float(fixed['coefficients'][0]),
+            'slopeSE': float(fixed['standard_errors'][0]),
+            'r2Within': float(fixed['r2_within']),
+            'rows': fixed['rows'],
+            'clusters': fixed['clusters']
+        },
+        'meanRedistribution': {'mean': float(mean), 'se': float(se), 't': float(t_stat)},
+        'countrySlopes': {
+            country: {
+                'slope': None if np.isnan(slopes['slope'][code]) else round(float(slopes['slope'][code]), 4),
+                'se': None if np.isnan(slopes['standard_error'][code]) else round(float(slopes['standard_error'][code]), 4),
+                'rows': int(slopes['rows'][code])
+            }
+            for code, country in enumerate(countries)
+        }
+    }
+
+
+def save_country_records(country_stats, output_file):
+    """
+    Save the per-country means (and any uncertainty columns) as JSON records,
+    the format viz4.js reads.
+    """
+    country_stats.to_json(output_file, orient='records')
+
+
+def save_summary(stats, window, output_file):
+    """
+    Save the yearly means and per-country series as compact columnar JSON.
+    """
+    def column(values):
+        return [None if np.isnan(value) else round(float(value), 4) for value in values]
+
+    year_stats = stats['years']
+    summary = {
+        'rollingWindow': window,
+        'yearly': {
+            'year': year_stats['year'].tolist(),
+            'countries': year_stats['countries'].tolist(),
+            **{name: column(year_stats[name]) for name in MEASURES}
+        },
+        'countries': {},
+        'regression': stats.get('regression')
+    }
+
+    panel = stats['panel']
+    codes = panel['country'].cat.codes.to_numpy()
+    bounds = np.searchsorted(codes, np.arange(len(panel['country'].cat.categories) + 1))
+    for code, country in enumerate(panel['country'].cat.categories):
+        rows = panel.iloc[bounds[code]:bounds[code + 1]]
+        if rows.empty:
+            continue
+        summary['countries'][country] = {
+            'year': rows['year'].astype(int).tolist(),
+            **{name: column(rows[name]) for name in MEASURES},
+            **{f'{name}_rolling': column(rows[f'{name}_rolling']) for name in MEASURES}
+        }
+
+    write_json(summary, output_file, compact=True)
+
+
+if __name__ == "__main__":
+    main()
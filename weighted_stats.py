@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+weighted_stats.py - Weighted statistics helpers for the SCF data processors
+
+Contains the grouped aggregation kernel shared by the viz3 calculators, a
+grouped weighted-quantile routine that sorts once for every group and
+quantile, weighted cross-tabs and Markov transition matrices at any
+resolution, and a mergeable, fixed-memory quantile sketch used to summarise
+SCF data that is read in chunks and never held in memory at once.
+
+Usage:
+    from weighted_stats import group_stats, grouped_weighted_quantiles, LogHistogramSketch
+    stats = group_stats(df, 'WEALTHQUINTILE', aggregations={'NETWORTH': ['min', 'max', 'median']})
+    p10_to_p90 = grouped_weighted_quantiles(df['WEALTHQUINTILE'], df['NETWORTH'], df['WGT'])
+    matrix = transition_matrix(cross_counts(wealth_codes, income_codes, 12, df['WGT']))
+
+    sketch = LogHistogramSketch(n_groups=5)
+    sketch.update(groups, values, weights)
+    p10_to_p90 = sketch.quantiles()
+"""
+
+from lazy_imports import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+# Quantiles published for every weighted distribution
+DISTRIBUTION_QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+
+
+def quantile_label(q):
+    """
+    Return the column/JSON label of a quantile, e.g. 0.25 -> 'p25'.
+    """
+    return f"p{round(q * 100):g}"
+
+
+def group_stats(df, key, n_groups=5, aggregations=None, weighted_quantiles=None,
+                quantiles=DISTRIBUTION_QUANTILES):
+    """
+    Compute per-group statistics for several columns in one grouped pass.
+
+    Parameters:
+    - df: DataFrame with an integer group column coded 1..n_groups
+    - key: Name of the group column
+    - n_groups: Number of groups; groups without rows get 0 rows and NaN stats
+    - aggregations: Dictionary of column -> list of pandas aggregation names
+      ('count', 'sum', 'mean', 'min', 'max', 'median', ...)
+    - weighted_quantiles: Dictionary of value column -> weight column
+    - quantiles: Quantiles computed for each weighted column
+
+    Returns:
+    - DataFrame indexed by group code with a 'rows' column, one
+      '<column>_<aggregation>' column per requested statistic and one
+      '<column>_p<NN>' column per weighted quantile
+    """
+    index = pd.RangeIndex(1, n_groups + 1, name=key)
+    grouped = df.groupby(key, sort=True)
+    result = grouped.size().reindex(index, fill_value=0).to_frame('rows')
+
+    if aggregations:
+        agg = grouped.agg(aggregations)
+        agg.columns = [f"{col}_{how}" for col, how in agg.columns]
+        result = result.join(agg.reindex(index))
+
+    for col, weight_col in (weighted_quantiles or {}).items():
+        values = grouped_weighted_quantiles(df[key], df[col], df[weight_col], quantiles, n_groups)
+        for q, column in zip(quantiles, values.T):
+            result[f"{col}_{quantile_label(q)}"] = column
+
+    return result
+
+
+def grouped_weighted_quantiles(keys, values, weights, quantiles=DISTRIBUTION_QUANTILES, n_groups=5):
+    """
+    Weighted quantiles of every group from a single sort.
+
+    Rows are sorted once by (group, value). The q-quantile of a group is the
+    first value whose cumulative weight within the group reaches q times the
+    group's total weight, so q=0.5 gives the usual weighted median. All groups
+    and quantiles are answered by one searchsorted call. Rows with a missing
+    key, value or weight are ignored.
+
+    Parameters:
+    - keys: Group code of each row, 1..n_groups
+    - values: Data values
+    - weights: Non-negative weights
+    - quantiles: Quantiles to compute, between 0 and 1
+    - n_groups: Number of groups
+
+    Returns:
+    - (n_groups x len(quantiles)) array, NaN for empty groups
+    """
+    keys = np.asarray(keys, dtype=float)
+    values = np.asarray(values, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    valid = ~(np.isnan(keys) | np.isnan(values) | np.isnan(weights))
+    keys, values, weights = keys[valid], values[valid], weights[valid]
+
+    # Sort by group, then by value within each group
+    order = np.lexsort((values, keys))
+    keys, values = keys[order], values[order]
+    cumsum_weights = np.cumsum(weights[order])
+
+    # Row range of each group and cumulative weight at its boundaries
+    bounds = np.searchsorted(keys, np.arange(1, n_groups + 2))
+    starts, ends = bounds[:-1], bounds[1:]
+    boundary_weights = np.concatenate(([0.0], cumsum_weights))
+    before, after = boundary_weights[starts], boundary_weights[ends]
+
+    # Cumulative weights are non-decreasing, so one search finds every quantile
+    targets = before[:, None] + np.asarray(quantiles)[None, :] * (after - before)[:, None]
+    idx = np.searchsorted(cumsum_weights, targets)
+    idx = np.clip(idx, starts[:, None], np.maximum(ends - 1, starts)[:, None])
+
+    result = np.full(targets.shape, np.nan)
+    non_empty = ends > starts
+    result[non_empty] = values[idx[non_empty]]
+    return result
+
+
+def grouped_weighted_median(keys, values, weights, n_groups=5):
+    """
+    Weighted median of every group; see grouped_weighted_quantiles.
+    """
+    return grouped_weighted_quantiles(keys, values, weights, (0.5,), n_groups)[:, 0]
+
+
+def cross_counts(row_codes, col_codes, n_groups=5, weights=None):
+    """
+    Count rows per (row group, column group) pair with a single bincount.
+
+    Codes run from 1 to n_groups; rows with missing or out-of-range codes are
+    ignored. Pass weights to get weighted totals instead of row counts.
+
+    Returns:
+    - (n_groups x n_groups) array
+    """
+    rows = np.asarray(row_codes, dtype=float) - 1
+    cols = np.asarray(col_codes, dtype=float) - 1
+    valid = (rows >= 0) & (rows < n_groups) & (cols >= 0) & (cols < n_groups)
+    if weights is not None:
+        weights = np.asarray(weights, dtype=float)
+        valid &= ~np.isnan(weights)
+        weights = weights[valid]
+    flat = rows[valid].astype(np.int64) * n_groups + cols[valid].astype(np.int64)
+    return np.bincount(flat, weights=weights, minlength=n_groups * n_groups).reshape(n_groups, n_groups)
+
+
+def weighted_ntile_codes(values, weights=None, n_groups=100):
+    """
+    Assign each value to one of n_groups weighted quantile groups.
+
+    A value's group is given by the share of the total weight held by smaller
+    values, so tied values always share a group. Needs a single sort.
+
+    Returns:
+    - Integer array of group codes 1..n_groups, 0 for missing values or weights
+    """
+    values = np.asarray(values, dtype=float)
+    weights = np.ones(len(values)) if weights is None else np.asarray(weights, dtype=float)
+    valid = np.flatnonzero(~(np.isnan(values) | np.isnan(weights)))
+
+    order = valid[np.argsort(values[valid], kind='stable')]
+    sorted_values = values[order]
+    sorted_weights = weights[order]
+    weight_below = np.cumsum(sorted_weights) - sorted_weights
+    # Tied values take the weight below their first occurrence
+    weight_below = weight_below[np.searchsorted(sorted_values, sorted_values, side='left')]
+
+    total = sorted_weights.sum()
+    codes = np.zeros(len(values), dtype=np.int64)
+    if total > 0:
+        codes[order] = np.minimum((weight_below / total * n_groups).astype(np.int64), n_groups - 1) + 1
+    return codes
+
+
+def transition_matrix(counts):
+    """
+    Normalise a cross-tab into a row-stochastic transition matrix.
+
+    Rows without any weight are left as zeros.
+    """
+    counts = np.asarray(counts, dtype=float)
+    row_totals = counts.sum(axis=1, keepdims=True)
+    return np.divide(counts, row_totals, out=np.zeros_like(counts), where=row_totals > 0)
+
+
+def markov_powers(matrix, steps):
+    """
+    Return {k: matrix ** k} for every number of steps k, using repeated squaring.
+    """
+    return {k: np.linalg.matrix_power(matrix, k) for k in steps}
+
+
+class LogHistogramSketch:
+    """
+    Grouped, weighted histogram on a symmetric log scale.
+
+    Values are bucketed by sign(x) * log10(1 + |x|) with `resolution` buckets
+    per decade, so a quantile is off by at most about
+    ln(10) * (1 + |x|) / (2 * resolution): roughly 0.1% for dollar amounts and
+    0.001-0.002 in absolute terms for ratios near zero. Zero is a bucket centre
+    and is returned exactly. Memory is fixed by the number of
+    groups and buckets, not by the number of values seen, and two sketches
+    with the same shape can be merged by adding their counts.
+    """
+
+    def __init__(self, n_groups, resolution=1000, max_decades=13):
+        self.n_groups = n_groups
+        self.resolution = resolution
+        self.offset = resolution * max_decades
+        self.counts = np.zeros((n_groups, 2 * self.offset + 1))
+
+    def update(self, groups, values, weights=None):
+        """
+        Add values to the sketch.
+
+        Parameters:
+        - groups: Zero-based group index of each value; values whose group is
+          outside [0, n_groups) are ignored
+        - values: Data values; NaNs are ignored
+        - weights: Optional weight of each value (default 1)
+        """
+        groups = np.asarray(groups)
+        values = np.asarray(values, dtype=float)
+        keep = (groups >= 0) & (groups < self.n_groups) & ~np.isnan(values)
+        if weights is not None:
+            weights = np.asarray(weights, dtype=float)[keep]
+
+        scaled = np.sign(values[keep]) * np.log10(1 + np.abs(values[keep]))
+        buckets = np.clip(np.rint(scaled * self.resolution).astype(np.int64) + self.offset,
+                          0, self.counts.shape[1] - 1)
+        flat = groups[keep].astype(np.int64) * self.counts.shape[1] + buckets
+        self.counts += np.bincount(flat, weights=weights, minlength=self.counts.size).reshape(self.counts.shape)
+
+    def merge(self, other):
+        """
+        Add the counts of another sketch with the same shape.
+        """
+        self.counts += other.counts
+        return self
+
+    def total(self):
+        """
+        Return the total weight seen for each group.
+        """
+        return self.counts.sum(axis=1)
+
+    def quantiles(self, quantiles=DISTRIBUTION_QUANTILES):
+        """
+        Return the weighted quantiles of each group (NaN for empty groups).
+
+        Uses the same rule as grouped_weighted_quantiles: the first bucket whose
+        cumulative weight reaches q times the group's total weight.
+
+        Returns:
+        - (n_groups x len(quantiles)) array
+        """
+        cumulative = np.cumsum(self.counts, axis=1)
+        totals = cumulative[:, -1]
+        targets = np.asarray(quantiles)[None, :] * totals[:, None]
+        buckets = np.minimum((cumulative[:, :, None] < targets[:, None, :]).sum(axis=1),
+                             self.counts.shape[1] - 1)
+        scaled = (buckets - self.offset) / self.resolution
+        result = np.sign(scaled) * (10 ** np.abs(scaled) - 1)
+        result[totals <= 0] = np.nan
+        return result
+
+    def quantile(self, q):
+        """
+        Return the weighted q-quantile of each group (NaN for empty groups).
+        """
+        return self.quantiles((q,))[:, 0]